@@ -14,7 +14,8 @@ def run():
         lower_freq=config.sdr_lower_freq,
         upper_freq=config.sdr_upper_freq,
         bin_size=config.sdr_bin_size,
-        integration_interval_seconds=config.sdr_integration_interval
+        integration_interval_seconds=config.sdr_integration_interval,
+        storage=config.sdr_storage
     )
 
     if config.sdr_integration_interval is not None:
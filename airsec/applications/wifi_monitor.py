@@ -1,4 +1,5 @@
 from .. import (
+    pipeline,
     wifi_scanner,
     db,
     iface_utils
@@ -11,10 +12,41 @@ def run():
     if not config:
         raise RuntimeError("Config file not found.")
 
+    iface_utils.set_backend(config.wifi_iface_backend)
     iface_utils.wifi_set_monitor_mode(config.wlan_iface_name)
     db.init(config)
     db.setup_database()
-    wifi_scanner.sniff_access_points(config.wlan_iface_name)
+
+    scanner_config = wifi_scanner.WifiScannerConfig(
+        iface=config.wlan_iface_name,
+        capture_backend=config.wifi_capture_backend,
+        capture_subtypes=wifi_scanner.parse_subtypes(config.wifi_capture_subtypes),
+        ring_block_size=config.wifi_ring_block_size,
+        ring_block_count=config.wifi_ring_block_count,
+        ring_block_timeout_ms=config.wifi_ring_block_timeout_ms,
+        hop_scheduler=config.wifi_hop_scheduler,
+        channels=tuple(config.wifi_channels),
+        hop_min_dwell_ms=config.wifi_hop_min_dwell_ms,
+        hop_max_dwell_ms=config.wifi_hop_max_dwell_ms,
+        hop_max_revisit_ms=config.wifi_hop_max_revisit_ms,
+        batch_size=config.wifi_batch_size,
+        flush_interval_ms=config.wifi_flush_interval_ms,
+        queue_size=config.wifi_queue_size,
+        evil_twin_cooldown_ms=config.wifi_evil_twin_cooldown_ms,
+        allow_list_reload_ms=config.wifi_allow_list_reload_ms
+    )
+
+    if scanner_config.capture_backend == wifi_scanner.CAPTURE_BACKEND_SCAPY:
+        wifi_scanner.sniff_access_points(scanner_config)
+        return
+
+    # The write stage opens its own connection.
+    db.DATABASE.close()
+    pipeline_config = pipeline.PipelineConfig(
+        parse_workers=config.wifi_parse_workers,
+        queue_size=config.wifi_pipeline_queue_size
+    )
+    pipeline.run(scanner_config, config, pipeline_config)
 
 if __name__ == "__main__":
     run()
@@ -0,0 +1,396 @@
+"""
+    Capture backends that read raw frames from a monitor mode interface
+    without going through scapy.
+
+    Backends yield `(timestamp, frame)` tuples where the timestamp is in
+    seconds since the epoch and the frame is a memoryview that is only
+    valid until the next frame is requested. Callers that need to keep the
+    frame around must copy it (e.g. `bytes(frame)`).
+
+    Linux only: these use AF_PACKET sockets and require CAP_NET_RAW.
+"""
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+import ctypes
+import mmap
+import select
+import socket
+import struct
+import time
+
+ETH_P_ALL = 0x0003
+
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+SO_ATTACH_FILTER = 26
+
+# Large enough for any 802.11 frame plus radiotap header.
+DEFAULT_SNAPLEN = 8192
+
+# How often (seconds) a blocked capture wakes up to check if it was stopped.
+POLL_TIMEOUT = 0.5
+
+Frame = Tuple[float, memoryview]
+
+################################
+# Classic BPF program generation
+################################
+
+# Instruction classes, sizes, modes and operations from linux/filter.h
+BPF_LD = 0x00
+BPF_ALU = 0x04
+BPF_JMP = 0x05
+BPF_RET = 0x06
+BPF_MISC = 0x07
+BPF_W = 0x00
+BPF_B = 0x10
+BPF_IMM = 0x00
+BPF_ABS = 0x20
+BPF_IND = 0x40
+BPF_OR = 0x40
+BPF_AND = 0x50
+BPF_LSH = 0x60
+BPF_RSH = 0x70
+BPF_JEQ = 0x10
+BPF_JSET = 0x40
+BPF_K = 0x00
+BPF_X = 0x08
+BPF_TAX = 0x00
+
+# (code, jt, jf, k)
+BPFInstruction = Tuple[int, int, int, int]
+
+
+def compile_management_filter(subtypes: Iterable[int], snaplen: int = DEFAULT_SNAPLEN) -> List[BPFInstruction]:
+    """
+        Build a classic BPF program for RadioTap encapsulated 802.11 frames
+        that accepts management frames whose subtype is in `subtypes` and
+        drops everything else in the kernel.
+
+        The radiotap header length is little endian so it is assembled from
+        two byte loads and used as the index register to reach the 802.11
+        frame control field.
+    """
+    mask = 0
+    for subtype in subtypes:
+        if not 0 <= subtype < 16:
+            raise ValueError("Invalid management frame subtype: %s" % subtype)
+        mask |= 1 << subtype
+
+    reject = 16
+    program = [
+        (BPF_LD | BPF_B | BPF_ABS, 0, 0, 3),        # A = radiotap length high byte
+        (BPF_ALU | BPF_LSH | BPF_K, 0, 0, 8),       # A <<= 8
+        (BPF_MISC | BPF_TAX, 0, 0, 0),              # X = A
+        (BPF_LD | BPF_B | BPF_ABS, 0, 0, 2),        # A = radiotap length low byte
+        (BPF_ALU | BPF_OR | BPF_X, 0, 0, 0),        # A |= X
+        (BPF_MISC | BPF_TAX, 0, 0, 0),              # X = radiotap length
+        (BPF_LD | BPF_B | BPF_IND, 0, 0, 0),        # A = frame control byte 0
+        (BPF_ALU | BPF_AND | BPF_K, 0, 0, 0x0f),    # A &= type | version
+        (BPF_JMP | BPF_JEQ | BPF_K, 0, reject - 9, 0),  # management, version 0?
+        (BPF_LD | BPF_B | BPF_IND, 0, 0, 0),        # A = frame control byte 0
+        (BPF_ALU | BPF_RSH | BPF_K, 0, 0, 4),       # A = subtype
+        (BPF_MISC | BPF_TAX, 0, 0, 0),              # X = subtype
+        (BPF_LD | BPF_W | BPF_IMM, 0, 0, 1),        # A = 1
+        (BPF_ALU | BPF_LSH | BPF_X, 0, 0, 0),       # A = 1 << subtype
+        (BPF_JMP | BPF_JSET | BPF_K, 0, 1, mask),   # subtype wanted?
+        (BPF_RET | BPF_K, 0, 0, snaplen),           # accept
+        (BPF_RET | BPF_K, 0, 0, 0),                 # reject
+    ]
+    assert len(program) == reject + 1
+    return program
+
+
+def run_filter(program: List[BPFInstruction], frame: bytes) -> int:
+    """
+        Minimal interpreter for the instructions used by
+        `compile_management_filter`, useful for checking a program without
+        a capture socket. Returns the number of bytes the kernel would keep.
+    """
+    a = x = 0
+    pc = 0
+    while True:
+        code, jt, jf, k = program[pc]
+        pc += 1
+        cls = code & 0x07
+        if cls == BPF_LD:
+            mode = code & 0xe0
+            if mode == BPF_IMM:
+                a = k
+            else:
+                index = k + (x if mode == BPF_IND else 0)
+                if index >= len(frame):
+                    return 0
+                a = frame[index]
+        elif cls == BPF_ALU:
+            operand = x if code & BPF_X else k
+            op = code & 0xf0
+            if op == BPF_OR:
+                a |= operand
+            elif op == BPF_AND:
+                a &= operand
+            elif op == BPF_LSH:
+                a = (a << operand) & 0xffffffff
+            elif op == BPF_RSH:
+                a >>= operand
+        elif cls == BPF_MISC:
+            x = a
+        elif cls == BPF_JMP:
+            op = code & 0xf0
+            taken = (a == k) if op == BPF_JEQ else bool(a & k)
+            pc += jt if taken else jf
+        elif cls == BPF_RET:
+            return k
+        else:
+            raise ValueError("Unsupported BPF instruction: %#x" % code)
+
+
+@dataclass
+class CaptureStats:
+    """
+        Frame counters for a capture socket.
+
+        `interface_packets` comes from the interface's rx counter and
+        includes frames rejected by the BPF filter, so `filtered` is an
+        estimate of the frames the filter rejected before they reached the
+        socket.
+    """
+    delivered: int = 0
+    # Frames that passed the filter, including the ones dropped because
+    # the socket buffer or ring was full (`kernel_drops`).
+    kernel_packets: int = 0
+    kernel_drops: int = 0
+    # Number of times a TPACKET_V3 ring ran out of free blocks.
+    kernel_freezes: int = 0
+    interface_packets: int = 0
+
+    @property
+    def filtered(self) -> int:
+        return max(0, self.interface_packets - self.kernel_packets)
+
+
+def read_interface_rx_packets(iface: str) -> int:
+    try:
+        with open(f"/sys/class/net/{iface}/statistics/rx_packets") as file_:
+            return int(file_.read())
+    except (OSError, ValueError):
+        return 0
+
+
+class RawSocketCapture:
+    """
+        Capture frames with a plain AF_PACKET socket, one `recv_into` per
+        frame into a reused buffer.
+    """
+
+    def __init__(self,
+                 iface: str,
+                 snaplen: int = DEFAULT_SNAPLEN,
+                 bpf_filter: Optional[List[BPFInstruction]] = None):
+        self.iface = iface
+        self.snaplen = snaplen
+        self.bpf_filter = bpf_filter
+        self.sock: Optional[socket.socket] = None
+        self.stats = CaptureStats()
+        self._buffer = bytearray(snaplen)
+        self._stopped = False
+        self._rx_packets_at_open = 0
+
+    def open(self):
+        if self.sock is not None:
+            return
+
+        # The socket is created without a protocol so it does not receive
+        # anything until it is bound, which happens after the filter is in
+        # place.
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+        try:
+            if self.bpf_filter:
+                attach_filter(sock, self.bpf_filter)
+            self._configure(sock)
+            sock.bind((self.iface, ETH_P_ALL))
+        except OSError:
+            sock.close()
+            raise
+        sock.settimeout(POLL_TIMEOUT)
+        self.sock = sock
+        self.stats = CaptureStats()
+        self._rx_packets_at_open = read_interface_rx_packets(self.iface)
+        self._stopped = False
+
+    def _configure(self, sock: socket.socket):
+        """Hook for subclasses to set socket options before binding."""
+
+    def _read_kernel_stats(self) -> Tuple[int, int, int]:
+        # struct tpacket_stats
+        data = self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 8)
+        packets, drops = struct.unpack("II", data)
+        return packets, drops, 0
+
+    def update_stats(self) -> CaptureStats:
+        """Refresh the kernel and interface counters in `stats`."""
+        if self.sock is not None:
+            # The kernel resets its counters on every read.
+            packets, drops, freezes = self._read_kernel_stats()
+            self.stats.kernel_packets += packets
+            self.stats.kernel_drops += drops
+            self.stats.kernel_freezes += freezes
+
+        self.stats.interface_packets = read_interface_rx_packets(self.iface) - self._rx_packets_at_open
+        return self.stats
+
+    def stop(self):
+        """Make `frames` return. Safe to call from another thread."""
+        self._stopped = True
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def frames(self) -> Iterator[Frame]:
+        if self.sock is None:
+            raise RuntimeError("Capture socket is not open.")
+
+        view = memoryview(self._buffer)
+        recv_into = self.sock.recv_into
+        stats = self.stats
+        while not self._stopped:
+            try:
+                size = recv_into(view)
+            except socket.timeout:
+                continue
+            stats.delivered += 1
+            yield time.time(), view[:size]
+
+
+class RingCapture(RawSocketCapture):
+    """
+        Capture frames from a PACKET_RX_RING using TPACKET_V3.
+
+        The kernel fills fixed size blocks of a ring shared with this process
+        through mmap and hands over a whole block at a time, either when it
+        is full or after `block_timeout_ms`. Frames are yielded as
+        memoryviews into the ring, so there is no syscall or copy per frame.
+        A block is returned to the kernel once every frame in it has been
+        yielded, so frames must not be used after requesting the next one.
+
+        Args:
+            block_size
+                Size of each ring block in bytes, a multiple of the page size.
+            block_count
+                Number of blocks in the ring.
+            block_timeout_ms
+                How long the kernel waits before handing over a partially
+                filled block.
+    """
+
+    # Only used by the kernel to validate the ring layout with TPACKET_V3.
+    FRAME_SIZE = 2048
+
+    def __init__(self,
+                 iface: str,
+                 block_size: int = 1 << 18,
+                 block_count: int = 16,
+                 block_timeout_ms: int = 100,
+                 snaplen: int = DEFAULT_SNAPLEN,
+                 bpf_filter: Optional[List[BPFInstruction]] = None):
+        super().__init__(iface, snaplen=snaplen, bpf_filter=bpf_filter)
+        if block_size % mmap.PAGESIZE:
+            raise ValueError("Ring block size must be a multiple of %d" % mmap.PAGESIZE)
+
+        self.block_size = block_size
+        self.block_count = block_count
+        self.block_timeout_ms = block_timeout_ms
+        self.ring: Optional[mmap.mmap] = None
+
+    def _configure(self, sock: socket.socket):
+        sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        # struct tpacket_req3
+        req = struct.pack("IIIIIII",
+                          self.block_size,
+                          self.block_count,
+                          self.FRAME_SIZE,
+                          self.block_size * self.block_count // self.FRAME_SIZE,
+                          self.block_timeout_ms,
+                          0,  # sizeof_priv
+                          0)  # feature_req_word
+        sock.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+        self.ring = mmap.mmap(sock.fileno(),
+                              self.block_size * self.block_count,
+                              mmap.MAP_SHARED,
+                              mmap.PROT_READ | mmap.PROT_WRITE)
+
+    def _read_kernel_stats(self) -> Tuple[int, int, int]:
+        # struct tpacket_stats_v3
+        data = self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 12)
+        return struct.unpack("III", data)
+
+    def close(self):
+        if self.ring is not None:
+            try:
+                self.ring.close()
+            except BufferError:
+                # A caller still holds a view into the ring; the mapping is
+                # released when that view is garbage collected.
+                pass
+            self.ring = None
+        super().close()
+
+    def frames(self) -> Iterator[Frame]:
+        if self.sock is None or self.ring is None:
+            raise RuntimeError("Capture socket is not open.")
+
+        ring = self.ring
+        view = memoryview(ring)
+        unpack_from = struct.unpack_from
+        stats = self.stats
+        poller = select.poll()
+        poller.register(self.sock, select.POLLIN | select.POLLERR)
+        timeout = int(POLL_TIMEOUT * 1000)
+
+        block = 0
+        try:
+            while not self._stopped:
+                base = block * self.block_size
+                # struct tpacket_block_desc: version, offset_to_priv, then
+                # tpacket_hdr_v1: block_status, num_pkts, offset_to_first_pkt
+                status, num_pkts, offset = unpack_from("III", ring, base + 8)
+                if not status & TP_STATUS_USER:
+                    poller.poll(timeout)
+                    continue
+
+                offset += base
+                for _ in range(num_pkts):
+                    # struct tpacket3_hdr
+                    next_offset, sec, nsec, snaplen, _len, _status, mac = unpack_from("IIIIIIH", ring, offset)
+                    start = offset + mac
+                    stats.delivered += 1
+                    yield sec + nsec * 1e-9, view[start:start + snaplen]
+                    offset += next_offset
+
+                struct.pack_into("I", ring, base + 8, TP_STATUS_KERNEL)
+                block = (block + 1) % self.block_count
+        finally:
+            view.release()
+
+
+def attach_filter(sock: socket.socket, program: List[BPFInstruction]):
+    """Attach a classic BPF program to a socket with SO_ATTACH_FILTER."""
+    instructions = b"".join(struct.pack("HBBI", *ins) for ins in program)
+    buf = ctypes.create_string_buffer(instructions, len(instructions))
+    # struct sock_fprog { unsigned short len; struct sock_filter *filter; }
+    fprog = struct.pack("HP", len(program), ctypes.addressof(buf))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
@@ -0,0 +1,259 @@
+"""
+    Channel hop schedulers for the Wi-Fi monitor.
+
+    A scheduler decides which channel the monitor interface is tuned to
+    next and for how long. Capture code reports every beacon it sees with
+    `observe`, tagged with the channel the radio was tuned to when the
+    frame was captured, so adaptive schedulers can spend more airtime
+    where access points are.
+"""
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence, Tuple
+import math
+import threading
+import time
+
+DEFAULT_CHANNELS = tuple(range(1, 12))
+
+
+class HopScheduler:
+    """
+        Base class for schedulers. Subclasses implement `_choose`.
+        All methods are safe to call from multiple threads.
+    """
+
+    def __init__(self, channels: Sequence[int]):
+        if not channels:
+            raise ValueError("At least one channel is required")
+
+        self.channels = tuple(channels)
+        self.current: Optional[int] = None
+        self.previous: Optional[int] = None
+        self.switched_at = 0.0
+        self.switched_at_wallclock = 0.0
+        self._lock = threading.Lock()
+
+    def next_hop(self, now: Optional[float] = None) -> Tuple[int, float]:
+        """Returns: The next channel to tune to and the dwell time in seconds."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return self._choose(now)
+
+    def tuned(self, channel: int, now: Optional[float] = None):
+        """Record that the radio has been switched to `channel`."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.previous = self.current
+            self.current = channel
+            self.switched_at = now
+            self.switched_at_wallclock = time.time()
+
+    def channel_at(self, timestamp: float) -> Optional[int]:
+        """
+            Channel the radio was tuned to at `timestamp` (seconds since the
+            epoch), for frames that are processed after the next hop.
+        """
+        if timestamp < self.switched_at_wallclock:
+            return self.previous
+        return self.current
+
+    def observe(self, channel: int, bssid: str):
+        """Record a beacon from `bssid` captured while tuned to `channel`."""
+
+    def remove_channel(self, channel: int):
+        """Stop visiting a channel, e.g. because the radio refused to tune to it."""
+        with self._lock:
+            if len(self.channels) > 1:
+                self.channels = tuple(c for c in self.channels if c != channel)
+
+    def _choose(self, now: float) -> Tuple[int, float]:
+        raise NotImplementedError
+
+
+class RoundRobinScheduler(HopScheduler):
+    """Visit every channel in order with the same dwell time."""
+
+    def __init__(self, channels: Sequence[int] = DEFAULT_CHANNELS, dwell: float = 1.0):
+        super().__init__(channels)
+        self.dwell = dwell
+
+    def _choose(self, now: float) -> Tuple[int, float]:
+        if self.current not in self.channels:
+            return self.channels[0], self.dwell
+
+        index = self.channels.index(self.current)
+        return self.channels[(index + 1) % len(self.channels)], self.dwell
+
+
+@dataclass
+class ChannelActivity:
+    last_visit: float = -math.inf
+    # Novelty weighted beacons and dwell time accumulated since the rate
+    # was last updated.
+    weight: float = 0.0
+    dwell: float = 0.0
+    # Smoothed novelty weighted beacons per second of dwell.
+    rate: float = 0.0
+
+
+class AdaptiveScheduler(HopScheduler):
+    """
+        Spend more time on channels where beacons, especially from rarely
+        seen BSSIDs, are being captured.
+
+        A beacon from a BSSID that has been seen n times before counts as
+        1 / sqrt(n + 1), so a channel full of well known access points
+        gradually loses priority against channels that keep producing new
+        ones. The next channel is the one with the highest smoothed rate
+        multiplied by the time since it was last visited, and its dwell time
+        scales with its rate between `min_dwell` and `max_dwell`. Any channel
+        that has not been visited for `max_revisit` seconds is visited next
+        regardless of activity.
+
+        Args:
+            channels
+                Channels to schedule.
+            min_dwell, max_dwell
+                Bounds for the time spent on a channel (seconds).
+            max_revisit
+                Longest a channel may go unvisited (seconds).
+            smoothing
+                Weight of the newest measurement in the rate moving average.
+            bssid_half_life
+                Seconds after which BSSID sighting counts are halved so that
+                access points that disappear become interesting again.
+    """
+
+    def __init__(self,
+                 channels: Sequence[int] = DEFAULT_CHANNELS,
+                 min_dwell: float = 0.2,
+                 max_dwell: float = 2.0,
+                 max_revisit: float = 15.0,
+                 smoothing: float = 0.3,
+                 bssid_half_life: float = 600.0):
+        super().__init__(channels)
+        if min_dwell > max_dwell:
+            raise ValueError("min_dwell must not exceed max_dwell")
+
+        self.min_dwell = min_dwell
+        self.max_dwell = max_dwell
+        self.max_revisit = max_revisit
+        self.smoothing = smoothing
+        self.bssid_half_life = bssid_half_life
+        self.activity: Dict[int, ChannelActivity] = {c: ChannelActivity() for c in self.channels}
+        self.sightings: Counter = Counter()
+        self._last_decay = time.monotonic()
+
+    def observe(self, channel: int, bssid: str):
+        with self._lock:
+            activity = self.activity.get(channel)
+            if activity is None:
+                return
+
+            seen = self.sightings[bssid]
+            self.sightings[bssid] = seen + 1
+            activity.weight += 1 / math.sqrt(seen + 1)
+
+    def _decay_sightings(self, now: float):
+        if now - self._last_decay < self.bssid_half_life:
+            return
+
+        self._last_decay = now
+        self.sightings = Counter({b: n // 2 for b, n in self.sightings.items() if n > 1})
+
+    def _choose(self, now: float) -> Tuple[int, float]:
+        if self.current in self.activity:
+            current = self.activity[self.current]
+            current.dwell += now - self.switched_at
+            current.last_visit = now
+
+        # Fold everything observed since the last hop into the smoothed
+        # rates. Observations may arrive after the hop they belong to, which
+        # is why they are accumulated per channel rather than per dwell.
+        for activity in self.activity.values():
+            if activity.dwell > 0:
+                measured = activity.weight / activity.dwell
+                activity.rate += self.smoothing * (measured - activity.rate)
+                activity.weight = 0.0
+                activity.dwell = 0.0
+
+        self._decay_sightings(now)
+
+        candidates = [c for c in self.channels if c != self.current] or list(self.channels)
+        overdue = [c for c in candidates if now - self.activity[c].last_visit >= self.max_revisit]
+        if overdue:
+            channel = min(overdue, key=lambda c: self.activity[c].last_visit)
+        else:
+            channel = max(candidates,
+                          key=lambda c: (self.activity[c].rate + 1e-3) * (now - self.activity[c].last_visit))
+
+        top_rate = max(a.rate for a in self.activity.values())
+        share = self.activity[channel].rate / top_rate if top_rate > 0 else 0.0
+        dwell = self.min_dwell + (self.max_dwell - self.min_dwell) * share
+        return channel, dwell
+
+    def remove_channel(self, channel: int):
+        super().remove_channel(channel)
+        with self._lock:
+            if channel not in self.channels:
+                self.activity.pop(channel, None)
+
+
+class HopFailures:
+    """
+        Failed channel switches of a hopper, so it backs off instead of
+        spinning when the radio keeps failing (e.g. the interface is down)
+        and only stops visiting a channel the radio keeps rejecting.
+
+        Args:
+            max_rejections
+                Consecutive rejections after which a channel is dropped.
+            min_delay, max_delay
+                Bounds for the wait after a failure (seconds), doubled for
+                every consecutive failure.
+    """
+
+    def __init__(self, max_rejections: int = 3, min_delay: float = 0.1, max_delay: float = 5.0):
+        self.max_rejections = max_rejections
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.consecutive = 0
+        self.rejections: Dict[int, int] = {}
+
+    def failed(self, channel: int, rejected: bool) -> Tuple[float, bool]:
+        """
+            Record a failed switch to `channel`. `rejected` means the radio
+            refused the channel itself rather than failing for another
+            reason.
+
+            Returns: Seconds to wait before the next hop, and whether to
+            stop visiting the channel.
+        """
+        self.consecutive += 1
+        remove = False
+        if rejected:
+            self.rejections[channel] = self.rejections.get(channel, 0) + 1
+            if self.rejections[channel] >= self.max_rejections:
+                del self.rejections[channel]
+                remove = True
+
+        delay = min(self.min_delay * 2 ** (self.consecutive - 1), self.max_delay)
+        return delay, remove
+
+    def succeeded(self, channel: int):
+        self.consecutive = 0
+        self.rejections.pop(channel, None)
+
+
+SCHEDULER_ROUND_ROBIN = "round_robin"
+SCHEDULER_ADAPTIVE = "adaptive"
+
+
+def create_scheduler(name: str, channels: Sequence[int], **kwargs) -> HopScheduler:
+    if name == SCHEDULER_ROUND_ROBIN:
+        return RoundRobinScheduler(channels, dwell=kwargs.get("max_dwell", 1.0))
+    if name == SCHEDULER_ADAPTIVE:
+        return AdaptiveScheduler(channels, **kwargs)
+
+    raise ValueError("Unknown hop scheduler: %s" % name)
@@ -1,7 +1,7 @@
-from typing import cast, Optional
+from typing import cast, List, Optional
 import os
 import dotenv
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import dacite
 import yaml
 from yaml import Loader
@@ -24,11 +24,60 @@ class AirsecConfig:
     timescaledb_hostname: str = "localhost"
     timescaledb_port: int = 5432
     timescaledb_test_dbname: str = ""
+    # Connections per pool (one pool for writes, one for read-only
+    # queries) and how long to wait for a free one.
+    timescaledb_pool_min_size: int = 1
+    timescaledb_pool_max_size: int = 8
+    timescaledb_pool_timeout_ms: int = 30000
+    # Rows fetched per round trip by streaming (server-side cursor) queries
+    timescaledb_itersize: int = 2000
+    # Longest a process may use its cached copy of the allow list if a
+    # change notification from the database is missed.
+    allow_list_max_staleness_ms: int = 60000
+    # How long dashboard API responses are shared between clients. Defaults
+    # to wifi_flush_interval_ms, since beacons are written at most once per
+    # flush anyway.
+    web_cache_ttl_ms: Optional[int] = None
 
     wlan_iface_name: str = ""
 
+    # How the interface is configured: "netlink" (nl80211, falls back to
+    # ip/iw if unavailable) or "subprocess" (always run ip/iw)
+    wifi_iface_backend: str = "netlink"
+    # "ring", "raw" or "scapy", see wifi_scanner.WifiScannerConfig
+    wifi_capture_backend: str = "ring"
+    # Management frame subtypes (names from wifi_scanner.ManagementPacketSubtype)
+    # the ring and raw backends let through their kernel filter.
+    wifi_capture_subtypes: List[str] = field(default_factory=lambda: ["beacon"])
+    # TPACKET_V3 ring used by the "ring" backend. The block size must be a
+    # multiple of the page size.
+    wifi_ring_block_size: int = 262144
+    wifi_ring_block_count: int = 16
+    wifi_ring_block_timeout_ms: int = 100
+    # The ring and raw backends run capture, parsing and database writes in
+    # separate processes (see airsec.pipeline).
+    wifi_parse_workers: int = 1
+    wifi_pipeline_queue_size: int = 256
+    # Channel hopping: "adaptive" or "round_robin". An empty channel list
+    # hops over every channel the phy supports.
+    wifi_hop_scheduler: str = "adaptive"
+    wifi_channels: List[int] = field(default_factory=list)
+    wifi_hop_min_dwell_ms: int = 200
+    wifi_hop_max_dwell_ms: int = 2000
+    wifi_hop_max_revisit_ms: int = 15000
+    # Beacon writer batching.
+    wifi_batch_size: int = 500
+    wifi_flush_interval_ms: int = 1000
+    wifi_queue_size: int = 10000
+    # Evil twin detection
+    wifi_evil_twin_cooldown_ms: int = 60000
+    wifi_allow_list_reload_ms: int = 60000
+
     sdr_integration_interval: Optional[int] = None
     sdr_tuner_gain: Optional[int] = None
+    # "rows" stores one rf_log row per frequency bin, "sweeps" stores one
+    # rf_sweep row per rtl_power line with the readings packed in an array.
+    sdr_storage: str = "rows"
 
 
 
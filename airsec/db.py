@@ -1,36 +1,224 @@
 import atexit
 import binascii
+import io
+import itertools
+import os
 from contextlib import contextmanager
-from datetime import datetime, timezone
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from collections import defaultdict
 import json
-from typing import Union, Tuple
+import select
+import struct
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union, Tuple
 
 import psycopg2
+import psycopg2.extras
+import psycopg2.pool
 from dateutil import tz
 
 from . import config
 from . import interfaces
+from . import logger
+
+# Timestamps are stored without a time zone, in UTC.
+UTC = tz.tzutc()
+
+class PoolTimeout(psycopg2.pool.PoolError):
+    """No connection became available within the pool timeout."""
+
+
+@dataclass
+class PoolStats:
+    acquired: int = 0
+    # Acquisitions that found no idle connection and had to wait.
+    waited: int = 0
+    timeouts: int = 0
+    opened: int = 0
+    discarded: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    @property
+    def mean_wait(self) -> float:
+        if not self.acquired:
+            return 0.0
+        return self.total_wait / self.acquired
+
+
+# Connections inherited from a parent process. They share the parent's
+# sockets so they must never be closed (or garbage collected, which closes
+# them) by the child.
+_INHERITED_CONNECTIONS = []
+
+
+class ConnectionPool:
+    """
+        Thread-safe pool of at most `max_size` connections. `acquire` blocks
+        until a connection is free (or `timeout` seconds have passed).
+
+        The pool is fork-aware: a child process never uses or closes the
+        connections it inherited and opens its own on demand.
+
+        Args:
+            readonly
+                Open autocommit, read-only sessions. Queries on them do not
+                take part in a transaction and need no commit.
+    """
+
+    def __init__(self,
+                 dsn: str,
+                 min_size: int = 1,
+                 max_size: int = 8,
+                 timeout: float = 30.0,
+                 readonly: bool = False,
+                 name: str = "pool",
+                 connect=psycopg2.connect):
+        if min_size > max_size:
+            raise ValueError("min_size must not exceed max_size")
+
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.readonly = readonly
+        self.name = name
+        self.stats = PoolStats()
+        self._connect = connect
+        self._reset()
+        for _ in range(min_size):
+            self._idle.append(self._open())
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._idle = []
+        self._all = []
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            _INHERITED_CONNECTIONS.extend(self._all)
+            self._reset()
+
+    def _open(self):
+        # Connecting can take a long time, it must not hold up other threads
+        # releasing or picking idle connections.
+        connection = self._connect(self.dsn)
+        try:
+            if self.readonly:
+                connection.set_session(readonly=True, autocommit=True)
+        except Exception:
+            connection.close()
+            raise
+
+        with self._lock:
+            self._all.append(connection)
+            self.stats.opened += 1
+        return connection
+
+    @property
+    def size(self) -> int:
+        return len(self._all)
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def acquire(self):
+        self._check_pid()
+        start = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            self.stats.waited += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                self.stats.timeouts += 1
+                raise PoolTimeout(f"{self.name}: no connection available after {self.timeout:.1f}s")
+
+        wait = time.monotonic() - start
+        stats = self.stats
+        stats.acquired += 1
+        stats.total_wait += wait
+        stats.max_wait = max(stats.max_wait, wait)
+
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        if connection is not None and not connection.closed:
+            return connection
+
+        try:
+            if connection is not None:
+                self._forget(connection)
+            return self._open()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, connection, discard: bool = False):
+        if self._pid != os.getpid():
+            # Acquired before a fork.
+            return
+
+        if discard or connection.closed:
+            self._forget(connection)
+            if not connection.closed:
+                connection.close()
+        else:
+            with self._lock:
+                self._idle.append(connection)
+        self._slots.release()
+
+    def _forget(self, connection):
+        with self._lock:
+            if connection in self._all:
+                self._all.remove(connection)
+            self.stats.discarded += 1
+
+    def close(self):
+        if self._pid != os.getpid():
+            _INHERITED_CONNECTIONS.extend(self._all)
+        else:
+            for connection in self._all:
+                connection.close()
+        self._reset()
+
 
 class DBConnection:
-    """Helper class to manage a single connection per process."""
+    """
+        Helper class to manage the database connections of a process.
+
+        Writes go through a pool of regular connections and every `cursor`
+        commits when the block exits. Queries can use `read_cursor`, served
+        by a separate pool of autocommit read-only connections.
+    """
 
     def __init__(self):
         # Note that everything here is not set in init so the top
         # level module can create a single connection class without
         # needing to load outside resources at startup.
-        self.connection = None
+        self.pool: Optional[ConnectionPool] = None
+        self.read_pool: Optional[ConnectionPool] = None
         self.username = None
         self.password = None
         self.host = None
         self.port = None
         self.active_database = None
+        self.pool_min_size = 1
+        self.pool_max_size = 8
+        self.pool_timeout = 30.0
+        self.itersize = 2000
+        self._cursor_ids = itertools.count()
 
     def load_config(self, conf: config.AirsecConfig, database=None):
         self.username = conf.timescaledb_username
         self.password = conf.timescaledb_password
         self.host = conf.timescaledb_hostname
         self.port = conf.timescaledb_port
+        self.pool_min_size = conf.timescaledb_pool_min_size
+        self.pool_max_size = conf.timescaledb_pool_max_size
+        self.pool_timeout = conf.timescaledb_pool_timeout_ms / 1000
+        self.itersize = conf.timescaledb_itersize
         self.active_database = database
 
     @property
@@ -43,34 +231,112 @@ class DBConnection:
             active_db=self.active_database
         )
 
+    @property
+    def connected(self) -> bool:
+        return self.pool is not None
+
     def connect(self):
-        if self.connection is None:
-            self.connection = psycopg2.connect(self.connection_string)
+        if self.pool is None:
+            self.pool = ConnectionPool(self.connection_string,
+                                       min_size=self.pool_min_size,
+                                       max_size=self.pool_max_size,
+                                       timeout=self.pool_timeout,
+                                       name="write-pool")
+            self.read_pool = ConnectionPool(self.connection_string,
+                                            min_size=0,
+                                            max_size=self.pool_max_size,
+                                            timeout=self.pool_timeout,
+                                            readonly=True,
+                                            name="read-pool")
             with self.cursor() as cur:
                 # Will raise psycopg2.OperationError if the connection failed.
                 cur.execute("SELECT 1")
 
     def close(self):
-        if self.connection is not None:
-            self.connection.close()
-            self.connection = None
+        for pool in (self.pool, self.read_pool):
+            if pool is not None:
+                pool.close()
+        self.pool = None
+        self.read_pool = None
 
     def set_active_database(self, db_name: str):
-        was_connected = self.connection is not None
+        was_connected = self.connected
         self.close()
         self.active_database = db_name
         if was_connected:
             self.connect()
 
     @contextmanager
-    def cursor(self):
-        if self.connection is None:
+    def connection(self, pool: Optional[ConnectionPool] = None):
+        """Borrow a connection from the (write) pool for the duration of the block."""
+        pool = pool or self.pool
+        if pool is None:
             raise RuntimeError("Not connected to a database.")
 
-        cursor = self.connection.cursor()
-        yield cursor
-        self.connection.commit()
-        cursor.close()
+        connection = pool.acquire()
+        discard = False
+        try:
+            yield connection
+        except psycopg2.OperationalError:
+            # Most likely a dropped connection, do not hand it out again.
+            discard = True
+            raise
+        except Exception:
+            if not connection.autocommit:
+                connection.rollback()
+            raise
+        finally:
+            pool.release(connection, discard=discard)
+
+    @contextmanager
+    def cursor(self):
+        with self.connection() as connection:
+            cursor = connection.cursor()
+            yield cursor
+            connection.commit()
+            cursor.close()
+
+    @contextmanager
+    def read_cursor(self):
+        with self.connection(self.read_pool) as connection:
+            with connection.cursor() as cursor:
+                yield cursor
+
+    @contextmanager
+    def server_cursor(self, itersize: Optional[int] = None):
+        """
+            Named (server-side) cursor on a read-only connection. Iterating
+            over it fetches `itersize` rows per round trip instead of
+            loading the whole result set into memory.
+        """
+        with self.connection(self.read_pool) as connection:
+            # Named cursors only exist inside a transaction.
+            connection.autocommit = False
+            try:
+                with connection.cursor(name=f"airsec_{next(self._cursor_ids)}") as cursor:
+                    cursor.itersize = itersize or self.itersize
+                    yield cursor
+            finally:
+                if not connection.closed:
+                    connection.rollback()
+                    connection.autocommit = True
+
+    def report(self):
+        for pool in (self.pool, self.read_pool):
+            if pool is None:
+                continue
+            stats = pool.stats
+            logger.info("%s: %d/%d connections (%d idle), %d acquired, %d waited "
+                        "(mean %.1fms / max %.1fms), %d timeouts",
+                        pool.name,
+                        pool.size,
+                        pool.max_size,
+                        pool.idle,
+                        stats.acquired,
+                        stats.waited,
+                        stats.mean_wait * 1000,
+                        stats.max_wait * 1000,
+                        stats.timeouts)
 
 
 DATABASE = DBConnection()
@@ -81,11 +347,49 @@ def get_cursor():
     with DATABASE.cursor() as cursor:
         yield cursor
 
+@contextmanager
+def get_read_cursor():
+    """Cursor for queries, on an autocommit read-only connection."""
+    with DATABASE.read_cursor() as cursor:
+        yield cursor
+
+@contextmanager
+def get_server_cursor(itersize: Optional[int] = None):
+    with DATABASE.server_cursor(itersize) as cursor:
+        yield cursor
+
+def iter_query(sql: str, values=None, itersize: Optional[int] = None) -> Iterator[tuple]:
+    """Yield the rows of a query as they are streamed from a server-side cursor."""
+    with get_server_cursor(itersize) as cursor:
+        cursor.execute(sql, values)
+        yield from cursor
+
+def iter_query_batches(sql: str, values=None, itersize: Optional[int] = None) -> Iterator[List[tuple]]:
+    """Same as `iter_query` but yields lists of up to `itersize` rows."""
+    with get_server_cursor(itersize) as cursor:
+        cursor.execute(sql, values)
+        while True:
+            rows = cursor.fetchmany(cursor.itersize)
+            if not rows:
+                return
+            yield rows
+
 class Table:
 
     is_hypertable = False
     hypertable_field_name = 'time'
 
+    # Hypertable storage, applied by `configure_storage`. Intervals are SQL
+    # interval strings. A None chunk interval keeps the TimescaleDB default
+    # (7 days), a None `compress_after` or `drop_after` removes that policy.
+    chunk_time_interval: Optional[str] = None
+    # Compressed chunks store one row per distinct `compress_segmentby`
+    # value holding arrays ordered by `compress_orderby`.
+    compress_segmentby: Optional[str] = None
+    compress_orderby: Optional[str] = None
+    compress_after: Optional[str] = None
+    drop_after: Optional[str] = None
+
     @classmethod
     def create(cls):
         required_fields = ['name', 'fields']
@@ -112,15 +416,63 @@ class Table:
                 cursor.execute(sql)
 
     @classmethod
-    def column_names(cls):
-        return [f[0] for f in cls.fields]
+    def configure_storage(cls):
+        """
+            Apply the chunk interval, compression and retention settings.
+            Safe to run on every start, only what differs is changed.
 
-    date_format = "%Y-%m-%dT%H:%M:%S.%f"
+            Compression options can not be changed once chunks are
+            compressed, so they are only set on hypertables that do not
+            have compression enabled yet.
+        """
+        if not cls.is_hypertable:
+            return
+
+        with get_cursor() as cursor:
+            if cls.chunk_time_interval:
+                # Only affects chunks created from now on.
+                cursor.execute("SELECT set_chunk_time_interval(%s, %s::interval);",
+                               (cls.name, cls.chunk_time_interval))
+
+            if cls.compress_after:
+                cursor.execute("""
+                SELECT compression_enabled FROM timescaledb_information.hypertables
+                WHERE hypertable_name = %s;
+                """, (cls.name,))
+                row = cursor.fetchone()
+                if row is not None and not row[0]:
+                    options = ["timescaledb.compress"]
+                    if cls.compress_segmentby:
+                        options.append(f"timescaledb.compress_segmentby = '{cls.compress_segmentby}'")
+                    if cls.compress_orderby:
+                        options.append(f"timescaledb.compress_orderby = '{cls.compress_orderby}'")
+                    cursor.execute(f"ALTER TABLE {cls.name} SET ({', '.join(options)});")
+
+            cls._set_policy(cursor, "compression", "compress_after", cls.compress_after)
+            cls._set_policy(cursor, "retention", "drop_after", cls.drop_after)
 
     @classmethod
-    def format_bytes(cls, data: bytes) -> str:
-        return "E'\X{}'".format(binascii.hexlify(data).decode())
+    def _set_policy(cls, cursor, policy: str, key: str, interval: Optional[str]):
+        """Add, replace or remove the compression or retention policy job."""
+        cursor.execute(f"""
+        SELECT (config->>'{key}')::interval = %s::interval
+        FROM timescaledb_information.jobs
+        WHERE hypertable_name = %s AND proc_name = 'policy_{policy}';
+        """, (interval, cls.name))
+        row = cursor.fetchone()
+        if row is not None and row[0]:
+            return
+
+        if row is not None:
+            cursor.execute(f"SELECT remove_{policy}_policy(%s, if_exists => TRUE);", (cls.name,))
+        if interval is not None:
+            cursor.execute(f"SELECT add_{policy}_policy(%s, %s::interval);", (cls.name, interval))
 
+    @classmethod
+    def column_names(cls):
+        return [f[0] for f in cls.fields]
+
+    date_format = "%Y-%m-%dT%H:%M:%S.%f"
 
     @classmethod
     def format_date(cls, dt: datetime):
@@ -131,6 +483,24 @@ class Table:
 ### Table Definitions
 #####################
 
+# Binary COPY framing, see https://www.postgresql.org/docs/current/sql-copy.html
+_PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_PGCOPY_TRAILER = struct.pack("!h", -1)
+_PG_LENGTH = struct.Struct("!i")
+_PG_NULL = _PG_LENGTH.pack(-1)
+# Field count, time and bssid / channel, rssi and the payload length.
+_BEACON_COPY_HEAD = struct.Struct("!hiqi6s")
+_BEACON_COPY_TAIL = struct.Struct("!iiiii")
+
+_PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def pg_timestamp(dt: datetime) -> int:
+    """Binary `timestamp`: microseconds since 2000-01-01, in UTC like `Table.format_date`."""
+    return (dt.astimezone(timezone.utc) - _PG_EPOCH) // _MICROSECOND
+
+
 TABLES = []
 
 def register_table(cls):
@@ -155,34 +525,83 @@ class BeaconPacket(Table):
     )
 
     is_hypertable = True
+    chunk_time_interval = "1 day"
+    compress_segmentby = "bssid"
+    compress_orderby = "time DESC"
+    # Both are well past the longest refresh window of the RSSI aggregates
+    # (3 days), so refreshes read uncompressed chunks and the aggregated
+    # buckets outlive the beacons they were computed from.
+    compress_after = "7 days"
+    drop_after = "90 days"
 
     @classmethod
     def add(cls, dt: datetime, bssid: str, ssid: str, channel: int, rssi: int, payload: bytes):
-        timestamp = cls.format_date(dt)
-        values = [
-            timestamp,
-            bssid,
-            ssid,
-            channel,
-            rssi,
-        ]
-        sql = f"INSERT INTO {cls.name} VALUES (%s, %s, %s, %s, %s, {cls.format_bytes(payload)});"
+        cls.add_many([interfaces.BeaconPacket(dt, bssid, ssid, rssi, channel, payload)])
+
+    @classmethod
+    def add_many(cls, packets: Iterable[interfaces.BeaconPacket]):
+        """Insert a batch of packets with a single binary COPY in one transaction."""
         with get_cursor() as cursor:
-            cursor.execute(sql, values)
+            cls.insert_many(cursor, packets)
+
+    @classmethod
+    def insert_many(cls, cursor, packets: Iterable[interfaces.BeaconPacket]):
+        """Same as `add_many` using the caller's cursor (and transaction)."""
+        packets = list(packets)
+        if not packets:
+            return
+
+        columns = ",".join(cls.column_names())
+        buf = io.BytesIO(cls.encode_copy(packets))
+        cursor.copy_expert(f"COPY {cls.name} ({columns}) FROM STDIN WITH (FORMAT binary)", buf)
+
+    @classmethod
+    def encode_copy(cls, packets: Iterable[interfaces.BeaconPacket]) -> bytes:
+        """
+            Packets in the binary COPY format, so payloads are sent as is
+            instead of as hex text.
+        """
+        parts = [_PGCOPY_HEADER]
+        for p in packets:
+            ssid = p.ssid.encode() if p.ssid is not None else None
+            parts.append(_BEACON_COPY_HEAD.pack(6,
+                                                8, pg_timestamp(p.time),
+                                                6, binascii.unhexlify(p.bssid.replace(":", "").replace("-", ""))))
+            if ssid is None:
+                parts.append(_PG_NULL)
+            else:
+                parts.append(_PG_LENGTH.pack(len(ssid)))
+                parts.append(ssid)
+            parts.append(_BEACON_COPY_TAIL.pack(4, p.channel, 4, p.rssi, len(p.payload)))
+            parts.append(p.payload)
+        parts.append(_PGCOPY_TRAILER)
+        return b"".join(parts)
+
+    @staticmethod
+    def decode_payload(payload) -> bytes:
+        # Rows written before payloads were stored as is hold "X" followed
+        # by the payload in hex. A captured frame starts with its radiotap
+        # header, whose first byte (the version) is 0, never "X".
+        if payload[:1] == b"X":
+            return binascii.unhexlify(payload[1:])
+        return bytes(payload)
 
     @classmethod
     def inflate_row(cls, row):
-        column_names = cls.column_names()
-        record = dict(zip(column_names, row))
-        record['time'] = record['time'].replace(tzinfo=tz.tzutc())
-        record['payload'] = binascii.unhexlify(record['payload'][1:])
-        return interfaces.BeaconPacket(**record)
+        """A packet from a row in `fields` order, i.e. `SELECT *`."""
+        time, bssid, ssid, channel, rssi, payload = row
+        return interfaces.BeaconPacket(time.replace(tzinfo=UTC),
+                                       bssid,
+                                       ssid,
+                                       rssi,
+                                       channel,
+                                       cls.decode_payload(payload))
 
     @classmethod
     def select(cls, filter="", values=None):
         data = []
         sql = f"SELECT * FROM {cls.name} {filter};"
-        with get_cursor() as cursor:
+        with get_read_cursor() as cursor:
             if values:
                 cursor.execute(sql, values)
             else:
@@ -193,6 +612,21 @@ class BeaconPacket(Table):
 
         return data
 
+    @classmethod
+    def iter_select(cls, filter="", values=None, itersize: Optional[int] = None) -> Iterator[interfaces.BeaconPacket]:
+        """Same as `select` but streams the packets from a server-side cursor."""
+        sql = f"SELECT * FROM {cls.name} {filter};"
+        return map(cls.inflate_row, iter_query(sql, values, itersize))
+
+    @classmethod
+    def iter_select_batches(cls,
+                            filter="",
+                            values=None,
+                            itersize: Optional[int] = None) -> Iterator[List[interfaces.BeaconPacket]]:
+        sql = f"SELECT * FROM {cls.name} {filter};"
+        for rows in iter_query_batches(sql, values, itersize):
+            yield [cls.inflate_row(r) for r in rows]
+
 
 @register_table
 class AllowedBeacons(Table):
@@ -201,6 +635,29 @@ class AllowedBeacons(Table):
         ("bssid", "MACADDR", "NOT NULL"), # Don't delete this comma!
     )
 
+    # Every statement that changes the table sends a NOTIFY on this channel
+    # (with the operation as payload) so caches can reload.
+    notify_channel = "allowed_beacons"
+
+    @classmethod
+    def create(cls):
+        super().create()
+        with get_cursor() as cursor:
+            cursor.execute(f"""
+            CREATE OR REPLACE FUNCTION {cls.name}_notify() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('{cls.notify_channel}', TG_OP);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            """)
+            cursor.execute(f"DROP TRIGGER IF EXISTS {cls.name}_notify ON {cls.name};")
+            cursor.execute(f"""
+            CREATE TRIGGER {cls.name}_notify
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {cls.name}
+            FOR EACH STATEMENT EXECUTE FUNCTION {cls.name}_notify();
+            """)
+
     @classmethod
     def add(cls, bssid: Union[str, list, Tuple]) -> None:
         if isinstance(bssid, str):
@@ -216,6 +673,9 @@ class AllowedBeacons(Table):
         with get_cursor() as cursor:
             cursor.execute(sql, (json.dumps(values), ))
 
+        # Other processes hear about it through the trigger.
+        ALLOW_LIST.invalidate()
+
 
     @classmethod
     def select(cls, filter=""):
@@ -227,7 +687,7 @@ class AllowedBeacons(Table):
         SELECT {columns} FROM {cls.name} {filter}
         """
 
-        with get_cursor() as cur:
+        with get_read_cursor() as cur:
             cur.execute(sql)
             results = cur.fetchall()
             for r in results:
@@ -235,6 +695,182 @@ class AllowedBeacons(Table):
 
         return data
 
+@register_table
+class APInventory(Table):
+    """
+        One row per access point ever seen, kept up to date as beacons are
+        logged so dashboards do not have to scan `beacon_packet`.
+    """
+    name = "ap_inventory"
+    fields = (
+        ("bssid", "MACADDR", "PRIMARY KEY"),
+        ("first_seen", "TIMESTAMP WITHOUT TIME ZONE", "NOT NULL"),
+        ("last_seen", "TIMESTAMP WITHOUT TIME ZONE", "NOT NULL"),
+        ("ssid", "VARCHAR(255)", "NULL"),
+        ("channel", "INTEGER", "NOT NULL"),
+        ("rssi", "INTEGER", "NOT NULL"),
+        ("beacon_count", "BIGINT", "NOT NULL"),
+    )
+
+    # Every batch folded into the inventory sends a NOTIFY on this channel
+    # (with the newest sighting as payload) when its transaction commits.
+    notify_channel = "ap_inventory"
+
+    @classmethod
+    def upsert_many(cls, cursor, packets: Iterable[interfaces.BeaconPacket]):
+        """
+            Fold a batch of beacons into the inventory. The batch is first
+            reduced to one row per BSSID so each access point is updated once.
+        """
+        summary = {}
+        for p in packets:
+            row = summary.get(p.bssid)
+            if row is None:
+                summary[p.bssid] = [p.time, p, 1]
+                continue
+
+            row[2] += 1
+            if p.time < row[0]:
+                row[0] = p.time
+            if p.time >= row[1].time:
+                row[1] = p
+
+        if not summary:
+            return
+
+        # Sorted so concurrent writers lock rows in the same order.
+        values = [
+            (
+                bssid,
+                cls.format_date(first_seen),
+                cls.format_date(latest.time),
+                latest.ssid,
+                latest.channel,
+                latest.rssi,
+                count,
+            )
+            for bssid, (first_seen, latest, count) in sorted(summary.items())
+        ]
+
+        columns = ",".join(cls.column_names())
+        sql = f"""
+        INSERT INTO {cls.name} ({columns}) VALUES %s
+        ON CONFLICT (bssid) DO UPDATE SET
+            first_seen = least({cls.name}.first_seen, EXCLUDED.first_seen),
+            last_seen = greatest({cls.name}.last_seen, EXCLUDED.last_seen),
+            ssid = CASE WHEN EXCLUDED.last_seen >= {cls.name}.last_seen THEN EXCLUDED.ssid ELSE {cls.name}.ssid END,
+            channel = CASE WHEN EXCLUDED.last_seen >= {cls.name}.last_seen THEN EXCLUDED.channel ELSE {cls.name}.channel END,
+            rssi = CASE WHEN EXCLUDED.last_seen >= {cls.name}.last_seen THEN EXCLUDED.rssi ELSE {cls.name}.rssi END,
+            beacon_count = {cls.name}.beacon_count + EXCLUDED.beacon_count;
+        """
+        psycopg2.extras.execute_values(cursor, sql, values)
+        cursor.execute("SELECT pg_notify(%s, %s);", (cls.notify_channel, max(v[2] for v in values)))
+
+    @classmethod
+    def backfill(cls):
+        """Build the inventory from the logged beacons if it is empty."""
+        columns = ",".join(cls.column_names())
+        sql = f"""
+        INSERT INTO {cls.name} ({columns})
+        SELECT DISTINCT ON (bp.bssid)
+            bp.bssid, seen.first_seen, seen.last_seen, bp.ssid, bp.channel, bp.rssi, seen.beacon_count
+        FROM {BeaconPacket.name} bp
+        INNER JOIN (
+            SELECT bssid, min(time) AS first_seen, max(time) AS last_seen, count(*) AS beacon_count
+            FROM {BeaconPacket.name}
+            GROUP BY bssid
+        ) AS seen ON bp.bssid = seen.bssid AND bp.time = seen.last_seen
+        WHERE NOT EXISTS (SELECT 1 FROM {cls.name})
+        ORDER BY bp.bssid
+        ON CONFLICT (bssid) DO NOTHING;
+        """
+        with get_cursor() as cursor:
+            cursor.execute(sql)
+
+    @classmethod
+    def inflate_row(cls, row):
+        bssid, first_seen, last_seen, ssid, channel, rssi, beacon_count = row
+        return interfaces.AccessPoint(bssid,
+                                      first_seen.replace(tzinfo=UTC),
+                                      last_seen.replace(tzinfo=UTC),
+                                      ssid,
+                                      channel,
+                                      rssi,
+                                      beacon_count)
+
+    @classmethod
+    def select(cls, filter="", values=None):
+        columns = ",".join(cls.column_names())
+        sql = f"SELECT {columns} FROM {cls.name} {filter};"
+        with get_read_cursor() as cursor:
+            cursor.execute(sql, values)
+            return [cls.inflate_row(r) for r in cursor.fetchall()]
+
+
+@register_table
+class EvilTwinEvent(Table):
+    """Beacons flagged by `detection.EvilTwinDetector` as they were captured."""
+    name = "evil_twin_event"
+    fields = (
+        ("time", "TIMESTAMP WITHOUT TIME ZONE", "NOT NULL"),
+        ("bssid", "MACADDR", "NOT NULL"),
+        ("ssid", "VARCHAR(255)", "NOT NULL"),
+        ("channel", "INTEGER", "NOT NULL"),
+        ("rssi", "INTEGER", "NOT NULL"),
+    )
+
+    is_hypertable = True
+    # Few rows, kept until deleted by hand.
+    chunk_time_interval = "30 days"
+
+    # Sent with the number of events whenever a batch is recorded.
+    notify_channel = "evil_twin_event"
+
+    @classmethod
+    def add_many(cls, events: Iterable[interfaces.EvilTwinEvent]):
+        values = [(cls.format_date(e.time), e.bssid, e.ssid, e.channel, e.rssi) for e in events]
+        if not values:
+            return
+
+        columns = ",".join(cls.column_names())
+        with get_cursor() as cursor:
+            psycopg2.extras.execute_values(cursor, f"INSERT INTO {cls.name} ({columns}) VALUES %s;", values)
+            cursor.execute("SELECT pg_notify(%s, %s);", (cls.notify_channel, str(len(values))))
+
+    @classmethod
+    def backfill(cls):
+        """
+            Record the latest beacon of every rogue BSSID found in the logged
+            beacons if there are no events yet, i.e. when upgrading from a
+            version that worked evil twins out from `beacon_packet`. Like
+            `detection.EvilTwinDetector`, the SSIDs of authorized access
+            points are taken from the inventory, so run it after
+            `APInventory.backfill`.
+        """
+        columns = ",".join(cls.column_names())
+        sql = f"""
+        INSERT INTO {cls.name} ({columns})
+        SELECT DISTINCT ON (bp.bssid) bp.time, bp.bssid, bp.ssid, bp.channel, bp.rssi
+        FROM {BeaconPacket.name} bp
+        WHERE bp.ssid IN (
+            SELECT inv.ssid
+            FROM {APInventory.name} inv
+            INNER JOIN {AllowedBeacons.name} ab ON ab.bssid = inv.bssid
+            WHERE inv.ssid IS NOT NULL
+        )
+        AND NOT EXISTS (SELECT 1 FROM {AllowedBeacons.name} ab WHERE ab.bssid = bp.bssid)
+        AND NOT EXISTS (SELECT 1 FROM {cls.name})
+        ORDER BY bp.bssid, bp.time DESC;
+        """
+        with get_cursor() as cursor:
+            cursor.execute(sql)
+
+    @classmethod
+    def inflate_row(cls, row):
+        time, bssid, ssid, channel, rssi = row
+        return interfaces.EvilTwinEvent(time.replace(tzinfo=UTC), bssid, ssid, channel, rssi)
+
+
 @register_table
 class RFLog(Table):
     name = "rf_log"
@@ -246,6 +882,12 @@ class RFLog(Table):
     )
 
     is_hypertable = True
+    chunk_time_interval = "1 day"
+    compress_segmentby = "center_frequency"
+    compress_orderby = "time DESC"
+    compress_after = "2 days"
+    # One row per frequency bin per sweep adds up quickly.
+    drop_after = "30 days"
 
     @classmethod
     def add(cls, timestamp: datetime, center_frequency: float, rssi: float):
@@ -260,34 +902,745 @@ class RFLog(Table):
         with get_cursor() as cursor:
             cursor.execute(sql, values)
 
-
     @classmethod
-    def select(cls, low_freq, high_freq, since: datetime, until: datetime):
-        column_names = [f[0] for f in cls.fields]
-        columns = ",".join(column_names)
+    def add_many(cls, rows: Iterable[Tuple[datetime, float, float]]) -> int:
+        """
+            Bulk load (time, center_frequency, rssi) rows with a single COPY
+            in one transaction.
 
-        since = BeaconPacket.format_date(since)
-        until = BeaconPacket.format_date(until)
+            Returns: The number of rows written.
+        """
+        buf = io.StringIO()
+        count = 0
+        last_dt, timestamp = None, None
+        for dt, frequency, rssi in rows:
+            # Every bin of an rtl_power line shares a timestamp, so only
+            # format it when it changes.
+            if dt is not last_dt:
+                last_dt, timestamp = dt, cls.format_date(dt)
+            buf.write(f"{timestamp}\t{frequency!r}\t{rssi!r}\n")
+            count += 1
+
+        if not count:
+            return 0
+
+        buf.seek(0)
+        columns = ",".join(cls.column_names())
+        with get_cursor() as cursor:
+            cursor.copy_expert(f"COPY {cls.name} ({columns}) FROM STDIN", buf)
+
+        return count
 
-        filter = (f"WHERE center_frequency >= {low_freq} AND "
-                  f"center_frequency <= {high_freq} AND "
-                  f"time > '{since}' AND time < '{until}'")
 
+    @classmethod
+    def _select_query(cls, low_freq, high_freq, since: datetime, until: datetime):
+        columns = ",".join(cls.column_names())
         sql = f"""
-        SELECT {columns} FROM {cls.name} {filter}
+        SELECT {columns} FROM {cls.name}
+        WHERE center_frequency >= %s AND center_frequency <= %s AND time > %s AND time < %s
         """
+        return sql, (low_freq, high_freq, cls.format_date(since), cls.format_date(until))
 
-        with get_cursor() as cur:
-            cur.execute(sql)
+    @classmethod
+    def select(cls,
+               low_freq,
+               high_freq,
+               since: datetime,
+               until: datetime,
+               resolution: Optional[timedelta] = None):
+        """
+            Readings between `low_freq` and `high_freq` grouped by frequency.
+
+            Without a `resolution` every reading is returned as a
+            (time, rssi) tuple. With one, readings are summarized in
+            `resolution` wide `interfaces.RFPowerBucket`s computed from the
+            coarsest RF power aggregate that is fine enough (see
+            `rf_power_tier`), or from `rf_log` itself under a minute.
+        """
+        if resolution is not None:
+            return cls._select_buckets(low_freq, high_freq, since, until, resolution)
+
+        sql, values = cls._select_query(low_freq, high_freq, since, until)
+        with get_read_cursor() as cur:
+            cur.execute(sql, values)
             results = cur.fetchall()
             data = defaultdict(list)
-            for r in results:
-                rec = dict(zip(column_names, r))
-                rec['time'] = rec['time'].replace(tzinfo=tz.tzutc())
-                data[rec['center_frequency']].append((rec['time'], rec['rssi']))
+            for time, frequency, rssi in results:
+                data[frequency].append((time.replace(tzinfo=UTC), rssi))
+
+        return data
+
+    @classmethod
+    def _select_buckets(cls,
+                        low_freq,
+                        high_freq,
+                        since: datetime,
+                        until: datetime,
+                        resolution: timedelta) -> Dict[float, List[interfaces.RFPowerBucket]]:
+        tier = rf_power_tier(resolution)
+        if tier is not None:
+            # Histograms are summed in Python, array_agg stacks them into a
+            # two dimensional array.
+            sql = f"""
+            SELECT time_bucket(%(bucket)s, bucket) AS time,
+                   center_frequency,
+                   sum(samples),
+                   sum(rssi * samples) / sum(samples),
+                   min(rssi_min),
+                   max(rssi_max),
+                   array_agg(rssi_histogram)
+            FROM {tier.name}
+            WHERE center_frequency >= %(low)s AND center_frequency <= %(high)s
+              AND bucket >= %(since)s AND bucket < %(until)s
+            GROUP BY 1, 2
+            ORDER BY 2, 1
+            """
+        else:
+            sql = f"""
+            SELECT time_bucket(%(bucket)s, time) AS time,
+                   center_frequency,
+                   count(*),
+                   avg(rssi),
+                   min(rssi),
+                   max(rssi),
+                   ARRAY[{RFPower.histogram_sql()}]
+            FROM {cls.name}
+            WHERE center_frequency >= %(low)s AND center_frequency <= %(high)s
+              AND time >= %(since)s AND time < %(until)s
+            GROUP BY 1, 2
+            ORDER BY 2, 1
+            """
+
+        values = {
+            "bucket": resolution,
+            "low": low_freq,
+            "high": high_freq,
+            # Include the bucket containing `since`
+            "since": cls.format_date(since - resolution),
+            "until": cls.format_date(until),
+        }
+
+        data = defaultdict(list)
+        with get_read_cursor() as cur:
+            cur.execute(sql, values)
+            for time, frequency, samples, rssi, rssi_min, rssi_max, histograms in cur.fetchall():
+                histogram = [sum(counts) for counts in zip(*histograms)]
+                data[frequency].append(interfaces.RFPowerBucket(
+                    time=time.replace(tzinfo=UTC),
+                    center_frequency=frequency,
+                    samples=int(samples),
+                    rssi=float(rssi),
+                    rssi_min=rssi_min,
+                    rssi_max=rssi_max,
+                    rssi_p50=rf_power_percentile(histogram, 0.5, rssi_min, rssi_max),
+                    rssi_p90=rf_power_percentile(histogram, 0.9, rssi_min, rssi_max)))
+
+        return data
+
+    @classmethod
+    def iter_select(cls,
+                    low_freq,
+                    high_freq,
+                    since: datetime,
+                    until: datetime,
+                    itersize: Optional[int] = None) -> Iterator[Tuple[datetime, float, float]]:
+        """
+            Stream (time, center_frequency, rssi) readings from a server-side
+            cursor instead of building the whole `select` result in memory.
+        """
+        for rows in cls.iter_select_batches(low_freq, high_freq, since, until, itersize):
+            yield from rows
+
+    @classmethod
+    def iter_select_batches(cls,
+                            low_freq,
+                            high_freq,
+                            since: datetime,
+                            until: datetime,
+                            itersize: Optional[int] = None) -> Iterator[List[Tuple[datetime, float, float]]]:
+        sql, values = cls._select_query(low_freq, high_freq, since, until)
+        for rows in iter_query_batches(sql, values, itersize):
+            yield [(time.replace(tzinfo=UTC), frequency, rssi) for time, frequency, rssi in rows]
+
+@register_table
+class RFSweep(Table):
+    """
+        Compact alternative to `RFLog` storing one row per rtl_power line
+        (i.e. per tuner hop) with the power readings packed into an array.
+        The frequency of `power[i]` (1-indexed) is `hz_low + (i - 1) * hz_step`.
+    """
+    name = "rf_sweep"
+
+    fields = (
+        ("time", "TIMESTAMP WITHOUT TIME ZONE", "NOT NULL"),
+        ("hz_low", "float", "NOT NULL"),
+        ("hz_step", "float", "NOT NULL"),
+        ("power", "real[]", "NOT NULL"),
+    )
+
+    is_hypertable = True
+    chunk_time_interval = "1 day"
+    # One segment per tuner hop.
+    compress_segmentby = "hz_low"
+    compress_orderby = "time DESC"
+    compress_after = "2 days"
+    drop_after = "90 days"
+
+    @classmethod
+    def add(cls, timestamp: datetime, hz_low: float, hz_step: float, power: Sequence[float]):
+        cls.add_many([(timestamp, hz_low, hz_step, power)])
+
+    @classmethod
+    def add_many(cls, rows: Iterable[Tuple[datetime, float, float, Sequence[float]]]) -> int:
+        """
+            Bulk load (time, hz_low, hz_step, power) rows with a single COPY
+            in one transaction.
+
+            Returns: The number of power readings written.
+        """
+        buf = io.StringIO()
+        count = 0
+        for dt, hz_low, hz_step, power in rows:
+            values = ",".join(repr(float(p)) for p in power)
+            buf.write(f"{cls.format_date(dt)}\t{hz_low!r}\t{hz_step!r}\t{{{values}}}\n")
+            count += len(power)
+
+        if not count:
+            return 0
+
+        buf.seek(0)
+        columns = ",".join(cls.column_names())
+        with get_cursor() as cursor:
+            cursor.copy_expert(f"COPY {cls.name} ({columns}) FROM STDIN", buf)
+
+        return count
+
+    @classmethod
+    def _select_query(cls, low_freq, high_freq, since: datetime, until: datetime):
+        # Only the part of each power array inside [low, high] is sent back.
+        sql = f"""
+        SELECT time, hz_low, hz_step, lo, power[lo:hi] FROM (
+            SELECT time, hz_low, hz_step, power,
+                   greatest(1, ceil((%(low)s - hz_low) / hz_step)::int + 1) AS lo,
+                   least(cardinality(power), floor((%(high)s - hz_low) / hz_step)::int + 1) AS hi
+            FROM {cls.name}
+            WHERE time > %(since)s AND time < %(until)s
+              AND hz_low <= %(high)s
+              AND hz_low + hz_step * (cardinality(power) - 1) >= %(low)s
+        ) AS segment
+        WHERE lo <= hi
+        """
+
+        values = {
+            "low": low_freq,
+            "high": high_freq,
+            "since": cls.format_date(since),
+            "until": cls.format_date(until),
+        }
+        return sql, values
+
+    @staticmethod
+    def _readings(time, hz_low, hz_step, lo, power) -> Iterator[Tuple[datetime, float, float]]:
+        time = time.replace(tzinfo=UTC)
+        for i, rssi in enumerate(power, start=lo - 1):
+            yield time, hz_low + i * hz_step, rssi
+
+    @classmethod
+    def select(cls, low_freq, high_freq, since: datetime, until: datetime):
+        """
+            Same interface and return value as `RFLog.select`. Only the part of
+            each power array that falls inside [low_freq, high_freq] is sent
+            back by the database.
+        """
+        sql, values = cls._select_query(low_freq, high_freq, since, until)
+        data = defaultdict(list)
+        with get_read_cursor() as cur:
+            cur.execute(sql, values)
+            for row in cur.fetchall():
+                for time, frequency, rssi in cls._readings(*row):
+                    data[frequency].append((time, rssi))
 
         return data
 
+    @classmethod
+    def iter_select(cls,
+                    low_freq,
+                    high_freq,
+                    since: datetime,
+                    until: datetime,
+                    itersize: Optional[int] = None) -> Iterator[Tuple[datetime, float, float]]:
+        """Same as `RFLog.iter_select`. `itersize` counts sweep rows, not readings."""
+        sql, values = cls._select_query(low_freq, high_freq, since, until)
+        for row in iter_query(sql, values, itersize):
+            yield from cls._readings(*row)
+
+####################
+### View Definitions
+####################
+
+VIEWS = []
+
+def register_view(cls):
+    if not issubclass(cls, ContinuousAggregate):
+        raise TypeError("Registered views must subclass ContinuousAggregate")
+
+    VIEWS.append(cls)
+    return cls
+
+
+class ContinuousAggregate:
+    """
+        A TimescaleDB continuous aggregate, kept up to date by a refresh
+        policy. Buckets that have not been materialized yet are computed from
+        the source hypertable at query time, so recent data is always
+        included.
+
+        Subclasses define `name`, `view_query` (the SELECT the view
+        materializes) and the refresh policy offsets as SQL interval strings.
+    """
+
+    name = None
+    refresh_start_offset = None
+    refresh_end_offset = None
+    refresh_schedule_interval = None
+
+    @classmethod
+    def view_query(cls) -> str:
+        raise NotImplementedError
+
+    @classmethod
+    def create(cls):
+        if not cls.name:
+            raise ValueError("Cannot create view for %s. 'name' not defined." % cls.__name__)
+
+        with get_cursor() as cursor:
+            cursor.execute(f"""
+            CREATE MATERIALIZED VIEW IF NOT EXISTS {cls.name}
+            WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+            {cls.view_query()}
+            WITH NO DATA;
+            """)
+
+            cursor.execute(f"""
+            SELECT add_continuous_aggregate_policy('{cls.name}',
+                start_offset => INTERVAL '{cls.refresh_start_offset}',
+                end_offset => INTERVAL '{cls.refresh_end_offset}',
+                schedule_interval => INTERVAL '{cls.refresh_schedule_interval}',
+                if_not_exists => TRUE);
+            """)
+
+    @classmethod
+    def drop(cls):
+        with get_cursor() as cursor:
+            cursor.execute(f"DROP MATERIALIZED VIEW IF EXISTS {cls.name} CASCADE;")
+
+    @classmethod
+    def refresh(cls, since: Optional[datetime] = None, until: Optional[datetime] = None):
+        """Materialize a window now instead of waiting for the policy."""
+        since = Table.format_date(since) if since else None
+        until = Table.format_date(until) if until else None
+        # refresh_continuous_aggregate can not run inside a transaction.
+        with DATABASE.connection() as connection:
+            connection.autocommit = True
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("CALL refresh_continuous_aggregate(%s, %s, %s);", (cls.name, since, until))
+            finally:
+                connection.autocommit = False
+
+
+class BeaconRSSI(ContinuousAggregate):
+    """
+        Per BSSID beacon count and RSSI min / max / mean over fixed width
+        buckets of `beacon_packet`. One subclass per bucket width.
+    """
+
+    bucket_width: timedelta = None
+
+    @classmethod
+    def bucket_sql(cls) -> str:
+        return f"{int(cls.bucket_width.total_seconds())} seconds"
+
+    @classmethod
+    def view_query(cls) -> str:
+        return f"""
+            SELECT time_bucket(INTERVAL '{cls.bucket_sql()}', time) AS bucket,
+                   bssid,
+                   count(*) AS samples,
+                   avg(rssi) AS rssi,
+                   min(rssi) AS rssi_min,
+                   max(rssi) AS rssi_max
+            FROM {BeaconPacket.name}
+            GROUP BY bucket, bssid
+        """
+
+    @classmethod
+    def select(cls,
+               bssids: Sequence[str],
+               since: datetime,
+               until: datetime) -> Dict[str, List[interfaces.RSSIBucket]]:
+        sql = f"""
+        SELECT bucket, bssid, samples, rssi, rssi_min, rssi_max
+        FROM {cls.name}
+        WHERE bssid = ANY(%s::macaddr[]) AND bucket >= %s AND bucket < %s
+        ORDER BY bucket
+        """
+        # Widen the window to the start of the bucket containing `since`.
+        values = (list(bssids), Table.format_date(since - cls.bucket_width), Table.format_date(until))
+        return cls._fetch(sql, values)
+
+    @classmethod
+    def _fetch(cls, sql, values) -> Dict[str, List[interfaces.RSSIBucket]]:
+        data = defaultdict(list)
+        with get_read_cursor() as cursor:
+            cursor.execute(sql, values)
+            for time, bssid, samples, rssi, rssi_min, rssi_max in cursor.fetchall():
+                data[bssid].append(interfaces.RSSIBucket(time=time.replace(tzinfo=UTC),
+                                                         bssid=bssid,
+                                                         samples=samples,
+                                                         rssi=float(rssi),
+                                                         rssi_min=rssi_min,
+                                                         rssi_max=rssi_max))
+        return data
+
+
+@register_view
+class BeaconRSSI10s(BeaconRSSI):
+    name = "beacon_rssi_10s"
+    bucket_width = timedelta(seconds=10)
+    refresh_start_offset = "10 minutes"
+    refresh_end_offset = "10 seconds"
+    refresh_schedule_interval = "30 seconds"
+
+
+@register_view
+class BeaconRSSI1m(BeaconRSSI):
+    name = "beacon_rssi_1m"
+    bucket_width = timedelta(minutes=1)
+    refresh_start_offset = "2 hours"
+    refresh_end_offset = "1 minute"
+    refresh_schedule_interval = "1 minute"
+
+
+@register_view
+class BeaconRSSI1h(BeaconRSSI):
+    name = "beacon_rssi_1h"
+    bucket_width = timedelta(hours=1)
+    refresh_start_offset = "3 days"
+    refresh_end_offset = "1 hour"
+    refresh_schedule_interval = "30 minutes"
+
+
+# Coarsest first
+BEACON_RSSI_TIERS = (BeaconRSSI1h, BeaconRSSI1m, BeaconRSSI10s)
+
+
+def rssi_bucket_width(since: datetime, until: datetime, points: int) -> timedelta:
+    """Bucket width giving about `points` buckets between `since` and `until`, at least one second."""
+    return max((until - since) / max(points, 1), timedelta(seconds=1))
+
+
+def rssi_tier(resolution: timedelta) -> Optional[type]:
+    """
+        The coarsest RSSI aggregate whose buckets are no wider than
+        `resolution`, or None if only raw packets are fine grained enough.
+    """
+    for tier in BEACON_RSSI_TIERS:
+        if tier.bucket_width <= resolution:
+            return tier
+    return None
+
+
+# Range and number of the 2 dB wide bins of the power histogram kept by the
+# RF power aggregates, wide enough for rtl_power readings at any gain.
+RF_POWER_HISTOGRAM_MIN = -100
+RF_POWER_HISTOGRAM_MAX = 30
+RF_POWER_HISTOGRAM_BINS = 65
+
+
+class RFPower(ContinuousAggregate):
+    """
+        Per frequency bin reading count, power min / max / mean and power
+        histogram over fixed width buckets of `rf_log`. Percentiles can not
+        be materialized directly (they do not combine across buckets), so
+        they are estimated from the histogram, which does. One subclass per
+        bucket width.
+    """
+
+    bucket_width: timedelta = None
+
+    @classmethod
+    def bucket_sql(cls) -> str:
+        return f"{int(cls.bucket_width.total_seconds())} seconds"
+
+    @staticmethod
+    def histogram_sql() -> str:
+        return (f"histogram(rssi, {RF_POWER_HISTOGRAM_MIN}, {RF_POWER_HISTOGRAM_MAX}, "
+                f"{RF_POWER_HISTOGRAM_BINS})")
+
+    @classmethod
+    def view_query(cls) -> str:
+        return f"""
+            SELECT time_bucket(INTERVAL '{cls.bucket_sql()}', time) AS bucket,
+                   center_frequency,
+                   count(*) AS samples,
+                   avg(rssi) AS rssi,
+                   min(rssi) AS rssi_min,
+                   max(rssi) AS rssi_max,
+                   {cls.histogram_sql()} AS rssi_histogram
+            FROM {RFLog.name}
+            GROUP BY bucket, center_frequency
+        """
+
+
+# Refresh windows stay well under rf_log's compress_after so policies do not
+# decompress chunks.
+@register_view
+class RFPower1m(RFPower):
+    name = "rf_power_1m"
+    bucket_width = timedelta(minutes=1)
+    refresh_start_offset = "2 hours"
+    refresh_end_offset = "1 minute"
+    refresh_schedule_interval = "1 minute"
+
+
+@register_view
+class RFPower15m(RFPower):
+    name = "rf_power_15m"
+    bucket_width = timedelta(minutes=15)
+    refresh_start_offset = "6 hours"
+    refresh_end_offset = "15 minutes"
+    refresh_schedule_interval = "15 minutes"
+
+
+@register_view
+class RFPower1h(RFPower):
+    name = "rf_power_1h"
+    bucket_width = timedelta(hours=1)
+    refresh_start_offset = "1 day"
+    refresh_end_offset = "1 hour"
+    refresh_schedule_interval = "30 minutes"
+
+
+# Coarsest first
+RF_POWER_TIERS = (RFPower1h, RFPower15m, RFPower1m)
+
+
+def rf_power_tier(resolution: timedelta) -> Optional[type]:
+    """
+        The coarsest RF power aggregate whose buckets are no wider than
+        `resolution`, or None if only raw readings are fine grained enough.
+    """
+    for tier in RF_POWER_TIERS:
+        if tier.bucket_width <= resolution:
+            return tier
+    return None
+
+
+def rf_power_percentile(histogram: Sequence[int],
+                        q: float,
+                        low: Optional[float] = None,
+                        high: Optional[float] = None) -> Optional[float]:
+    """
+        Estimate the `q` quantile (0 to 1) of the readings counted in a
+        TimescaleDB power `histogram`, interpolating linearly inside the bin
+        it falls in. The first and last counts are readings below and above
+        the histogram range. The estimate is clamped to [low, high], the
+        actual min and max power, when given.
+
+        Returns: None for an empty histogram.
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+
+    width = (RF_POWER_HISTOGRAM_MAX - RF_POWER_HISTOGRAM_MIN) / RF_POWER_HISTOGRAM_BINS
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(histogram):
+        if count and seen + count >= rank:
+            if i == 0:
+                value = RF_POWER_HISTOGRAM_MIN
+            elif i > RF_POWER_HISTOGRAM_BINS:
+                value = RF_POWER_HISTOGRAM_MAX
+            else:
+                value = RF_POWER_HISTOGRAM_MIN + width * (i - 1 + (rank - seen) / count)
+            break
+        seen += count
+
+    if low is not None:
+        value = max(value, low)
+    if high is not None:
+        value = min(value, high)
+    return value
+
+##################
+### Notifications
+##################
+
+class NotificationListener:
+    """
+        Dedicated autocommit connection that LISTENs on `channels` and calls
+        `callback(channel, payload)` for every NOTIFY from a background
+        thread.
+
+        The connection is re-established if it drops. Notifications sent
+        while disconnected are lost, so after every (re)connect the callback
+        is called once per channel with a payload of None.
+    """
+
+    def __init__(self,
+                 channels: Sequence[str],
+                 callback,
+                 reconnect_delay: float = 5.0,
+                 name: str = "pg-listener"):
+        self.channels = tuple(channels)
+        self.callback = callback
+        self.reconnect_delay = reconnect_delay
+        self.name = name
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            connection = None
+            try:
+                connection = psycopg2.connect(DATABASE.connection_string)
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    for channel in self.channels:
+                        cursor.execute(f"LISTEN {channel};")
+
+                for channel in self.channels:
+                    self.callback(channel, None)
+
+                while not self._stop.is_set():
+                    if select.select([connection], [], [], 0.5)[0]:
+                        connection.poll()
+                        while connection.notifies:
+                            notify = connection.notifies.pop(0)
+                            self.callback(notify.channel, notify.payload)
+            except (psycopg2.Error, OSError) as ex:
+                logger.error("%s lost its connection, reconnecting in %.0fs: %s",
+                             self.name, self.reconnect_delay, ex)
+                self._stop.wait(self.reconnect_delay)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+
+@dataclass
+class AllowListStats:
+    hits: int = 0
+    misses: int = 0
+    reloads: int = 0
+    notifications: int = 0
+    last_reload: float = 0.0
+
+
+class AllowListCache:
+    """
+        Process local copy of `allowed_beacons`.
+
+        The set is reloaded on the next lookup after a NOTIFY from the table
+        trigger, or once it is older than `max_staleness` seconds so that a
+        missed notification can not keep it stale forever. A lookup answered
+        from the cached set counts as a hit, one that had to reload first as
+        a miss.
+    """
+
+    def __init__(self, max_staleness: float = 60.0, listen: bool = True):
+        self.max_staleness = max_staleness
+        self.listen = listen
+        self.stats = AllowListStats()
+        self._bssids: Optional[frozenset] = None
+        self._loaded_at = 0.0
+        # Bumped by invalidate() so a reload that was already running does
+        # not store the set it read before the change.
+        self._generation = 0
+        # Serializes reloads.
+        self._lock = threading.Lock()
+        # Guards the cached set and generation, never held during a query.
+        self._state_lock = threading.Lock()
+        self._listener: Optional[NotificationListener] = None
+        self._listener_pid = None
+
+    def invalidate(self):
+        with self._state_lock:
+            self._generation += 1
+            self._bssids = None
+
+    def _on_notify(self, channel: str, payload: Optional[str]):
+        if payload is not None:
+            self.stats.notifications += 1
+        self.invalidate()
+
+    def _ensure_listening(self):
+        # Threads do not survive a fork, start a new listener in the child.
+        if not self.listen or self._listener_pid == os.getpid():
+            return
+
+        self._listener = NotificationListener([AllowedBeacons.notify_channel],
+                                              self._on_notify,
+                                              name="allow-list-listener")
+        self._listener_pid = os.getpid()
+        self._listener.start()
+
+    def stop(self):
+        if self._listener is not None and self._listener_pid == os.getpid():
+            self._listener.stop()
+        self._listener = None
+        self._listener_pid = None
+
+    def _load(self) -> frozenset:
+        with get_read_cursor() as cursor:
+            cursor.execute(f"SELECT bssid::text FROM {AllowedBeacons.name};")
+            return frozenset(r[0] for r in cursor.fetchall())
+
+    def bssids(self) -> frozenset:
+        with self._lock:
+            self._ensure_listening()
+            with self._state_lock:
+                bssids, loaded_at, generation = self._bssids, self._loaded_at, self._generation
+            if bssids is not None and time.monotonic() - loaded_at < self.max_staleness:
+                self.stats.hits += 1
+                return bssids
+
+            self.stats.misses += 1
+            bssids = self._load()
+            with self._state_lock:
+                # Invalidated while loading, the next lookup reloads.
+                if generation == self._generation:
+                    self._bssids = bssids
+                    self._loaded_at = time.monotonic()
+            self.stats.reloads += 1
+            self.stats.last_reload = time.time()
+            return bssids
+
+    def contains(self, bssid: str) -> bool:
+        return bssid.lower() in self.bssids()
+
+
+ALLOW_LIST = AllowListCache()
+atexit.register(ALLOW_LIST.stop)
+
+
 # Environment Macros for grouping config variables
 ENVIRONMENTS = {
     "production": {
@@ -317,6 +1670,9 @@ def init(conf: config.AirsecConfig, env="production"):
     DATABASE.set_active_database(db_name)
     DATABASE.connect()
 
+    ALLOW_LIST.max_staleness = conf.allow_list_max_staleness_ms / 1000
+    ALLOW_LIST.invalidate()
+
 
 def setup_database() -> None:
     with get_cursor() as cursor:
@@ -326,29 +1682,109 @@ def setup_database() -> None:
         print("Creating table: %s" % table.name)
         table.create()
 
-def add_packet_if_unauthorized(packet: interfaces.BeaconPacket):
-    cols = ",".join(BeaconPacket.column_names())
-    values = [
-        f"'{BeaconPacket.format_date(packet.time)}'::timestamp",
-        f"'{packet.bssid}'::macaddr",
-        f"'{packet.ssid}'" if packet.ssid else "NULL",
-        f"{packet.channel}",
-        f"{packet.rssi}",
-        f"{BeaconPacket.format_bytes(packet.payload)}::bytea",
-    ]
-
-    sql = f"""
-    INSERT INTO {BeaconPacket.name} ({cols})
-    SELECT * from (
-        VALUES ({", ".join(values)})
-    ) as sel({cols})
-    WHERE NOT EXISTS (
-        SELECT * FROM {AllowedBeacons.name} allow WHERE allow.bssid = sel.bssid
-    );
+    for view in VIEWS:
+        print("Creating view: %s" % view.name)
+        view.create()
+
+    for table in TABLES:
+        table.configure_storage()
+
+    APInventory.backfill()
+    EvilTwinEvent.backfill()
+    ALLOW_LIST.invalidate()
+    log_compression_stats()
+
+
+@dataclass
+class CompressionStats:
+    table: str
+    chunks: int
+    compressed_chunks: int
+    # Size of the compressed chunks before and after compression.
+    before_bytes: int
+    after_bytes: int
+    # Size of the whole hypertable as stored now.
+    total_bytes: int
+
+    @property
+    def ratio(self) -> float:
+        return self.before_bytes / self.after_bytes if self.after_bytes else 0.0
+
+
+def compression_stats() -> List[CompressionStats]:
+    """Chunk and compression statistics of every hypertable."""
+    stats = []
+    with get_read_cursor() as cursor:
+        for table in TABLES:
+            if not table.is_hypertable:
+                continue
+
+            cursor.execute("""
+            SELECT
+                (SELECT count(*) FROM show_chunks(%(name)s)),
+                coalesce(c.number_compressed_chunks, 0),
+                coalesce(c.before_compression_total_bytes, 0),
+                coalesce(c.after_compression_total_bytes, 0),
+                hypertable_size(%(name)s)
+            FROM (SELECT 1) AS one
+            LEFT JOIN hypertable_compression_stats(%(name)s) AS c ON TRUE;
+            """, {"name": table.name})
+            stats.append(CompressionStats(table.name, *cursor.fetchone()))
+    return stats
+
+
+def log_compression_stats():
+    try:
+        stats = compression_stats()
+    except psycopg2.Error as ex:
+        logger.warning("Could not read compression statistics: %s", ex)
+        return
+
+    for s in stats:
+        logger.info("%s: %d/%d chunks compressed, %.1f MiB -> %.1f MiB (%.1fx), %.1f MiB total",
+                    s.table,
+                    s.compressed_chunks,
+                    s.chunks,
+                    s.before_bytes / 2**20,
+                    s.after_bytes / 2**20,
+                    s.ratio,
+                    s.total_bytes / 2**20)
+
+
+def add_beacons(packets: Iterable[interfaces.BeaconPacket]):
+    """
+        Log a batch of beacons and fold them into the access point inventory
+        in a single transaction.
     """
+    packets = list(packets)
+    if not packets:
+        return
 
     with get_cursor() as cursor:
-        cursor.execute(sql)
+        BeaconPacket.insert_many(cursor, packets)
+        APInventory.upsert_many(cursor, packets)
+
+def add_packet_if_unauthorized(packet: interfaces.BeaconPacket) -> bool:
+    """
+        Log a beacon unless its BSSID is allow listed.
+
+        Returns: True if the packet was logged.
+    """
+    return add_unauthorized_packets([packet]) == 1
+
+
+def add_unauthorized_packets(packets: Iterable[interfaces.BeaconPacket]) -> int:
+    """
+        Log the beacons whose BSSIDs are not allow listed in one batch. The
+        allow list is checked against `ALLOW_LIST`, so authorized packets do
+        not cost a round trip.
+
+        Returns: The number of packets logged.
+    """
+    allowed = ALLOW_LIST.bssids()
+    packets = [p for p in packets if p.bssid.lower() not in allowed]
+    add_beacons(packets)
+    return len(packets)
 
 class AppQueries:
     """
@@ -357,67 +1793,155 @@ class AppQueries:
     """
 
     @staticmethod
-    def latest_beacons():
-        with get_cursor() as cursor:
-            table = BeaconPacket.name
-            cursor.execute(
-                f"""
-                    select ap.* from beacon_packet ap
-                    inner join
-                        (
-                            select max(bp.time) as time, bp.bssid
-                            from beacon_packet bp
-                            group by bssid
-                        ) as foo
-                    on ap.time = foo.time and ap.bssid = foo.bssid;
-                """
-            )
-            beacons = cursor.fetchall()
-            return [BeaconPacket.inflate_row(b) for b in beacons]
+    def latest_beacons(since: Optional[datetime] = None) -> List[interfaces.AccessPoint]:
+        """Every access point, or only those seen after `since`."""
+        if since is None:
+            return APInventory.select("ORDER BY bssid")
+        return APInventory.select("WHERE last_seen > %s ORDER BY bssid", (Table.format_date(since),))
 
     @staticmethod
-    def unauthorized_beacons():
-        with get_cursor() as cursor:
-            table = BeaconPacket.name
-            cursor.execute("""
-                select ap.* from beacon_packet ap
-                inner join (
-                    select max(bp.time) as time, bp.bssid
-                    from beacon_packet bp
-                    group by bssid
-                ) as foo on ap.time = foo.time and ap.bssid = foo.bssid
-                inner join (
-		            select bssid from allowed_beacons ab
-	            ) as bar
-	            on bar.bssid != ap.bssid;
-            """)
-            beacons = cursor.fetchall()
-            return [BeaconPacket.inflate_row(b) for b in beacons]
+    def inventory_state(bssids: Optional[Sequence[str]] = None) -> Tuple[int, Optional[datetime], int]:
+        """
+            (access points, latest last_seen, total beacons) of the inventory,
+            or of the given BSSIDs. Changes whenever a beacon is logged, so it
+            can be used to tell whether anything derived from beacons changed.
+        """
+        sql = f"SELECT count(*), max(last_seen), coalesce(sum(beacon_count), 0) FROM {APInventory.name}"
+        values = None
+        if bssids is not None:
+            sql += " WHERE bssid = ANY(%s::macaddr[])"
+            values = (list(bssids),)
+
+        with get_read_cursor() as cursor:
+            cursor.execute(sql, values)
+            count, last_seen, beacons = cursor.fetchone()
+
+        if last_seen is not None:
+            last_seen = last_seen.replace(tzinfo=UTC)
+        return count, last_seen, int(beacons)
 
     @staticmethod
-    def evil_twins():
-        with get_cursor() as cursor:
-            bp_table = BeaconPacket.name
-            ap_table = AllowedBeacons.name
+    def unauthorized_beacons() -> List[interfaces.AccessPoint]:
+        columns = ",".join(f"inv.{c}" for c in APInventory.column_names())
+        with get_read_cursor() as cursor:
             cursor.execute(f"""
-            select max(bp1.time) as time, bp1.bssid, bp1.ssid, bp1.channel
-            from {bp_table} bp1
-            where bp1.ssid in (
-	            select distinct(bp2.ssid) from {bp_table} bp2 where bp2.bssid in (select distinct(ab1.bssid) from {ap_table} ab1)
-            )
-            and bp1.bssid not in (
-	            select distinct(ab2.bssid) from {ap_table} ab2
-            ) group by bp1.bssid, bp1.ssid, bp1.channel;
+                SELECT {columns}
+                FROM {APInventory.name} inv
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {AllowedBeacons.name} ab WHERE ab.bssid = inv.bssid
+                )
+                ORDER BY inv.bssid;
             """)
+            return [APInventory.inflate_row(r) for r in cursor.fetchall()]
+
+    @staticmethod
+    def first_seen(bssids: Sequence[str], since: datetime) -> Optional[datetime]:
+        """Start of the first hour after `since` in which any of the BSSIDs was seen."""
+        with get_read_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT min(bucket) FROM {BeaconRSSI1h.name}
+                WHERE bssid = ANY(%s::macaddr[]) AND bucket >= %s
+            """, (list(bssids), Table.format_date(since - BeaconRSSI1h.bucket_width)))
+            first_seen, = cursor.fetchone()
+
+        return first_seen.replace(tzinfo=UTC) if first_seen is not None else None
+
+    @staticmethod
+    def rssi_series(bssids: Sequence[str],
+                    since: datetime,
+                    until: datetime,
+                    bucket: timedelta) -> Dict[str, interfaces.RSSISeries]:
+        """
+            RSSI of each BSSID between `since` and `until` in `bucket` wide
+            buckets, computed by a single query. It reads the coarsest RSSI
+            aggregate that is fine enough for `bucket`, or `beacon_packet`
+            (without the payload) for buckets under 10 seconds.
+        """
+        tier = rssi_tier(bucket)
+        if tier is not None:
+            sql = f"""
+            SELECT time_bucket(%(bucket)s, bucket) AS time,
+                   bssid::text,
+                   sum(samples),
+                   sum(rssi * samples) / sum(samples),
+                   min(rssi_min),
+                   max(rssi_max)
+            FROM {tier.name}
+            WHERE bssid = ANY(%(bssids)s::macaddr[]) AND bucket >= %(since)s AND bucket < %(until)s
+            GROUP BY 1, 2
+            ORDER BY 2, 1
+            """
+        else:
+            sql = f"""
+            SELECT time_bucket(%(bucket)s, time) AS time,
+                   bssid::text,
+                   count(*),
+                   avg(rssi),
+                   min(rssi),
+                   max(rssi)
+            FROM {BeaconPacket.name}
+            WHERE bssid = ANY(%(bssids)s::macaddr[]) AND time >= %(since)s AND time < %(until)s
+            GROUP BY 1, 2
+            ORDER BY 2, 1
+            """
+
+        values = {
+            "bucket": bucket,
+            "bssids": list(bssids),
+            # Include the bucket containing `since`
+            "since": Table.format_date(since - bucket),
+            "until": Table.format_date(until),
+        }
+
+        data = {}
+        with get_read_cursor() as cursor:
+            cursor.execute(sql, values)
+            for time, bssid, samples, rssi, rssi_min, rssi_max in cursor.fetchall():
+                series = data.get(bssid)
+                if series is None:
+                    series = data[bssid] = interfaces.RSSISeries(bssid=bssid)
+                series.time.append(time.replace(tzinfo=UTC))
+                series.samples.append(int(samples))
+                series.rssi.append(float(rssi))
+                series.rssi_min.append(rssi_min)
+                series.rssi_max.append(rssi_max)
 
-            beacons = cursor.fetchall()
-            column_names = BeaconPacket.column_names()
-            data = []
-            for row in beacons:
-                record = dict(zip(column_names, row))
-                record['time'] = record['time'].replace(tzinfo=tz.tzutc())
-                data.append(interfaces.BeaconPacket(**record, payload='', rssi=None))
-            return data
+        return data
+
+    @staticmethod
+    def evil_twins(since: Optional[datetime] = None) -> List[interfaces.EvilTwinEvent]:
+        """
+            The latest evil twin event for every rogue BSSID, or only those
+            after `since`. BSSIDs that have been allow listed since are left
+            out.
+        """
+        columns = ",".join(EvilTwinEvent.column_names())
+        where, values = "", None
+        if since is not None:
+            where, values = "AND time > %s", (Table.format_date(since),)
+
+        with get_read_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT DISTINCT ON (bssid) {columns}
+                FROM {EvilTwinEvent.name}
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {AllowedBeacons.name} ab WHERE ab.bssid = {EvilTwinEvent.name}.bssid
+                )
+                {where}
+                ORDER BY bssid, time DESC;
+            """, values)
+            return [EvilTwinEvent.inflate_row(r) for r in cursor.fetchall()]
+
+    @staticmethod
+    def authorized_ssids() -> List[Tuple[str, Optional[str]]]:
+        """(bssid, last seen SSID or None) for every allow listed access point."""
+        with get_read_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT ab.bssid::text, inv.ssid
+                FROM {AllowedBeacons.name} ab
+                LEFT JOIN {APInventory.name} inv ON inv.bssid = ab.bssid;
+            """)
+            return cursor.fetchall()
 
 if __name__ == "__main__":
     init()
@@ -0,0 +1,163 @@
+"""
+    In-stream detection of suspicious access points.
+
+    Detectors look at every beacon as it is captured instead of querying
+    the beacon history, so alerts are raised as soon as a frame arrives.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import threading
+import time
+
+from . import db, interfaces, logger
+
+
+class EvilTwinDetector:
+    """
+        Flags beacons that advertise the SSID of an authorized access point
+        from a BSSID that is not on the allow list.
+
+        The SSIDs of authorized access points are looked up in the access
+        point inventory and learned from their beacons as they are seen, so
+        checking a beacon is a couple of dictionary lookups. The index is
+        reloaded by `refresh`, which `start` runs on a background thread so
+        capture threads calling `check` never wait for the database.
+
+        Args:
+            cooldown
+                Seconds before another event is reported for the same rogue
+                BSSID.
+            reload_interval
+                Seconds between reloads of the allow list. Set to 0 to only
+                load it once (or when `allow_list` changes).
+            allow_list
+                Reload as soon as this cache (normally `db.ALLOW_LIST`,
+                invalidated by NOTIFY) returns a different set, so a newly
+                authorized BSSID stops producing events right away.
+            retry_interval
+                Seconds before a failed load is retried.
+            poll_interval
+                Seconds between `refresh` calls of the background thread.
+    """
+
+    def __init__(self,
+                 cooldown: float = 60.0,
+                 reload_interval: float = 60.0,
+                 allow_list: Optional[db.AllowListCache] = None,
+                 retry_interval: float = 5.0,
+                 poll_interval: float = 1.0):
+        self.cooldown = cooldown
+        self.reload_interval = reload_interval
+        self.allow_list = allow_list
+        self.retry_interval = retry_interval
+        self.poll_interval = poll_interval
+        self.authorized: Set[str] = set()
+        # SSID -> authorized BSSIDs advertising it
+        self.ssids: Dict[str, Set[str]] = {}
+        self._last_reported: Dict[str, float] = {}
+        self._loaded = False
+        self._next_reload = 0.0
+        self._retry_at = 0.0
+        # The `allow_list` set the index was built from.
+        self._allowed: Optional[frozenset] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Keep the index up to date from a background thread."""
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="evil-twin-reload", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            self.refresh()
+            if self._stop.wait(self.poll_interval):
+                return
+
+    def load(self, allowed: Iterable[Tuple[str, Optional[str]]]):
+        """Replace the index with (authorized BSSID, SSID or None) pairs."""
+        authorized = set()
+        ssids: Dict[str, Set[str]] = {}
+        for bssid, ssid in allowed:
+            bssid = bssid.lower()
+            authorized.add(bssid)
+            if ssid:
+                ssids.setdefault(ssid, set()).add(bssid)
+
+        self.authorized = authorized
+        self.ssids = ssids
+        self._loaded = True
+        self._next_reload = time.monotonic() + self.reload_interval
+
+    def reload(self):
+        self.load(db.AppQueries.authorized_ssids())
+
+    def refresh(self):
+        """Reload the index if the allow list changed or `reload_interval` has passed."""
+        now = time.monotonic()
+        if now < self._retry_at:
+            return
+
+        try:
+            allowed = self.allow_list.bssids() if self.allow_list is not None else None
+            if (self._loaded
+                    and allowed is self._allowed
+                    and (not self.reload_interval or now < self._next_reload)):
+                return
+
+            self.reload()
+            self._allowed = allowed
+        except Exception as ex:
+            # Keep using the current index, try again later.
+            self._retry_at = now + self.retry_interval
+            logger.error("Failed to load the allow list for evil twin detection: %s", ex)
+
+    def check(self, packet: interfaces.BeaconPacket) -> Optional[interfaces.EvilTwinEvent]:
+        """Returns: An event if `packet` impersonates an authorized access point."""
+        bssid = packet.bssid.lower()
+        if bssid in self.authorized:
+            if packet.ssid and bssid not in self.ssids.get(packet.ssid, ()):
+                self.ssids.setdefault(packet.ssid, set()).add(bssid)
+            return None
+
+        if not packet.ssid or packet.ssid not in self.ssids:
+            return None
+
+        now = time.monotonic()
+        last = self._last_reported.get(bssid)
+        if last is not None and now - last < self.cooldown:
+            return None
+
+        self._last_reported[bssid] = now
+        return interfaces.EvilTwinEvent(time=packet.time,
+                                        bssid=packet.bssid,
+                                        ssid=packet.ssid,
+                                        channel=packet.channel,
+                                        rssi=packet.rssi)
+
+    def check_and_record(self, packets: Iterable[interfaces.BeaconPacket]) -> List[interfaces.EvilTwinEvent]:
+        """Check a batch of beacons and write any events to the database right away."""
+        events = [e for e in map(self.check, packets) if e is not None]
+        if not events:
+            return events
+
+        for event in events:
+            logger.warning("Possible evil twin: %s advertising %r on channel %s (%s dBm)",
+                           event.bssid, event.ssid, event.channel, event.rssi)
+        try:
+            db.EvilTwinEvent.add_many(events)
+        except Exception as ex:
+            logger.error("Failed to record %d evil twin events: %s", len(events), ex)
+
+        return events
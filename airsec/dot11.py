@@ -0,0 +1,205 @@
+"""
+    Lightweight parsers for RadioTap encapsulated 802.11 frames.
+
+    These functions read the fields the Wi-Fi monitor logs straight out of
+    the captured buffer instead of running a full scapy dissection. They
+    accept anything supporting the buffer protocol (bytes, bytearray,
+    memoryview) and never copy the frame.
+"""
+from dataclasses import dataclass
+from typing import Optional, Union
+import struct
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# Frame control byte 0 for a version 0, type management (0), subtype
+# beacon (8) frame: subtype << 4 | type << 2 | version
+BEACON_FRAME_CONTROL = 0x80
+
+DOT11_HEADER_LEN = 24
+# Timestamp (8), beacon interval (2) and capability info (2)
+BEACON_FIXED_PARAMS_LEN = 12
+
+IE_SSID = 0
+IE_DS_PARAMETER_SET = 3
+
+RADIOTAP_FLAGS_FCS = 0x10
+
+# (present bit, alignment, size) for the radiotap fields that precede
+# dBm_AntSignal. Fields are laid out in bit order and aligned to their
+# natural alignment relative to the start of the header.
+_RADIOTAP_TSFT = (0, 8, 8)
+_RADIOTAP_FLAGS = (1, 1, 1)
+_RADIOTAP_RATE = (2, 1, 1)
+_RADIOTAP_CHANNEL = (3, 2, 4)
+_RADIOTAP_FHSS = (4, 2, 2)
+_RADIOTAP_DBM_ANTSIGNAL = (5, 1, 1)
+
+_RADIOTAP_FIELDS = (
+    _RADIOTAP_TSFT,
+    _RADIOTAP_FLAGS,
+    _RADIOTAP_RATE,
+    _RADIOTAP_CHANNEL,
+    _RADIOTAP_FHSS,
+    _RADIOTAP_DBM_ANTSIGNAL,
+)
+
+_RADIOTAP_EXT = 1 << 31
+
+
+@dataclass
+class RadioTapInfo:
+    length: int
+    flags: int = 0
+    frequency: Optional[int] = None
+    dbm_antsignal: Optional[int] = None
+
+
+@dataclass
+class BeaconFrame:
+    bssid: str
+    ssid: Optional[str]
+    channel: Optional[int]
+    rssi: Optional[int]
+
+
+def frequency_to_channel(frequency: int) -> Optional[int]:
+    """Convert a center frequency in MHz to an 802.11 channel number."""
+    if frequency == 2484:
+        return 14
+    if 2412 <= frequency <= 2472:
+        return (frequency - 2407) // 5
+    if 5955 <= frequency <= 7115:
+        return (frequency - 5950) // 5
+    if 5000 <= frequency <= 5925:
+        return (frequency - 5000) // 5
+    return None
+
+
+def channel_to_frequency(channel: int) -> Optional[int]:
+    """
+        Convert a 2.4 or 5 GHz 802.11 channel number to its center frequency
+        in MHz. 6 GHz channel numbers overlap with 5 GHz ones and are not
+        supported.
+    """
+    if channel == 14:
+        return 2484
+    if 1 <= channel <= 13:
+        return 2407 + channel * 5
+    if 32 <= channel <= 177:
+        return 5000 + channel * 5
+    return None
+
+
+def parse_radiotap(buf: Buffer) -> Optional[RadioTapInfo]:
+    """
+        Read the RadioTap header length and the flags, channel and
+        dBm_AntSignal fields. Returns None if the header is malformed.
+    """
+    if len(buf) < 8 or buf[0] != 0:
+        return None
+
+    length, present = struct.unpack_from("<HI", buf, 2)
+    if length > len(buf):
+        return None
+
+    # Skip any extended presence bitmaps; the fields of the first bitmap
+    # start right after the last one.
+    offset = 8
+    word = present
+    while word & _RADIOTAP_EXT:
+        if offset + 4 > length:
+            return None
+        word, = struct.unpack_from("<I", buf, offset)
+        offset += 4
+
+    info = RadioTapInfo(length=length)
+    for bit, align, size in _RADIOTAP_FIELDS:
+        if not present & (1 << bit):
+            continue
+
+        offset = (offset + align - 1) & ~(align - 1)
+        if offset + size > length:
+            return None
+
+        if bit == _RADIOTAP_FLAGS[0]:
+            info.flags = buf[offset]
+        elif bit == _RADIOTAP_CHANNEL[0]:
+            info.frequency, = struct.unpack_from("<H", buf, offset)
+        elif bit == _RADIOTAP_DBM_ANTSIGNAL[0]:
+            info.dbm_antsignal, = struct.unpack_from("<b", buf, offset)
+        offset += size
+
+    return info
+
+
+def frame_type(buf: Buffer) -> Optional[int]:
+    """
+        Return byte 0 of the 802.11 frame control field, or None if the
+        buffer is too short. Only the radiotap length and one byte are read.
+    """
+    if len(buf) < 4:
+        return None
+
+    length = buf[2] | buf[3] << 8
+    if length >= len(buf):
+        return None
+
+    return buf[length]
+
+
+def format_mac(buf: Buffer, offset: int) -> str:
+    return ":".join("%02x" % b for b in buf[offset:offset + 6])
+
+
+def parse_beacon(buf: Buffer) -> Optional[BeaconFrame]:
+    """
+        Parse a RadioTap + 802.11 beacon frame.
+
+        Returns: None if the frame is not a beacon or is truncated.
+    """
+    if frame_type(buf) != BEACON_FRAME_CONTROL:
+        return None
+
+    radiotap = parse_radiotap(buf)
+    if radiotap is None:
+        return None
+
+    start = radiotap.length
+    end = len(buf)
+    if radiotap.flags & RADIOTAP_FLAGS_FCS:
+        end -= 4
+
+    ies = start + DOT11_HEADER_LEN + BEACON_FIXED_PARAMS_LEN
+    if ies > end:
+        return None
+
+    # In beacon frames, addr3 is the BSSID
+    bssid = format_mac(buf, start + 16)
+
+    ssid = None
+    channel = None
+    offset = ies
+    while offset + 2 <= end:
+        ie_id = buf[offset]
+        ie_len = buf[offset + 1]
+        value = offset + 2
+        if value + ie_len > end:
+            break
+
+        if ie_id == IE_SSID and ssid is None:
+            ssid = bytes(buf[value:value + ie_len]).decode("utf-8", errors="backslashreplace")
+        elif ie_id == IE_DS_PARAMETER_SET and ie_len >= 1:
+            channel = buf[value]
+
+        if ssid is not None and channel is not None:
+            break
+        offset = value + ie_len
+
+    if channel is None and radiotap.frequency:
+        channel = frequency_to_channel(radiotap.frequency)
+
+    return BeaconFrame(bssid=bssid,
+                       ssid=ssid,
+                       channel=channel,
+                       rssi=radiotap.dbm_antsignal)
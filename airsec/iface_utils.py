@@ -1,8 +1,9 @@
 """
 This module provides utilities to bring up and configure
 WiFi interfaces. Currently the only supported platform
-is Linux environments that have the `ip` and `iw` commands
-installed.
+is Linux. Interfaces are configured over netlink (nl80211
+and rtnetlink) when available, otherwise by running the
+`ip` and `iw` commands.
 
 The process running these functions must have sufficient
 privileges to perform network configuration commands.
@@ -10,11 +11,18 @@ privileges to perform network configuration commands.
 
 from dataclasses import dataclass
 from functools import wraps
-from typing import List, Union
+from typing import Dict, List, Optional, Union
+import errno
 import os
 import re
 import shutil
 import subprocess
+import time
+
+from . import logger, dot11, nl80211
+
+BACKEND_NETLINK = "netlink"
+BACKEND_SUBPROCESS = "subprocess"
 
 exe_paths = {
     "ip": [
@@ -46,20 +54,101 @@ def get_exe_path(exe_name):
 
 
 def requires_executable(exe_name):
-    path = get_exe_path(exe_name)
-    if not path:
-        raise OSError(f"Cannot find required command: {exe_name}")
-
+    """
+        Raise OSError when the decorated function is called and `exe_name`
+        cannot be found.
+    """
     def wrapper(func):
         @wraps(func)
         def inner(*args, **kwargs):
+            if not get_exe_path(exe_name):
+                raise OSError(f"Cannot find required command: {exe_name}")
             return func(*args, **kwargs)
         return inner
     return wrapper
 
 
-@requires_executable("iw")
+@dataclass
+class ChannelSwitchStats:
+    switches: int = 0
+    failures: int = 0
+    last_latency: float = 0.0
+    max_latency: float = 0.0
+    total_latency: float = 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        if not self.switches:
+            return 0.0
+        return self.total_latency / self.switches
+
+    def record(self, latency: float):
+        self.switches += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.total_latency += latency
+
+
+channel_switch_stats = ChannelSwitchStats()
+
+_backend = BACKEND_NETLINK
+_netlink: Optional[nl80211.NL80211] = None
+# Interface state as of the last `parse_devlist`, by name.
+_interfaces: Dict[str, InterfaceConfig] = {}
+
+
+def set_backend(name: str):
+    """Select how interfaces are configured: "netlink" (default) or "subprocess"."""
+    global _backend, _netlink
+    if name not in (BACKEND_NETLINK, BACKEND_SUBPROCESS):
+        raise ValueError(f"Unknown interface backend: {name}")
+
+    _backend = name
+    if name != BACKEND_NETLINK and _netlink is not None:
+        _netlink.close()
+        _netlink = None
+
+
+def get_netlink() -> Optional[nl80211.NL80211]:
+    """
+        The shared netlink connection, opened on first use. Returns None if
+        the subprocess backend is selected or netlink is not available, in
+        which case the subprocess backend is used from then on.
+    """
+    global _backend, _netlink
+    if _backend != BACKEND_NETLINK:
+        return None
+
+    if _netlink is None:
+        try:
+            _netlink = nl80211.NL80211()
+        except OSError as ex:
+            logger.warning("nl80211 is not available, falling back to ip/iw: %s", ex)
+            _backend = BACKEND_SUBPROCESS
+            return None
+
+    return _netlink
+
+
 def parse_devlist() -> List[InterfaceConfig]:
+    netlink = get_netlink()
+    if netlink is not None:
+        interfaces = [InterfaceConfig(name=iface.name,
+                                      ifindex=str(iface.ifindex),
+                                      wdev=iface.wdev,
+                                      addr=iface.addr,
+                                      type=iface.type)
+                      for iface in netlink.get_interfaces()]
+    else:
+        interfaces = _parse_devlist_iw()
+
+    _interfaces.clear()
+    _interfaces.update((iface.name, iface) for iface in interfaces)
+    return interfaces
+
+
+@requires_executable("iw")
+def _parse_devlist_iw() -> List[InterfaceConfig]:
     interfaces = []
     proc = subprocess.run([get_exe_path("iw"), "dev"],
                            capture_output=True,
@@ -89,7 +178,14 @@ def parse_devlist() -> List[InterfaceConfig]:
     return interfaces
 
 
-def get_iface(name: str) -> Union[InterfaceConfig,None]:
+def get_iface(name: str, refresh: bool = True) -> Union[InterfaceConfig,None]:
+    """
+        Look up an interface by name. With `refresh=False` the state cached
+        by the last `parse_devlist` is used if the interface is in it.
+    """
+    if not refresh and name in _interfaces:
+        return _interfaces[name]
+
     for iface in parse_devlist():
         if iface.name == name:
             return iface
@@ -99,8 +195,40 @@ def get_iface(name: str) -> Union[InterfaceConfig,None]:
 class NoSuchInterface(Exception):
     pass
 
-@requires_executable("ip")
+
+def get_phy_name(iface_name: str) -> str:
+    """Name of the wireless phy (e.g. `phy0`) backing an interface."""
+    try:
+        with open(f"/sys/class/net/{iface_name}/phy80211/name") as file_:
+            return file_.read().strip()
+    except OSError:
+        raise NoSuchInterface(iface_name)
+
+
 @requires_executable("iw")
+def get_supported_channels(iface_name: str) -> List[int]:
+    """
+        Channels the interface's phy can be tuned to, in the order `iw`
+        reports them (2.4 GHz band first). Disabled channels are skipped.
+    """
+    phy = get_phy_name(iface_name)
+    proc = subprocess.run([get_exe_path("iw"), "phy", phy, "info"],
+                          capture_output=True,
+                          check=True,
+                          encoding="utf-8")
+
+    channels = []
+    for line in proc.stdout.split("\n"):
+        match = re.match(r"^\s*\* (?P<freq>[0-9.]+) MHz \[(?P<channel>\d+)\](?P<flags>.*)$", line)
+        if not match or "disabled" in match["flags"]:
+            continue
+
+        channel = int(match["channel"])
+        if channel not in channels:
+            channels.append(channel)
+
+    return channels
+
 def wifi_set_monitor_mode(iface_name: str):
     """
         Set the specified interface into monitor mode.
@@ -121,20 +249,26 @@ def wifi_set_monitor_mode(iface_name: str):
             Raised if there was an error executing the commands to configure the
             interface
 
+        nl80211.NetlinkError
+            Raised if the kernel rejected a netlink configuration request
+
         RuntimeError
             Raised if there is an issue detecting or configuring interface after
             the system commands have executed successfully.
     """
     iface = get_iface(iface_name)
     if not iface:
-        raise NoSuchInterface(iface)
+        raise NoSuchInterface(iface_name)
 
-    ip_cmd = get_exe_path("ip")
-    iw_cmd = get_exe_path("iw")
     if iface.type != "monitor":
-        subprocess.run([ip_cmd, "link", "set", iface.name, "down"], check=True)
-        subprocess.run([iw_cmd, iface.name, "set", "monitor", "control"], check=True)
-        subprocess.run([ip_cmd, "link", "set", iface.name, "up"])
+        netlink = get_netlink()
+        if netlink is not None:
+            ifindex = int(iface.ifindex)
+            netlink.set_link_up(ifindex, False)
+            netlink.set_monitor_mode(ifindex)
+            netlink.set_link_up(ifindex, True)
+        else:
+            _set_monitor_mode_iw(iface.name)
 
         iface = get_iface(iface_name)
         if not iface:
@@ -144,6 +278,59 @@ def wifi_set_monitor_mode(iface_name: str):
             raise RuntimeError(f"Failed to set iterface into monitoring mode: {iface_name}")
 
 
+@requires_executable("ip")
 @requires_executable("iw")
+def _set_monitor_mode_iw(iface_name: str):
+    ip_cmd = get_exe_path("ip")
+    iw_cmd = get_exe_path("iw")
+    subprocess.run([ip_cmd, "link", "set", iface_name, "down"], check=True)
+    subprocess.run([iw_cmd, iface_name, "set", "monitor", "control"], check=True)
+    subprocess.run([ip_cmd, "link", "set", iface_name, "up"])
+
+
 def wifi_set_channel(iface: str, channel: int):
-    subprocess.run(["iw", "dev", iface, "set", "channel", str(channel)], check=True)
\ No newline at end of file
+    """
+        Tune the interface to `channel`. The time taken is recorded in
+        `channel_switch_stats`.
+
+        Raises: NoSuchInterface, nl80211.NetlinkError or
+        subprocess.CalledProcessError if the channel could not be set.
+    """
+    start = time.perf_counter()
+    try:
+        netlink = get_netlink()
+        if netlink is not None:
+            _set_channel_netlink(netlink, iface, channel)
+        else:
+            _set_channel_iw(iface, channel)
+    except Exception:
+        channel_switch_stats.failures += 1
+        raise
+
+    channel_switch_stats.record(time.perf_counter() - start)
+
+
+def _set_channel_netlink(netlink: nl80211.NL80211, iface_name: str, channel: int):
+    frequency = dot11.channel_to_frequency(channel)
+    if frequency is None:
+        raise ValueError(f"Unsupported channel: {channel}")
+
+    iface = get_iface(iface_name, refresh=False)
+    if not iface:
+        raise NoSuchInterface(iface_name)
+
+    try:
+        netlink.set_frequency(int(iface.ifindex), frequency)
+    except nl80211.NetlinkError as ex:
+        if ex.errno != errno.ENODEV:
+            raise
+        # The interface was re-created since it was cached.
+        iface = get_iface(iface_name)
+        if not iface:
+            raise NoSuchInterface(iface_name)
+        netlink.set_frequency(int(iface.ifindex), frequency)
+
+
+@requires_executable("iw")
+def _set_channel_iw(iface: str, channel: int):
+    subprocess.run([get_exe_path("iw"), "dev", iface, "set", "channel", str(channel)], check=True)
\ No newline at end of file
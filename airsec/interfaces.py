@@ -5,13 +5,22 @@
     or tuples.
 
     All interfaces should be defined in this file.
+
+    Records created once per database row or captured frame declare
+    `__slots__` (dataclass(slots=True) needs Python 3.10), which makes them
+    smaller and faster to create. Such dataclasses can not have default
+    values. RF samples are plain tuples, which are cheaper still (see
+    scripts/benchmark_records.py).
 """
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
 from datetime import datetime
+from typing import List, Sequence
 from json import JSONEncoder
 
 @dataclass
 class BeaconPacket:
+    __slots__ = ("time", "bssid", "ssid", "rssi", "channel", "payload")
+
     time: datetime
     bssid: str
     ssid: str
@@ -25,6 +34,7 @@ class BeaconPacketAPI:
         Same structure as a BeaconPacket without the payload to
         make API interface less full.
     """
+    __slots__ = ("time", "bssid", "ssid", "rssi", "channel")
 
     time: datetime
     bssid: str
@@ -40,6 +50,14 @@ class BeaconPacketAPI:
                    rssi=bp.rssi,
                    channel=bp.channel)
 
+    @classmethod
+    def from_access_point(cls, ap: "AccessPoint"):
+        return cls(time=ap.last_seen,
+                   bssid=ap.bssid,
+                   ssid=ap.ssid,
+                   rssi=ap.rssi,
+                   channel=ap.channel)
+
     @classmethod
     def from_json_dict(cls, obj):
         return cls(
@@ -51,10 +69,105 @@ class BeaconPacketAPI:
         )
 
     def to_dict(self):
-        d = self.__dict__
+        return {
+            "time": self.time.isoformat(),
+            "bssid": self.bssid,
+            "ssid": self.ssid,
+            "rssi": self.rssi,
+            "channel": self.channel,
+        }
+
+    @classmethod
+    def to_columns(cls, beacons: Sequence["BeaconPacketAPI"]):
+        """One list per field instead of one dict per beacon, to skip repeating the keys."""
+        return {
+            "time": [b.time.isoformat() for b in beacons],
+            "bssid": [b.bssid for b in beacons],
+            "ssid": [b.ssid for b in beacons],
+            "rssi": [b.rssi for b in beacons],
+            "channel": [b.channel for b in beacons],
+        }
+
+@dataclass
+class AccessPoint:
+    """The latest state of an access point, as kept in the inventory."""
+    __slots__ = ("bssid", "first_seen", "last_seen", "ssid", "channel", "rssi", "beacon_count")
+
+    bssid: str
+    first_seen: datetime
+    last_seen: datetime
+    ssid: str
+    channel: int
+    rssi: int
+    beacon_count: int
+
+@dataclass
+class EvilTwinEvent:
+    """A beacon advertising an authorized SSID from an unknown BSSID."""
+    __slots__ = ("time", "bssid", "ssid", "channel", "rssi")
+
+    time: datetime
+    bssid: str
+    ssid: str
+    channel: int
+    rssi: int
+
+@dataclass
+class RSSIBucket:
+    """
+        RSSI summary of the beacons seen from one BSSID in a time bucket.
+        `rssi` is the mean so buckets can be charted like raw packets.
+    """
+
+    time: datetime
+    bssid: str
+    samples: int
+    rssi: float
+    rssi_min: int
+    rssi_max: int
+
+    def to_dict(self):
+        d = dict(self.__dict__)
         d['time'] = d['time'].isoformat()
         return d
 
+@dataclass
+class RFPowerBucket:
+    """
+        Power summary of one frequency bin over a time bucket. `rssi` is the
+        mean, the percentiles are estimated from a 2 dB histogram.
+    """
+    __slots__ = ("time", "center_frequency", "samples", "rssi", "rssi_min", "rssi_max",
+                 "rssi_p50", "rssi_p90")
+
+    time: datetime
+    center_frequency: float
+    samples: int
+    rssi: float
+    rssi_min: float
+    rssi_max: float
+    rssi_p50: float
+    rssi_p90: float
+
+@dataclass
+class RSSISeries:
+    """
+        Columnar RSSI buckets of one BSSID: element i of each list describes
+        the bucket starting at `time[i]`.
+    """
+
+    bssid: str
+    time: List[datetime] = field(default_factory=list)
+    samples: List[int] = field(default_factory=list)
+    rssi: List[float] = field(default_factory=list)
+    rssi_min: List[int] = field(default_factory=list)
+    rssi_max: List[int] = field(default_factory=list)
+
+    def to_dict(self):
+        d = dict(self.__dict__)
+        d['time'] = [t.isoformat() for t in self.time]
+        return d
+
 @dataclass
 class AllowedBeacon:
     bssid: str
@@ -67,8 +180,7 @@ class BeaconPacketEncoder(JSONEncoder):
 
     def default(self, obj):
         if isinstance(obj, (BeaconPacket, BeaconPacketAPI)):
-            data = obj.__dict__
-            return data
+            return {f.name: getattr(obj, f.name) for f in fields(obj)}
         elif isinstance(obj, datetime):
             return obj.isoformat()
 
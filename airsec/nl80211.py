@@ -0,0 +1,272 @@
+"""
+    Minimal netlink client for configuring wireless interfaces without
+    spawning `iw` and `ip`.
+
+    Only the handful of nl80211 (generic netlink) and rtnetlink requests the
+    Wi-Fi monitor needs are implemented: listing wireless interfaces,
+    changing the interface type, tuning the channel and setting the link up
+    or down. Sockets are opened once and reused for every request.
+"""
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+import errno
+import os
+import socket
+import struct
+import threading
+
+NETLINK_ROUTE = 0
+NETLINK_GENERIC = 16
+
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+NLM_F_DUMP = 0x300
+
+NLMSG_ERROR = 0x2
+NLMSG_DONE = 0x3
+
+NLA_F_NESTED = 0x8000
+NLA_TYPE_MASK = 0x3fff
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_NLATTR = struct.Struct("=HH")
+_GENLMSGHDR = struct.Struct("=BBH")
+_IFINFOMSG = struct.Struct("=BxHiII")
+
+# Generic netlink controller
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+
+# rtnetlink
+RTM_NEWLINK = 16
+IFF_UP = 0x1
+
+# nl80211 commands
+NL80211_CMD_SET_WIPHY = 2
+NL80211_CMD_GET_INTERFACE = 5
+NL80211_CMD_SET_INTERFACE = 6
+
+# nl80211 attributes
+NL80211_ATTR_WIPHY = 1
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_IFNAME = 4
+NL80211_ATTR_IFTYPE = 5
+NL80211_ATTR_MAC = 6
+NL80211_ATTR_MNTR_FLAGS = 23
+NL80211_ATTR_WIPHY_FREQ = 38
+NL80211_ATTR_WDEV = 153
+
+NL80211_MNTR_FLAG_CONTROL = 3
+NL80211_MNTR_FLAG_OTHER_BSS = 4
+
+# Interface types, named the way `iw dev` prints them.
+IFTYPE_NAMES = {
+    0: "unspecified",
+    1: "IBSS",
+    2: "managed",
+    3: "AP",
+    4: "AP/VLAN",
+    5: "WDS",
+    6: "monitor",
+    7: "mesh point",
+    8: "P2P-client",
+    9: "P2P-GO",
+    10: "P2P-device",
+    11: "outside context of a BSS",
+    12: "NAN",
+}
+NL80211_IFTYPE_MONITOR = 6
+
+RECV_BUFFER_SIZE = 1 << 16
+SOCKET_TIMEOUT = 2.0
+
+
+class NetlinkError(OSError):
+    """Error reply from the kernel to a netlink request."""
+
+
+@dataclass
+class WirelessInterface:
+    name: str
+    ifindex: int
+    wiphy: int
+    wdev: int = 0
+    addr: str = ""
+    type: str = ""
+    frequency: Optional[int] = None
+
+
+def pack_attr(attr_type: int, value: bytes) -> bytes:
+    """Encode a netlink attribute, padded to 4 bytes."""
+    length = _NLATTR.size + len(value)
+    padding = b"\0" * (-length % 4)
+    return _NLATTR.pack(length, attr_type) + value + padding
+
+
+def pack_u32(attr_type: int, value: int) -> bytes:
+    return pack_attr(attr_type, struct.pack("=I", value))
+
+
+def pack_string(attr_type: int, value: str) -> bytes:
+    return pack_attr(attr_type, value.encode() + b"\0")
+
+
+def pack_flags(attr_type: int, flags: Iterable[int]) -> bytes:
+    """Nested attribute made of empty flag attributes."""
+    return pack_attr(attr_type | NLA_F_NESTED, b"".join(pack_attr(f, b"") for f in flags))
+
+
+def parse_attrs(data: bytes, offset: int = 0) -> Dict[int, bytes]:
+    attrs = {}
+    while offset + _NLATTR.size <= len(data):
+        length, attr_type = _NLATTR.unpack_from(data, offset)
+        if length < _NLATTR.size:
+            break
+        attrs[attr_type & NLA_TYPE_MASK] = data[offset + _NLATTR.size:offset + length]
+        offset += (length + 3) & ~3
+    return attrs
+
+
+def format_mac(value: bytes) -> str:
+    return ":".join("%02x" % b for b in value)
+
+
+class NetlinkSocket:
+    """
+        A netlink socket that sends one request at a time and collects the
+        replies until the kernel acknowledges it or ends the dump.
+    """
+
+    def __init__(self, protocol: int):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, protocol)
+        self.sock.settimeout(SOCKET_TIMEOUT)
+        self.sock.bind((0, 0))
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.sock.close()
+
+    def request(self, msg_type: int, payload: bytes, flags: int = 0) -> List[Tuple[int, bytes]]:
+        """
+            Send a request and return the (message type, payload) of every
+            reply.
+
+            Raises: NetlinkError if the kernel rejects the request or does
+            not reply within SOCKET_TIMEOUT.
+        """
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            header = _NLMSGHDR.pack(_NLMSGHDR.size + len(payload),
+                                    msg_type,
+                                    flags | NLM_F_REQUEST | NLM_F_ACK,
+                                    seq,
+                                    0)
+            self.sock.send(header + payload)
+            return self._receive(seq)
+
+    def _receive(self, seq: int) -> List[Tuple[int, bytes]]:
+        replies = []
+        while True:
+            try:
+                data = self.sock.recv(RECV_BUFFER_SIZE)
+            except socket.timeout:
+                # A late reply is skipped by the next request, it has an
+                # older sequence number.
+                raise NetlinkError(errno.ETIMEDOUT, "No netlink reply within %.1fs" % SOCKET_TIMEOUT)
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                length, msg_type, _, msg_seq, _ = _NLMSGHDR.unpack_from(data, offset)
+                if length < _NLMSGHDR.size:
+                    raise NetlinkError("Malformed netlink message")
+
+                body = data[offset + _NLMSGHDR.size:offset + length]
+                offset += (length + 3) & ~3
+                if msg_seq != seq:
+                    continue
+
+                if msg_type == NLMSG_DONE:
+                    return replies
+                if msg_type == NLMSG_ERROR:
+                    error, = struct.unpack_from("=i", body)
+                    if error:
+                        raise NetlinkError(-error, os.strerror(-error))
+                    return replies
+                replies.append((msg_type, body))
+
+
+class NL80211:
+    """
+        nl80211 and rtnetlink requests over two long lived sockets.
+
+        Raises: NetlinkError (an OSError) if netlink or the nl80211 family is
+        not available, e.g. because the cfg80211 module is not loaded.
+    """
+
+    def __init__(self):
+        self.genl = NetlinkSocket(NETLINK_GENERIC)
+        try:
+            self.family_id = self._resolve_family("nl80211")
+            self.route = NetlinkSocket(NETLINK_ROUTE)
+        except OSError:
+            self.genl.close()
+            raise
+
+    def close(self):
+        self.genl.close()
+        self.route.close()
+
+    def _resolve_family(self, name: str) -> int:
+        payload = _GENLMSGHDR.pack(CTRL_CMD_GETFAMILY, 1, 0) + pack_string(CTRL_ATTR_FAMILY_NAME, name)
+        for _, body in self.genl.request(GENL_ID_CTRL, payload):
+            attrs = parse_attrs(body, _GENLMSGHDR.size)
+            if CTRL_ATTR_FAMILY_ID in attrs:
+                return struct.unpack("=H", attrs[CTRL_ATTR_FAMILY_ID][:2])[0]
+        raise NetlinkError(f"Generic netlink family not found: {name}")
+
+    def _command(self, cmd: int, attrs: bytes = b"", flags: int = 0) -> List[Dict[int, bytes]]:
+        payload = _GENLMSGHDR.pack(cmd, 0, 0) + attrs
+        return [parse_attrs(body, _GENLMSGHDR.size) for _, body in self.genl.request(self.family_id, payload, flags)]
+
+    def get_interfaces(self) -> List[WirelessInterface]:
+        return [self._interface(attrs)
+                for attrs in self._command(NL80211_CMD_GET_INTERFACE, flags=NLM_F_DUMP)
+                if NL80211_ATTR_IFNAME in attrs]
+
+    def get_interface(self, ifindex: int) -> Optional[WirelessInterface]:
+        replies = self._command(NL80211_CMD_GET_INTERFACE, pack_u32(NL80211_ATTR_IFINDEX, ifindex))
+        return self._interface(replies[0]) if replies else None
+
+    @staticmethod
+    def _interface(attrs: Dict[int, bytes]) -> WirelessInterface:
+        def u32(attr):
+            return struct.unpack("=I", attrs[attr][:4])[0] if attr in attrs else None
+
+        iftype = u32(NL80211_ATTR_IFTYPE)
+        wdev = struct.unpack("=Q", attrs[NL80211_ATTR_WDEV][:8])[0] if NL80211_ATTR_WDEV in attrs else 0
+        return WirelessInterface(name=attrs[NL80211_ATTR_IFNAME].rstrip(b"\0").decode(),
+                                 ifindex=u32(NL80211_ATTR_IFINDEX),
+                                 wiphy=u32(NL80211_ATTR_WIPHY),
+                                 wdev=wdev,
+                                 addr=format_mac(attrs.get(NL80211_ATTR_MAC, b"")),
+                                 type=IFTYPE_NAMES.get(iftype, str(iftype)),
+                                 frequency=u32(NL80211_ATTR_WIPHY_FREQ))
+
+    def set_monitor_mode(self, ifindex: int, flags: Iterable[int] = (NL80211_MNTR_FLAG_CONTROL,)):
+        """Change the interface type to monitor. The link must be down."""
+        attrs = (pack_u32(NL80211_ATTR_IFINDEX, ifindex)
+                 + pack_u32(NL80211_ATTR_IFTYPE, NL80211_IFTYPE_MONITOR)
+                 + pack_flags(NL80211_ATTR_MNTR_FLAGS, flags))
+        self._command(NL80211_CMD_SET_INTERFACE, attrs)
+
+    def set_frequency(self, ifindex: int, frequency: int):
+        """Tune the interface to a 20MHz channel at `frequency` MHz."""
+        attrs = pack_u32(NL80211_ATTR_IFINDEX, ifindex) + pack_u32(NL80211_ATTR_WIPHY_FREQ, frequency)
+        self._command(NL80211_CMD_SET_WIPHY, attrs)
+
+    def set_link_up(self, ifindex: int, up: bool = True):
+        payload = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, ifindex, IFF_UP if up else 0, IFF_UP)
+        self.route.request(RTM_NEWLINK, payload)
@@ -0,0 +1,401 @@
+"""
+    Multi-process capture -> parse -> write pipeline for the Wi-Fi monitor.
+
+    Each stage runs in its own process so capture, frame parsing and
+    database inserts are not serialized on one interpreter lock:
+
+        capture --frames--> parse (x N) --beacons--> write
+
+    Stages exchange batches through bounded multiprocessing queues. The
+    supervising process (which also does the channel hopping) restarts
+    stages that crash, reports per-stage throughput and shuts the stages
+    down in order so everything captured before a stop is written.
+"""
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import multiprocessing as mp
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+
+from . import (
+    channel_hopper,
+    config,
+    db,
+    logger,
+    wifi_scanner,
+    writer
+)
+
+# Stages are spawned rather than forked so they never inherit the parent's
+# database connection or scapy state.
+CONTEXT = mp.get_context("spawn")
+
+# How often (seconds) blocked stages check whether they should exit.
+POLL_TIMEOUT = 0.5
+# Minimum seconds between restarts of the same stage.
+RESTART_BACKOFF = 5.0
+REPORT_INTERVAL = 60.0
+
+
+@dataclass
+class PipelineConfig:
+    # Number of parser processes.
+    parse_workers: int = 1
+    # Maximum number of batches waiting between two stages.
+    queue_size: int = 256
+    # Frames per batch sent from the capture stage, and the longest a
+    # partial batch is held back.
+    capture_batch_size: int = 64
+    capture_batch_interval_ms: int = 100
+
+
+class StageCounters:
+    """Shared memory counters written by a stage and read by the supervisor."""
+
+    FIELDS = ("received", "emitted", "dropped", "errors")
+
+    def __init__(self):
+        for name in self.FIELDS:
+            setattr(self, name, CONTEXT.Value("Q", 0, lock=False))
+
+    def snapshot(self) -> Dict[str, int]:
+        return {name: getattr(self, name).value for name in self.FIELDS}
+
+
+def _ignore_signals():
+    # The supervisor coordinates shutdown, so stages ignore the signals a
+    # service manager or terminal sends to the whole process group.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+def _orphaned(parent_pid: int) -> bool:
+    return os.getppid() != parent_pid
+
+
+class TunedChannel:
+    """
+        Shared record of the last channel switch so the capture stage can tag
+        frames with the channel the radio was tuned to when they were
+        captured, even if they are read from the ring after the next hop.
+    """
+
+    def __init__(self):
+        # [switch time (epoch seconds), current channel, previous channel]
+        self.state = CONTEXT.Array("d", [0.0, 0.0, 0.0], lock=False)
+
+    def update(self, scheduler: channel_hopper.HopScheduler):
+        self.state[2] = scheduler.previous or 0
+        self.state[1] = scheduler.current or 0
+        self.state[0] = scheduler.switched_at_wallclock
+
+    def channel_at(self, timestamp: float) -> Optional[int]:
+        switched_at, current, previous = self.state[:]
+        channel = int(current if timestamp >= switched_at else previous)
+        return channel or None
+
+
+def capture_stage(scanner_config: wifi_scanner.WifiScannerConfig,
+                  pipeline_config: PipelineConfig,
+                  frames: mp.Queue,
+                  tuned: TunedChannel,
+                  stop: Any,
+                  counters: StageCounters,
+                  parent_pid: int):
+    _ignore_signals()
+    batch_size = pipeline_config.capture_batch_size
+    batch_interval = pipeline_config.capture_batch_interval_ms / 1000
+
+    with wifi_scanner.create_capture(scanner_config) as cap:
+        def watch():
+            while not stop.wait(POLL_TIMEOUT):
+                if _orphaned(parent_pid):
+                    break
+            cap.stop()
+
+        threading.Thread(target=watch, daemon=True).start()
+
+        batch: List[Tuple[float, bytes, Optional[int]]] = []
+        deadline = time.monotonic() + batch_interval
+        for timestamp, frame in cap.frames():
+            counters.received.value += 1
+            # Frames only live in the ring until the next one is read.
+            batch.append((timestamp, bytes(frame), tuned.channel_at(timestamp)))
+            if len(batch) >= batch_size or time.monotonic() >= deadline:
+                _send(frames, batch, counters)
+                batch = []
+                deadline = time.monotonic() + batch_interval
+
+        if batch:
+            _send(frames, batch, counters)
+
+        wifi_scanner.log_capture_stats(scanner_config.iface, cap.update_stats())
+
+
+def _send(out: mp.Queue, batch: List[Any], counters: StageCounters):
+    try:
+        out.put_nowait(batch)
+        counters.emitted.value += len(batch)
+    except queue.Full:
+        counters.dropped.value += len(batch)
+
+
+def _batches(source: mp.Queue, stop: Any, parent_pid: int):
+    """Yield batches from `source` until `stop` is set and it is drained."""
+    while True:
+        try:
+            yield source.get(timeout=POLL_TIMEOUT)
+        except queue.Empty:
+            if stop.is_set() or _orphaned(parent_pid):
+                return
+
+
+def parse_stage(frames: mp.Queue,
+                beacons: mp.Queue,
+                observations: mp.Queue,
+                stop: Any,
+                counters: StageCounters,
+                parent_pid: int):
+    _ignore_signals()
+    for batch in _batches(frames, stop, parent_pid):
+        counters.received.value += len(batch)
+        packets = []
+        seen = []
+        for timestamp, frame, tuned_channel in batch:
+            try:
+                packet = wifi_scanner.beacon_from_frame(frame, timestamp, tuned_channel)
+            except Exception as ex:
+                counters.errors.value += 1
+                logger.debug("Failed to parse frame: %s", ex)
+                continue
+            if packet is not None:
+                packets.append(packet)
+                seen.append((tuned_channel, packet.bssid))
+
+        if seen:
+            # Feedback for the hop scheduler is best effort.
+            try:
+                observations.put_nowait(seen)
+            except queue.Full:
+                pass
+
+        if packets:
+            # Block (briefly) rather than drop when the writer falls behind;
+            # the capture stage drops instead so the kernel ring keeps moving.
+            try:
+                beacons.put(packets, timeout=POLL_TIMEOUT)
+                counters.emitted.value += len(packets)
+            except queue.Full:
+                counters.dropped.value += len(packets)
+
+
+def write_stage(airsec_config: config.AirsecConfig,
+                scanner_config: wifi_scanner.WifiScannerConfig,
+                beacons: mp.Queue,
+                stop: Any,
+                counters: StageCounters,
+                parent_pid: int):
+    _ignore_signals()
+    db.init(airsec_config)
+    beacon_writer = wifi_scanner.create_beacon_writer(scanner_config)
+    beacon_writer.start()
+    detector = wifi_scanner.create_evil_twin_detector(scanner_config)
+    try:
+        for batch in _batches(beacons, stop, parent_pid):
+            counters.received.value += len(batch)
+            # Before queueing so events do not wait for the batch flush.
+            detector.check_and_record(batch)
+            for packet in batch:
+                if not beacon_writer.put(packet):
+                    counters.dropped.value += 1
+            _update_write_counters(counters, beacon_writer)
+    finally:
+        detector.stop()
+        beacon_writer.stop()
+        _update_write_counters(counters, beacon_writer)
+        beacon_writer.report()
+        db.DATABASE.report()
+        db.DATABASE.close()
+
+
+def _update_write_counters(counters: StageCounters, beacon_writer: writer.BatchWriter):
+    counters.emitted.value = beacon_writer.stats.rows
+    counters.errors.value = beacon_writer.stats.failed_batches
+
+
+class Stage:
+    """A supervised pipeline process that is restarted if it dies."""
+
+    def __init__(self, name: str, target: Callable, args: Tuple, stop: Any):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.stop = stop
+        self.counters = StageCounters()
+        self.restarts = 0
+        self.process: Optional[mp.Process] = None
+        self._last_start = 0.0
+
+    def start(self):
+        self.process = CONTEXT.Process(target=self.target,
+                                       name=f"airsec-{self.name}",
+                                       args=self.args + (self.stop, self.counters, os.getpid()),
+                                       daemon=True)
+        self.process.start()
+        self._last_start = time.monotonic()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def restart_if_dead(self) -> bool:
+        if self.alive or self.stop.is_set():
+            return False
+
+        if time.monotonic() - self._last_start < RESTART_BACKOFF:
+            return False
+
+        logger.error("Pipeline stage %s exited with code %s, restarting",
+                     self.name, self.process.exitcode if self.process else None)
+        self.restarts += 1
+        self.start()
+        return True
+
+    def join(self, timeout: float):
+        if self.process is None:
+            return
+
+        self.process.join(timeout)
+        if self.process.is_alive():
+            logger.warning("Pipeline stage %s did not exit, terminating", self.name)
+            self.process.terminate()
+            self.process.join(timeout)
+
+
+class Pipeline:
+    """
+        Supervisor for the capture, parse and write stages.
+
+        Args:
+            scanner_config
+                Capture and beacon writer settings.
+            airsec_config
+                Used by the write stage to connect to the database.
+            pipeline_config
+                Process and queue sizing.
+    """
+
+    def __init__(self,
+                 scanner_config: wifi_scanner.WifiScannerConfig,
+                 airsec_config: config.AirsecConfig,
+                 pipeline_config: Optional[PipelineConfig] = None):
+        pipeline_config = pipeline_config or PipelineConfig()
+        self.frames = CONTEXT.Queue(pipeline_config.queue_size)
+        self.beacons = CONTEXT.Queue(pipeline_config.queue_size)
+        self.observations = CONTEXT.Queue(pipeline_config.queue_size)
+        self.tuned = TunedChannel()
+
+        # Separate events so stages can be stopped front to back and each
+        # one drains its input before exiting.
+        capture_stop = CONTEXT.Event()
+        parse_stop = CONTEXT.Event()
+        write_stop = CONTEXT.Event()
+
+        self.tiers: List[List[Stage]] = [
+            [Stage("capture", capture_stage, (scanner_config, pipeline_config, self.frames, self.tuned), capture_stop)],
+            [Stage(f"parse-{i}", parse_stage, (self.frames, self.beacons, self.observations), parse_stop)
+             for i in range(max(1, pipeline_config.parse_workers))],
+            [Stage("write", write_stage, (airsec_config, scanner_config, self.beacons), write_stop)],
+        ]
+        self._last_report = time.monotonic()
+        self._last_counts: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def stages(self) -> List[Stage]:
+        return [stage for tier in self.tiers for stage in tier]
+
+    def start(self):
+        # Start from the back so consumers are ready before producers.
+        for tier in reversed(self.tiers):
+            for stage in tier:
+                stage.start()
+
+    def on_hop(self, scheduler: channel_hopper.HopScheduler):
+        """Publish a channel switch to the capture stage and collect feedback."""
+        self.tuned.update(scheduler)
+        while True:
+            try:
+                seen = self.observations.get_nowait()
+            except queue.Empty:
+                break
+            for channel, bssid in seen:
+                if channel is not None:
+                    scheduler.observe(channel, bssid)
+
+        self.supervise()
+
+    def supervise(self):
+        """Restart crashed stages and periodically log throughput."""
+        for stage in self.stages:
+            stage.restart_if_dead()
+
+        now = time.monotonic()
+        if now - self._last_report >= REPORT_INTERVAL:
+            self.report(now - self._last_report)
+            self._last_report = now
+
+    def report(self, elapsed: float):
+        for stage in self.stages:
+            counts = stage.counters.snapshot()
+            last = self._last_counts.get(stage.name, {})
+            rate = (counts["received"] - last.get("received", 0)) / elapsed if elapsed else 0.0
+            self._last_counts[stage.name] = counts
+            logger.info("Pipeline stage %s: %.1f items/s in, %d in, %d out, %d dropped, "
+                        "%d errors, %d restarts",
+                        stage.name,
+                        rate,
+                        counts["received"],
+                        counts["emitted"],
+                        counts["dropped"],
+                        counts["errors"],
+                        stage.restarts)
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the stages front to back, letting each drain its input."""
+        for tier in self.tiers:
+            for stage in tier:
+                stage.stop.set()
+            for stage in tier:
+                stage.join(timeout)
+
+        self.report(time.monotonic() - self._last_report)
+
+
+def run(scanner_config: wifi_scanner.WifiScannerConfig,
+        airsec_config: config.AirsecConfig,
+        pipeline_config: Optional[PipelineConfig] = None):
+    """
+        Start the pipeline and hop channels on this process until
+        interrupted. SIGTERM and SIGINT trigger an orderly shutdown.
+    """
+    def terminate(signum, frame):
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+
+    scheduler = wifi_scanner.create_hop_scheduler(scanner_config)
+    pipeline = Pipeline(scanner_config, airsec_config, pipeline_config)
+    pipeline.start()
+    try:
+        wifi_scanner.hop_channels(scanner_config.iface,
+                                  scheduler,
+                                  on_hop=lambda channel: pipeline.on_hop(scheduler))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info("Stopping Wi-Fi monitor pipeline")
+        pipeline.stop()
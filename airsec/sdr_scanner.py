@@ -1,8 +1,15 @@
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
 import subprocess
+import time
 import dateutil.parser
-from . import db
+import numpy as np
+from . import db, logger
+
+STORAGE_ROWS = "rows"
+STORAGE_SWEEPS = "sweeps"
 
 @dataclass
 class SDRScannerConfig:
@@ -11,7 +18,7 @@ class SDRScannerConfig:
     bin_size: str
     integration_interval_seconds: int = 10
     tuner_gain: Optional[int] = None
-
+    storage: str = STORAGE_ROWS
 
 def parse_rtl_power_line(line: str):
     columns = [
@@ -24,7 +31,7 @@ def parse_rtl_power_line(line: str):
     ]
 
     data = [s.strip() for s in line.split(",")]
-    dbms = [float(d) for d in data[len(columns)+1:]]
+    dbms = [float(d) for d in data[len(columns):]]
     params = dict(zip(columns, data[0:len(columns)]))
 
     for col in ['hz_low', 'hz_high', 'hz_step']:
@@ -38,7 +45,160 @@ def parse_rtl_power_line(line: str):
     return params
 
 
+@dataclass
+class RTLPowerSegment:
+    """
+        All lines of an rtl_power block that cover the same tuner hop.
+
+        Attributes:
+            timestamps
+                datetime64[s] array with one entry per line.
+            frequencies
+                Center frequency of every bin, shared (read-only) between
+                segments with the same (hz_low, hz_step, bins) key.
+            power
+                dBm readings with shape (len(timestamps), len(frequencies)).
+    """
+    hz_low: float
+    hz_step: float
+    timestamps: np.ndarray
+    frequencies: np.ndarray
+    power: np.ndarray
+
+    def datetimes(self) -> List[datetime]:
+        return self.timestamps.astype(datetime).tolist()
+
+
+@lru_cache(maxsize=256)
+def frequency_axis(hz_low: float, hz_step: float, bins: int) -> np.ndarray:
+    # Same arithmetic as parse_rtl_power_line so frequencies match exactly.
+    axis = hz_low + np.arange(bins, dtype=np.float64) * hz_step
+    axis.setflags(write=False)
+    return axis
+
+
+@lru_cache(maxsize=64)
+def parse_rtl_power_timestamp(date: str, time_: str) -> np.datetime64:
+    # rtl_power always writes "YYYY-MM-DD, HH:MM:SS" which is ISO 8601 once
+    # joined, so numpy can decode it without guessing the format.
+    return np.datetime64(f"{date.strip()}T{time_.strip()}", "s")
+
+
+def parse_rtl_power_block(lines: Iterable[str]) -> List[RTLPowerSegment]:
+    """
+        Parse a block of rtl_power CSV output into one `RTLPowerSegment` per
+        tuner hop, ordered by frequency. Each segment's readings are decoded
+        with a single numpy call instead of per-value float conversions.
+    """
+    groups: Dict[Tuple[float, float, int], Tuple[list, list]] = {}
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        date, time_, hz_low, _hz_high, hz_step, _samples, readings = line.split(",", 6)
+        key = (float(hz_low), float(hz_step), readings.count(",") + 1)
+        timestamps, rows = groups.setdefault(key, ([], []))
+        timestamps.append(parse_rtl_power_timestamp(date, time_))
+        rows.append(readings)
+
+    segments = []
+    for (hz_low, hz_step, bins), (timestamps, rows) in sorted(groups.items()):
+        power = np.fromstring(",".join(rows), dtype=np.float64, sep=",")
+        segments.append(RTLPowerSegment(
+            hz_low=hz_low,
+            hz_step=hz_step,
+            timestamps=np.array(timestamps, dtype="datetime64[s]"),
+            frequencies=frequency_axis(hz_low, hz_step, bins),
+            power=power.reshape(len(rows), bins)))
+
+    return segments
+
+
+REPORT_EVERY_SWEEPS = 60
+
+@dataclass
+class IngestStats:
+    """
+        Counters for the RF ingest path. A sweep "overruns" when parsing and
+        writing it took longer than the rtl_power integration interval, which
+        means the writer is falling behind the SDR.
+    """
+    sweeps: int = 0
+    rows: int = 0
+    overruns: int = 0
+    last_sweep_rows: int = 0
+    last_sweep_seconds: float = 0.0
+    last_write_seconds: float = 0.0
+
+    @property
+    def last_rows_per_second(self) -> float:
+        if not self.last_write_seconds:
+            return 0.0
+        return self.last_sweep_rows / self.last_write_seconds
+
+
+def _segment_lines(segments: List[RTLPowerSegment]):
+    for seg in segments:
+        for dt, power in zip(seg.datetimes(), seg.power.tolist()):
+            yield seg, dt, power
+
+
+def _segment_bins(segments: List[RTLPowerSegment]):
+    for seg in segments:
+        frequencies = seg.frequencies.tolist()
+        for dt, power in zip(seg.datetimes(), seg.power.tolist()):
+            for freq, rssi in zip(frequencies, power):
+                yield dt, freq, rssi
+
+
+def write_sweep(lines: List[str],
+                stats: IngestStats,
+                sweep_seconds: float,
+                interval: int,
+                storage: str = STORAGE_ROWS):
+    """Parse the raw lines of one sweep and write them with a single COPY."""
+    start = time.monotonic()
+    segments = parse_rtl_power_block(lines)
+    if storage == STORAGE_SWEEPS:
+        rows = db.RFSweep.add_many(
+            (dt, seg.hz_low, seg.hz_step, power)
+            for seg, dt, power in _segment_lines(segments)
+        )
+    else:
+        rows = db.RFLog.add_many(_segment_bins(segments))
+    write_seconds = time.monotonic() - start
+
+    stats.sweeps += 1
+    stats.rows += rows
+    stats.last_sweep_rows = rows
+    stats.last_sweep_seconds = sweep_seconds + write_seconds
+    stats.last_write_seconds = write_seconds
+
+    if stats.sweeps % REPORT_EVERY_SWEEPS == 0:
+        logger.info("RF ingest: %d sweeps, %d rows, last sweep %d rows in %.2fs "
+                    "(%.0f rows/s), %d overruns",
+                    stats.sweeps,
+                    stats.rows,
+                    stats.last_sweep_rows,
+                    stats.last_sweep_seconds,
+                    stats.last_rows_per_second,
+                    stats.overruns)
+
+    if stats.last_sweep_seconds > interval:
+        stats.overruns += 1
+        logger.warning("RF sweep ingest took %.2fs which exceeds the %ds integration interval "
+                       "(%d rows at %.0f rows/s)",
+                       stats.last_sweep_seconds,
+                       interval,
+                       rows,
+                       stats.last_rows_per_second)
+
+
 def monitor_airspace(config: SDRScannerConfig):
+    if config.storage not in (STORAGE_ROWS, STORAGE_SWEEPS):
+        raise ValueError("Unknown SDR storage format: %s" % config.storage)
+
     args = [
         "/usr/bin/rtl_power",
         "-f", f"{config.lower_freq}:{config.upper_freq}:{config.bin_size}",
@@ -51,13 +211,52 @@ def monitor_airspace(config: SDRScannerConfig):
     proc = subprocess.Popen(args,
                             stdout=subprocess.PIPE,
                             stderr=subprocess.PIPE)
+
+    stats = IngestStats()
+    interval = config.integration_interval_seconds
+    storage = config.storage
+    # rtl_power emits one line per tuner hop and stamps every line of a
+    # sweep with the same time. Lines are buffered until the sweep is
+    # complete: either the top of the swept range has been reached (known
+    # after the first sweep) or a line with a new timestamp shows up.
+    sweep: List[str] = []
+    sweep_time = None
+    sweep_high = 0.0
+    sweep_top = None
+    # When the first and last line of the current sweep were read. A sweep
+    # closed by the next sweep's first line is timed up to its own last
+    # line, not including the wait for the next integration interval.
+    sweep_start = 0.0
+    sweep_end = 0.0
     while True:
         line = proc.stdout.readline().decode()
         if proc.poll() is not None and line == "":
+            if sweep:
+                write_sweep(sweep, stats, sweep_end - sweep_start, interval, storage)
             print("SDR Exited with return code: %s" % proc.returncode)
             break
 
-        if line:
-            data = parse_rtl_power_line(line.strip())
-            for freq, rssi in data['freq'].items():
-                db.RFLog.add(data['datetime'], freq, rssi)
+        if not line:
+            continue
+
+        # Only the header columns are needed to group lines into sweeps,
+        # the readings are parsed in bulk by write_sweep.
+        date, time_, _hz_low, hz_high, _rest = line.split(",", 4)
+        line_time = (date, time_)
+        hz_high = float(hz_high)
+        if sweep and line_time != sweep_time:
+            sweep_top = sweep_high
+            write_sweep(sweep, stats, sweep_end - sweep_start, interval, storage)
+            sweep = []
+
+        if not sweep:
+            sweep_time = line_time
+            sweep_high = hz_high
+            sweep_start = time.monotonic()
+        sweep.append(line)
+        sweep_high = max(sweep_high, hz_high)
+        sweep_end = time.monotonic()
+
+        if sweep_top is not None and hz_high >= sweep_top:
+            write_sweep(sweep, stats, sweep_end - sweep_start, interval, storage)
+            sweep = []
@@ -1,9 +1,15 @@
-from dataclasses import dataclass
-from typing import List
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+import hashlib
 import json
+import re
+
+from dateutil.parser import isoparse
 
 from flask import (
     Flask,
+    Response,
     request,
     jsonify,
     render_template,
@@ -15,6 +21,7 @@ from .. import (
     db,
     interfaces
 )
+from . import cache, encoding, stream
 
 from pathlib import Path
 TEMPLATES = Path(__file__).parent / "templates"
@@ -27,9 +34,59 @@ api = Flask("airsec",
 @api.before_first_request
 def load():
     from ..applications import load_config
-    db.init(load_config())
+    conf = load_config()
+    db.init(conf)
     db.setup_database()
 
+    ttl = conf.web_cache_ttl_ms if conf.web_cache_ttl_ms is not None else conf.wifi_flush_interval_ms
+    RESPONSE_CACHE.ttl = ttl / 1000
+
+
+@api.after_request
+def compress(response):
+    return encoding.compress_response(response, request.accept_encodings)
+
+
+def json_response(**data):
+    """Like `jsonify`, with a faster serializer. `data` must only contain JSON types."""
+    return api.response_class(encoding.dumps(data), mimetype="application/json")
+
+
+FORMAT_ROWS = "rows"
+FORMAT_COLUMNS = "columns"
+
+
+def beacons_payload(beacons: List[interfaces.BeaconPacketAPI]):
+    """
+        Beacons as a list of objects, or with `?format=columns` as an object
+        of lists, one per field.
+    """
+    if request.args.get("format", FORMAT_ROWS) == FORMAT_COLUMNS:
+        return interfaces.BeaconPacketAPI.to_columns(beacons)
+    return [b.to_dict() for b in beacons]
+
+
+# Shared by every client, see `cached`.
+RESPONSE_CACHE = cache.ResponseCache()
+
+
+def cached(key, compute):
+    """`compute()` through the response cache. Returns: (value, age in seconds)"""
+    return RESPONSE_CACHE.get(key, compute)
+
+
+def inventory_state(bssids: Optional[List[str]] = None):
+    """
+        Cached `AppQueries.inventory_state`. Responses derived from it are
+        cached under keys that include its ETag, so they are replaced as
+        soon as the inventory changes rather than when they expire.
+
+        Returns: ((count, last seen, beacons), age in seconds)
+    """
+    key = ("inventory-state", tuple(sorted(bssids)) if bssids is not None else None)
+    return cached(key, lambda: db.AppQueries.inventory_state(bssids))
+
+
 @dataclass
 class AllowListPayload:
     beacons: List[interfaces.AllowedBeacon]
@@ -49,42 +106,272 @@ def allow_list_route():
         beacons = list(map(lambda x: interfaces.AllowedBeacon(**x), beacons))
         bssids = [b.bssid for b in beacons]
         db.AllowedBeacons.add(bssids)
+        RESPONSE_CACHE.invalidate()
 
     beacons = db.AllowedBeacons.select()
     return jsonify(beacons=beacons,)
 
 
+def not_modified(etag: str, last_modified: Optional[datetime]):
+    """
+        A 304 response if the client's validators match the current state,
+        otherwise None. If-None-Match takes precedence over If-Modified-Since.
+    """
+    if request.if_none_match:
+        matches = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified is not None:
+        matches = last_modified.replace(microsecond=0) <= request.if_modified_since
+    else:
+        matches = False
+
+    if not matches:
+        return None
+
+    return set_validators(make_response("", 304), etag, last_modified)
+
+
+def set_validators(response, etag: str, last_modified: Optional[datetime]):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Revalidate every poll rather than trusting a heuristic freshness.
+    response.cache_control.no_cache = True
+    return response
+
+
+def state_etag(*parts) -> str:
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+# Access points updated this long before the cursor are sent again, to catch
+# batches that were committed after a later one.
+TRAFFIC_CURSOR_OVERLAP = timedelta(seconds=5)
+
+
 @api.route("/api/v1/traffic", methods=["GET"])
 def traffic():
-    latest = db.AppQueries.latest_beacons()
-    beacons = [interfaces.BeaconPacketAPI.from_beacon_packet(bp) for bp in latest]
-    beacons = [b.to_dict() for b in beacons]
-    return jsonify(count=len(beacons), beacons=beacons)
+    """
+        Latest state of every access point.
+
+        Query args:
+            since
+                The `cursor` of a previous response. Only access points seen
+                since then are returned (plus a small overlap), to be merged
+                by BSSID into the previous result.
+            format
+                "rows" (default) or "columns", see `beacons_payload`.
+    """
+    try:
+        canonical = {b: canonical_bssid(b) for b in bssids}
+        since = parse_time_arg("since")
+    except ValueError as ex:
+        return make_response(f"Invalid argument: {ex}", 422)
+
+    (count, last_seen, total), age = inventory_state()
+    etag = state_etag("traffic", request.args.get("format"), count, last_seen, total)
+    response = not_modified(etag, last_seen)
+    if response is None:
+        def compute():
+            latest = db.AppQueries.latest_beacons(since - TRAFFIC_CURSOR_OVERLAP if since else None)
+            return [interfaces.BeaconPacketAPI.from_access_point(ap) for ap in latest]
+
+        beacons, _ = cached(("traffic", etag, since), compute)
+        response = json_response(count=len(beacons),
+                                 beacons=beacons_payload(beacons),
+                                 cursor=last_seen.isoformat() if last_seen else None)
+
+    response.age = int(age)
+    return set_validators(response, etag, last_seen)
 
 @api.route("/api/v1/evil-twins", methods=["GET"])
 def evil_twins():
-    latest = db.AppQueries.evil_twins()
-    beacons = [interfaces.BeaconPacketAPI.from_beacon_packet(bp) for bp in latest]
-    beacons = [b.to_dict() for b in beacons]
-    return jsonify(count=len(beacons), beacons=beacons)
+    """The latest event of every rogue BSSID. Takes `format` like /api/v1/traffic."""
+    def compute():
+        latest = db.AppQueries.evil_twins()
+        return [interfaces.BeaconPacketAPI.from_beacon_packet(bp) for bp in latest]
+
+    beacons, age = cached(("evil-twins",), compute)
+    response = json_response(count=len(beacons), beacons=beacons_payload(beacons))
+    response.age = int(age)
+    return response
+
+
+@api.route("/api/v1/cache", methods=["GET"])
+def cache_stats():
+    """
+        Response cache statistics: hit rate (requests that did not run a
+        query), the age in seconds of every cached response and how old the
+        newest beacon in the cached inventory state is.
+    """
+    stats = RESPONSE_CACHE.stats
+    ages = RESPONSE_CACHE.ages()
+    (_, last_seen, _), _ = inventory_state()
+    data_age = (datetime.now(timezone.utc) - last_seen).total_seconds() if last_seen else None
+    return jsonify(ttl=RESPONSE_CACHE.ttl,
+                   hits=stats.hits,
+                   misses=stats.misses,
+                   coalesced=stats.coalesced,
+                   invalidations=stats.invalidations,
+                   hit_rate=stats.hit_rate,
+                   data_age=data_age,
+                   entries=[{"key": "/".join(map(str, key)), "age": age} for key, age in ages.items()])
+
+
+@api.route("/api/v1/storage", methods=["GET"])
+def storage_stats():
+    """Chunk counts, sizes and compression ratio of every hypertable."""
+    stats = [dict(asdict(s), ratio=s.ratio) for s in db.compression_stats()]
+    return jsonify(tables=stats)
+
+
+DEFAULT_RSSI_RANGE = timedelta(days=365)
+DEFAULT_RSSI_POINTS = 500
+MAX_RSSI_POINTS = 10000
+
+
+def parse_time_arg(name: str) -> Optional[datetime]:
+    """ISO-8601 query argument as an aware datetime (UTC if no offset is given)."""
+    value = request.args.get(name)
+    if not value:
+        return None
+
+    dt = isoparse(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def canonical_bssid(bssid: str) -> str:
+    """
+        `bssid` written the way Postgres prints macaddr values (lowercase,
+        colon separated), which is how query results are keyed.
+
+        Raises: ValueError if it is not a MAC address.
+    """
+    digits = re.sub(r"[:.-]", "", bssid.strip()).lower()
+    if not re.fullmatch(r"[0-9a-f]{12}", digits):
+        raise ValueError(f"Invalid BSSID: {bssid}")
+    return ":".join(digits[i:i + 2] for i in range(0, 12, 2))
 
 
 @api.route("/api/v1/rssi", methods=["GET"])
 def beacon_rssi():
+    """
+        RSSI series of one or more BSSIDs.
+
+        Query args:
+            bssid
+                BSSID to include, may be repeated. Series are keyed by the
+                BSSID as given.
+            since, until
+                ISO-8601 range. Defaults to the past year, trimmed to when
+                the BSSIDs were first seen.
+            points
+                Approximate number of buckets per series.
+            bucket
+                Bucket width in seconds, instead of deriving it from `points`.
+                Buckets are aligned the same way on every request, so a
+                client can poll with the `bucket_seconds` of a previous
+                response and `since` set to its last bucket to only fetch the
+                buckets that may have changed.
+
+        Returns: The bucket width used and, per BSSID, columns of bucket start
+        times, sample counts and mean / min / max RSSI.
+    """
     bssids = request.args.to_dict(flat=False).get("bssid")
     if not bssids:
         return make_response("Must specify at least one bssid", 422)
 
     if isinstance(bssids, str):
         bssids = [bssids]
-    data = {}
-    for bssid in bssids:
-        query = f"WHERE bssid = %s and time > now() - INTERVAL '1 year'"
-        results = db.BeaconPacket.select(filter=query, values=(bssid,))
-        packets = [interfaces.BeaconPacketAPI.from_beacon_packet(bp) for bp in results]
-        packets = [p.to_dict() for p in packets]
-        data[bssid] = packets
-    return jsonify(data)
+
+    try:
+        canonical = {b: canonical_bssid(b) for b in bssids}
+        since = parse_time_arg("since")
+        until = parse_time_arg("until") or datetime.now(timezone.utc)
+        points = int(request.args.get("points", DEFAULT_RSSI_POINTS))
+        bucket = float(request.args["bucket"]) if "bucket" in request.args else None
+    except ValueError as ex:
+        return make_response(f"Invalid argument: {ex}", 422)
+
+    if not 0 < points <= MAX_RSSI_POINTS:
+        return make_response(f"`points` must be between 1 and {MAX_RSSI_POINTS}", 422)
+
+    if bucket is not None and bucket < 1:
+        return make_response("`bucket` must be at least one second", 422)
+
+    requested = bssids
+    bssids = sorted(set(canonical.values()))
+    (count, last_seen, total), _ = inventory_state(bssids)
+    etag = state_etag("rssi", sorted(request.args.items(multi=True)), count, last_seen, total)
+    response = not_modified(etag, last_seen)
+    if response is not None:
+        return response
+
+    if since is None:
+        since = until - DEFAULT_RSSI_RANGE
+        first_seen = db.AppQueries.first_seen(bssids, since)
+        if first_seen is not None:
+            since = max(since, first_seen)
+
+    if since >= until:
+        return make_response("`since` must be before `until`", 422)
+
+    if bucket is None:
+        bucket = db.rssi_bucket_width(since, until, points)
+    else:
+        bucket = timedelta(seconds=bucket)
+        if (until - since) / bucket > MAX_RSSI_POINTS:
+            return make_response(f"More than {MAX_RSSI_POINTS} buckets requested", 422)
+
+    series = db.AppQueries.rssi_series(bssids, since, until, bucket)
+    empty = interfaces.RSSISeries
+    response = json_response(since=since.isoformat(),
+                             until=until.isoformat(),
+                             bucket_seconds=bucket.total_seconds(),
+                             series={b: series.get(canonical[b], empty(bssid=canonical[b])).to_dict()
+                                     for b in requested})
+    return set_validators(response, etag, last_seen)
+
+
+# Seconds between keepalive comments on an idle stream.
+STREAM_KEEPALIVE = 15
+# Milliseconds EventSource waits before reconnecting.
+STREAM_RETRY = 5000
+
+
+@api.route("/api/v1/stream", methods=["GET"])
+def stream_route():
+    """
+        Server-Sent Events stream of live updates, all fed by one shared
+        database subscription:
+
+            inventory
+                Access points seen since the previous event, with the
+                `cursor` to use for /api/v1/traffic after a reconnect.
+            evil-twin
+                The latest event of rogue BSSIDs flagged since the previous
+                event.
+            allow-list
+                The whole allow list, whenever it changes.
+
+        Events missed while disconnected are not replayed, clients should
+        reload their state when the stream (re)opens.
+    """
+    subscriber = stream.BROKER.subscribe()
+
+    def events():
+        try:
+            yield f"retry: {STREAM_RETRY}\n\n"
+            yield from subscriber.messages(STREAM_KEEPALIVE)
+        finally:
+            stream.BROKER.unsubscribe(subscriber)
+
+    response = Response(events(), mimetype="text/event-stream")
+    response.cache_control.no_cache = True
+    # Keep reverse proxies from buffering the stream.
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 
 @api.route("/")
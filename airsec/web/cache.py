@@ -0,0 +1,132 @@
+"""
+    Response cache shared by every client of the dashboard API.
+
+    Entries expire after a TTL matched to how often the writer flushes
+    beacons, so clients never see data much older than what is in the
+    database. Concurrent misses for the same key wait for a single
+    computation instead of each running the query.
+"""
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+import threading
+import time
+
+
+@dataclass
+class ResponseCacheStats:
+    hits: int = 0
+    misses: int = 0
+    # Misses that waited for another request's computation.
+    coalesced: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses + self.coalesced
+        return (self.hits + self.coalesced) / total if total else 0.0
+
+
+@dataclass
+class _Entry:
+    value: Any
+    created: float
+
+
+class _Flight:
+    """A computation in progress, waited on by concurrent misses."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry: Optional[_Entry] = None
+        self.error: Optional[BaseException] = None
+
+
+class ResponseCache:
+    """
+        Args:
+            ttl
+                Seconds a computed value is served for.
+            max_entries
+                Expired entries are pruned when the cache grows past this,
+                and the oldest ones if that is not enough.
+    """
+
+    def __init__(self, ttl: float = 1.0, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = ResponseCacheStats()
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._flights: Dict[Hashable, _Flight] = {}
+        # Bumped by invalidate() so computations started before it are not
+        # stored.
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Tuple[Any, float]:
+        """
+            The cached value for `key`, computing it with `compute` if it is
+            missing or expired. Exceptions from `compute` are raised in every
+            request waiting for it and nothing is cached.
+
+            Returns: (value, seconds since it was computed)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.created < self.ttl:
+                self.stats.hits += 1
+                return entry.value, time.monotonic() - entry.created
+
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                generation = self._generation
+                self.stats.misses += 1
+            else:
+                self.stats.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.entry.value, time.monotonic() - flight.entry.created
+
+        try:
+            flight.entry = _Entry(compute(), time.monotonic())
+        except BaseException as ex:
+            flight.error = ex
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                if flight.entry is not None and generation == self._generation:
+                    self._store(key, flight.entry)
+            flight.done.set()
+
+        return flight.entry.value, 0.0
+
+    def _store(self, key: Hashable, entry: _Entry):
+        self._entries[key] = entry
+        if len(self._entries) <= self.max_entries:
+            return
+
+        now = time.monotonic()
+        self._entries = {k: e for k, e in self._entries.items() if now - e.created < self.ttl}
+        while len(self._entries) > self.max_entries:
+            oldest = min(self._entries, key=lambda k: self._entries[k].created)
+            del self._entries[oldest]
+
+    def invalidate(self):
+        """Drop every entry. Requests already computing do not store their result."""
+        with self._lock:
+            self._entries.clear()
+            self._flights.clear()
+            self._generation += 1
+            self.stats.invalidations += 1
+
+    def ages(self) -> Dict[Hashable, float]:
+        """Seconds since each cached value was computed, expired ones included."""
+        now = time.monotonic()
+        with self._lock:
+            return {key: now - e.created for key, e in self._entries.items()}
@@ -0,0 +1,89 @@
+"""
+    Serialization and compression of API responses.
+
+    orjson is used for JSON and brotli is offered next to gzip when they are
+    installed. Both are optional, the standard library is used otherwise.
+"""
+from typing import Optional
+import gzip
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are sent as is, compressing them costs more
+# than it saves.
+MIN_COMPRESS_SIZE = 1024
+# Moderate levels, the web app may be served from a Raspberry Pi.
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+
+def dumps(data) -> bytes:
+    """Compact JSON. `data` must only contain JSON types."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def encodings():
+    """Content codings this server can produce, preferred first."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encodings) -> Optional[str]:
+    """
+        The best coding accepted by the client, or None for identity.
+
+        Args:
+            accept_encodings
+                werkzeug's parsed Accept-Encoding header.
+    """
+    best, best_quality = None, 0
+    for coding in encodings():
+        quality = accept_encodings[coding]
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(data: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if coding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    raise ValueError("Unsupported content coding: %s" % coding)
+
+
+def compress_response(response, accept_encodings):
+    """
+        Compress `response` in place if the client accepts a supported
+        coding and it is worth it. Streamed and already encoded responses
+        are left alone.
+    """
+    response.vary.add("Accept-Encoding")
+    if (response.direct_passthrough
+            or response.is_streamed
+            or response.status_code != 200
+            or "Content-Encoding" in response.headers
+            or response.mimetype == "text/event-stream"):
+        return response
+
+    coding = negotiate(accept_encodings)
+    if coding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+
+    response.set_data(compress(data, coding))
+    response.headers["Content-Encoding"] = coding
+    return response
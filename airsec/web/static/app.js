@@ -2,6 +2,41 @@
 
     const chartColor = ['#e6194b', '#3cb44b', '#ffe119', '#4363d8', '#f58231', '#911eb4', '#46f0f0', '#f032e6', '#bcf60c', '#fabebe', '#008080', '#e6beff', '#9a6324', '#fffac8', '#800000', '#aaffc3', '#808000', '#ffd8b1', '#000075', '#808080', '#ffffff', '#000000'];
 
+    // One EventSource per page, shared by the components that need live
+    // updates. null if the browser does not support Server-Sent Events.
+    let liveUpdates = null;
+
+    function getLiveUpdates() {
+        if (liveUpdates == null && window.EventSource) {
+            liveUpdates = new EventSource("/api/v1/stream");
+        }
+        return liveUpdates;
+    }
+
+    // Rows from a `format=columns` response: {time: [...], bssid: [...]}
+    // to [{time, bssid}, ...].
+    function fromColumns(columns) {
+        let names = Object.keys(columns);
+        let count = names.length ? columns[names[0]].length : 0;
+        let rows = new Array(count);
+        for (let i = 0; i < count; i++) {
+            let row = {};
+            for (let name of names) {
+                row[name] = columns[name][i];
+            }
+            rows[i] = row;
+        }
+        return rows;
+    }
+
+    function mergeByBSSID(rows, updates) {
+        let merged = {};
+        for (let row of rows.concat(updates)) {
+            merged[row.bssid] = row;
+        }
+        return Object.values(merged);
+    }
+
     function createApplication() {
         let app = Vue.createApp({setup () {return {}}});
         app.use(Quasar);
@@ -140,7 +175,11 @@
                     evilTwins: [],
                     selected: [],
                     loading: false,
-                    polling: null
+                    polling: null,
+                    beaconsByBSSID: {},
+                    allowedBSSIDs: [],
+                    trafficCursor: null,
+                    trafficETag: null
                 }
             },
             methods: {
@@ -164,36 +203,81 @@
                     await this.loadData();
                 },
                 loadData: async function () {
-                    let resp = await window.fetch("/api/v1/traffic");
-                    let allBeacons = await resp.json();
+                    // Only access points seen since the last poll are sent,
+                    // and nothing at all (304) if no beacon was logged.
+                    let url = "/api/v1/traffic?format=columns";
+                    if (this.trafficCursor) {
+                        url += "&since=" + encodeURIComponent(this.trafficCursor);
+                    }
+                    let headers = this.trafficETag ? {"If-None-Match": this.trafficETag} : {};
+                    let resp = await window.fetch(url, {headers: headers});
+                    if (resp.status === 200) {
+                        let body = await resp.json();
+                        this.mergeBeacons(fromColumns(body.beacons));
+                        this.trafficCursor = body.cursor;
+                        this.trafficETag = resp.headers.get("ETag");
+                    }
 
                     resp = await window.fetch("/api/v1/allowed-beacons");
                     let data = await resp.json()
-                    let validBSSIDs = data.beacons.map((b) => b.bssid);
+                    this.allowedBSSIDs = data.beacons.map((b) => b.bssid);
 
-                    resp = await window.fetch("/api/v1/evil-twins");
+                    resp = await window.fetch("/api/v1/evil-twins?format=columns");
                     data = await resp.json();
-                    let evilTwins = data.beacons;
+                    this.evilTwins = fromColumns(data.beacons);
 
+                    this.classify();
+                },
+                mergeBeacons: function (beacons) {
+                    for (let beacon of beacons) {
+                        this.beaconsByBSSID[beacon.bssid] = beacon;
+                    }
+                },
+                classify: function () {
                     let result = {authorized: [], unauthorized: []};
-                    allBeacons.beacons.reduce(function(prev, current, idx) {
-                        if (validBSSIDs.includes(current.bssid)) {
-                            prev.authorized.push(current)
+                    for (let beacon of Object.values(this.beaconsByBSSID)) {
+                        if (this.allowedBSSIDs.includes(beacon.bssid)) {
+                            result.authorized.push(beacon);
                         }
                         else {
-                            prev.unauthorized.push(current);
+                            result.unauthorized.push(beacon);
                         }
-
-                        return result;
-                    }, result);
+                    }
 
                     this.authorizedBeacons = result.authorized;
                     this.unauthorizedBeacons = result.unauthorized;
-                    this.evilTwins = evilTwins;
                 },
                 setupPolling: function () {
-                    if (this.polling == null) {
-                        this.polling = setInterval(this.loadData.bind(this), 5000);
+                    let stream = getLiveUpdates();
+                    if (stream == null) {
+                        if (this.polling == null) {
+                            this.polling = setInterval(this.loadData.bind(this), 5000);
+                        }
+                        return;
+                    }
+
+                    this.listeners = {
+                        // (Re)connected, catch up on what was missed meanwhile.
+                        open: () => this.loadData(),
+                        inventory: (e) => {
+                            let body = JSON.parse(e.data);
+                            this.mergeBeacons(body.beacons);
+                            if (body.cursor) {
+                                this.trafficCursor = body.cursor;
+                            }
+                            this.classify();
+                        },
+                        "evil-twin": (e) => {
+                            this.evilTwins = mergeByBSSID(this.evilTwins, JSON.parse(e.data).beacons);
+                        },
+                        "allow-list": (e) => {
+                            this.allowedBSSIDs = JSON.parse(e.data).beacons.map((b) => b.bssid);
+                            this.evilTwins = this.evilTwins.filter((t) => !this.allowedBSSIDs.includes(t.bssid));
+                            this.classify();
+                        }
+                    };
+                    for (let [name, listener] of Object.entries(this.listeners)) {
+                        stream.addEventListener(name, listener);
                     }
                 },
                 cancelPolling: function () {
@@ -201,6 +285,12 @@
                         clearInterval(this.polling);
                         this.polling = null;
                     }
+                    if (this.listeners) {
+                        for (let [name, listener] of Object.entries(this.listeners)) {
+                            liveUpdates.removeEventListener(name, listener);
+                        }
+                        this.listeners = null;
+                    }
                 }
             },
             mounted: async function() {
@@ -218,7 +308,7 @@
         app.component("rssi-chart", {
             props: ["bssids"],
             data: function () {
-                return { open: true };
+                return { open: true, bucket: null, cursor: null, etag: null };
             },
             template: `<div>
             <q-dialog @show="dialogShown" @hide="dialogHide" v-model="open">
@@ -231,25 +321,68 @@
             </div>`,
             methods: {
                 fetchData: async function () {
-                    let query = this.bssids.map(b => "bssid=" + b).join('&');
-                    let resp = await window.fetch(`/api/v1/rssi?${query}`);
+                    // After the first response keep its bucket width and only
+                    // ask for the buckets from the last one we have onwards.
+                    let params = new URLSearchParams();
+                    this.bssids.forEach(b => params.append("bssid", b));
+                    if (this.bucket) {
+                        params.set("bucket", this.bucket);
+                        params.set("since", this.cursor);
+                    }
+                    let headers = this.etag ? {"If-None-Match": this.etag} : {};
+                    let resp = await window.fetch(`/api/v1/rssi?${params}`, {headers: headers});
+                    if (resp.status !== 200) {
+                        return;
+                    }
                     let body = await resp.json();
+                    this.etag = resp.headers.get("ETag");
+                    this.bucket = body.bucket_seconds;
 
+                    let cursor = this.cursor || body.since;
                     this.chart.data.datasets.forEach(function (b) {
-                        if (body.hasOwnProperty(b.label)) {
-                            b.data = body[b.label];
+                        let series = body.series[b.label];
+                        if (!series || series.time.length === 0) {
+                            return;
+                        }
+                        let first = Date.parse(series.time[0]);
+                        let points = series.time.map((t, i) => ({time: t, rssi: series.rssi[i]}));
+                        b.data = b.data.filter(p => Date.parse(p.time) < first).concat(points);
+
+                        let last = series.time[series.time.length - 1];
+                        if (Date.parse(last) > Date.parse(cursor)) {
+                            cursor = last;
                         }
                     });
+                    this.cursor = cursor;
 
                     this.chart.update();
                 },
                 setupPolling: function () {
-                    this.interval = window.setInterval(this.fetchData.bind(this), 1000);
+                    let stream = getLiveUpdates();
+                    if (stream == null) {
+                        this.interval = window.setInterval(this.fetchData.bind(this), 1000);
+                        return;
+                    }
+
+                    // Only refetch when one of the charted access points
+                    // was seen again.
+                    this.onInventory = (e) => {
+                        let beacons = JSON.parse(e.data).beacons;
+                        if (beacons.some(b => this.bssids.includes(b.bssid))) {
+                            this.fetchData();
+                        }
+                    };
+                    stream.addEventListener("inventory", this.onInventory);
+                    this.fetchData();
                 },
                 clearPolling: function() {
                     if (this.interval) {
                         window.clearInterval(this.interval);
                     }
+                    if (this.onInventory) {
+                        liveUpdates.removeEventListener("inventory", this.onInventory);
+                        this.onInventory = null;
+                    }
                 },
                 dialogShown: function () {
                     const config = {
@@ -0,0 +1,224 @@
+"""
+    Live updates for the dashboard over Server-Sent Events.
+
+    A single `StreamBroker` per web server process LISTENs for the
+    notifications sent when beacons or evil twin events are written or the
+    allow list changes. It runs one query per notification and hands the
+    result to every connected client, so the database load does not grow
+    with the number of open dashboards.
+"""
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Set
+import atexit
+import os
+import queue
+import threading
+
+from .. import db, interfaces, logger
+from . import encoding
+
+EVENT_INVENTORY = "inventory"
+EVENT_EVIL_TWIN = "evil-twin"
+EVENT_ALLOW_LIST = "allow-list"
+
+# Rows written this long before the cursor are queried again, to catch
+# transactions that committed after a later one.
+CURSOR_OVERLAP = timedelta(seconds=5)
+
+
+@dataclass
+class StreamStats:
+    clients: int = 0
+    notifications: int = 0
+    queries: int = 0
+    events: int = 0
+    # Clients disconnected because they fell too far behind.
+    dropped: int = 0
+
+
+class Subscriber:
+    """Queue of formatted events for one connected client."""
+
+    def __init__(self, size: int):
+        self.queue: queue.Queue = queue.Queue(size)
+        self.closed = False
+
+    def messages(self, keepalive: float) -> Iterator[str]:
+        """
+            Yields the events as they are published, and a comment every
+            `keepalive` seconds without one so dead connections are noticed.
+            Ends once the broker drops the subscriber.
+        """
+        while not self.closed:
+            try:
+                yield self.queue.get(timeout=keepalive)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+
+
+def format_event(event: str, data, event_id: Optional[str] = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {encoding.dumps(data).decode()}")
+    return "\n".join(lines) + "\n\n"
+
+
+class StreamBroker:
+    """
+        Fans database notifications out to SSE clients.
+
+        Notifications that arrive while the previous ones are being queried
+        are coalesced, so a burst of writes costs one query per kind of
+        change. Clients whose queue is full are disconnected rather than
+        slowing everyone else down; EventSource reconnects on its own and
+        the dashboard reloads its state when it does.
+
+        Args:
+            queue_size
+                Events buffered per client.
+            coalesce
+                Seconds to wait after a notification for more to arrive
+                before querying.
+    """
+
+    def __init__(self, queue_size: int = 100, coalesce: float = 0.25):
+        self.queue_size = queue_size
+        self.coalesce = coalesce
+        self.stats = StreamStats()
+        self._subscribers: Set[Subscriber] = set()
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._cursors: Dict[str, Optional[datetime]] = {}
+        self._listener: Optional[db.NotificationListener] = None
+        self._worker: Optional[threading.Thread] = None
+        self._pid = None
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.queue_size)
+        with self._lock:
+            self._ensure_running()
+            self._subscribers.add(subscriber)
+            self.stats.clients = len(self._subscribers)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscriber.closed = True
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            self.stats.clients = len(self._subscribers)
+
+    def publish(self, message: str):
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(message)
+            except queue.Full:
+                self.stats.dropped += 1
+                logger.warning("Dropping a live update client that fell behind")
+                self.unsubscribe(subscriber)
+        self.stats.events += 1
+
+    def _ensure_running(self):
+        # Threads do not survive a fork, start new ones in the child.
+        if self._pid == os.getpid():
+            return
+
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._cursors = {}
+        self._listener = db.NotificationListener([db.APInventory.notify_channel,
+                                                  db.EvilTwinEvent.notify_channel,
+                                                  db.AllowedBeacons.notify_channel],
+                                                 self._on_notify,
+                                                 name="stream-listener")
+        self._worker = threading.Thread(target=self._run, name="stream-broker", daemon=True)
+        self._worker.start()
+        self._listener.start()
+
+    def stop(self):
+        if self._pid != os.getpid():
+            return
+
+        self._listener.stop()
+        self._stop.set()
+        self._wake.set()
+        self._worker.join()
+        self._pid = None
+
+    def _on_notify(self, channel: str, payload: Optional[str]):
+        # A None payload means the listener (re)connected. Nothing needs to
+        # be sent for it: writes made while disconnected are picked up by
+        # the next query since the cursors did not move.
+        if payload is None:
+            return
+
+        with self._lock:
+            self.stats.notifications += 1
+            self._pending.add(channel)
+        self._wake.set()
+
+    def _start_cursors(self):
+        """Start from the current state so the first update is not the whole inventory."""
+        try:
+            self._cursors[db.APInventory.notify_channel] = db.AppQueries.inventory_state()[1]
+            self._advance(db.EvilTwinEvent.notify_channel, [e.time for e in db.AppQueries.evil_twins()])
+        except Exception as ex:
+            logger.error("Failed to read the initial live update cursors: %s", ex)
+
+    def _run(self):
+        self._start_cursors()
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._stop.wait(self.coalesce)
+            with self._lock:
+                self._wake.clear()
+                pending, self._pending = self._pending, set()
+
+            for channel in pending:
+                try:
+                    self._query(channel)
+                except Exception as ex:
+                    logger.error("Failed to query live updates for %s: %s", channel, ex)
+
+    def _since(self, channel: str) -> Optional[datetime]:
+        cursor = self._cursors.get(channel)
+        return cursor - CURSOR_OVERLAP if cursor is not None else None
+
+    def _advance(self, channel: str, times: List[datetime]):
+        cursor = self._cursors.get(channel)
+        if times:
+            latest = max(times)
+            self._cursors[channel] = latest if cursor is None else max(cursor, latest)
+
+    def _query(self, channel: str):
+        self.stats.queries += 1
+        if channel == db.APInventory.notify_channel:
+            # Without a cursor the whole inventory is sent, clients merge it
+            # by BSSID either way.
+            rows = db.AppQueries.latest_beacons(self._since(channel))
+            self._advance(channel, [ap.last_seen for ap in rows])
+            beacons = [interfaces.BeaconPacketAPI.from_access_point(ap).to_dict() for ap in rows]
+            cursor = self._cursors.get(channel)
+            self.publish(format_event(EVENT_INVENTORY,
+                                      {"beacons": beacons, "cursor": cursor.isoformat() if cursor else None},
+                                      cursor.isoformat() if cursor else None))
+
+        elif channel == db.EvilTwinEvent.notify_channel:
+            rows = db.AppQueries.evil_twins(self._since(channel))
+            self._advance(channel, [e.time for e in rows])
+            beacons = [interfaces.BeaconPacketAPI.from_beacon_packet(e).to_dict() for e in rows]
+            self.publish(format_event(EVENT_EVIL_TWIN, {"beacons": beacons}))
+
+        elif channel == db.AllowedBeacons.notify_channel:
+            beacons = [asdict(b) for b in db.AllowedBeacons.select()]
+            self.publish(format_event(EVENT_ALLOW_LIST, {"beacons": beacons}))
+
+
+BROKER = StreamBroker()
+atexit.register(BROKER.stop)
@@ -1,7 +1,12 @@
 #!/usr/bin/env python
+import errno
+import subprocess
 import time
+from dataclasses import dataclass
 from datetime import datetime
+from functools import partial
 from threading import Thread
+from typing import Callable, Iterable, Optional, Tuple
 
 from scapy.all import (
     AsyncSniffer,
@@ -12,11 +17,19 @@ from scapy.all import (
 
 from . import (
     logger,
+    capture,
+    channel_hopper,
     db,
-    iface_utils
+    detection,
+    dot11,
+    iface_utils,
+    interfaces,
+    nl80211,
+    writer
 )
 from enum import IntEnum
 
+
 class PacketType(IntEnum):
     MANAGEMENT = 0
     CONTROL = 1
@@ -42,9 +55,48 @@ class ManagementPacketSubtype(IntEnum):
     NACK = 14
     # RESERVED2 = 15
 
+CAPTURE_BACKEND_SCAPY = "scapy"
+CAPTURE_BACKEND_RAW = "raw"
+CAPTURE_BACKEND_RING = "ring"
+
+@dataclass
+class WifiScannerConfig:
+    iface: str
+    # "ring" reads frames from a memory mapped TPACKET_V3 ring, "raw" from a
+    # plain AF_PACKET socket, both parse frames without scapy. "scapy" runs
+    # the full scapy dissection for every frame.
+    capture_backend: str = CAPTURE_BACKEND_RING
+    # Management frame subtypes let through the kernel filter of the ring
+    # and raw backends. Everything else is dropped before it reaches userspace.
+    capture_subtypes: Tuple[ManagementPacketSubtype, ...] = (ManagementPacketSubtype.BEACON,)
+    # TPACKET_V3 ring layout for the ring backend.
+    ring_block_size: int = 1 << 18
+    ring_block_count: int = 16
+    ring_block_timeout_ms: int = 100
+    # Channel hopping. An empty channel list means every channel the phy
+    # supports. See channel_hopper.AdaptiveScheduler for the dwell settings.
+    hop_scheduler: str = channel_hopper.SCHEDULER_ADAPTIVE
+    channels: Tuple[int, ...] = ()
+    hop_min_dwell_ms: int = 200
+    hop_max_dwell_ms: int = 2000
+    hop_max_revisit_ms: int = 15000
+    # Beacon writer settings. Packets are flushed to the database once
+    # `batch_size` are pending or the oldest has waited `flush_interval_ms`.
+    batch_size: int = 500
+    flush_interval_ms: int = 1000
+    queue_size: int = 10000
+    # Evil twin detection. Events for the same rogue BSSID are reported at
+    # most once per cooldown, and the allow list is reloaded periodically.
+    evil_twin_cooldown_ms: int = 60000
+    allow_list_reload_ms: int = 60000
+
+
 beacons = {}
 
-def log_beacon_packets(packet):
+def log_beacon_packets(packet,
+                       beacon_writer: writer.BatchWriter,
+                       scheduler: Optional[channel_hopper.HopScheduler] = None,
+                       detector: Optional[detection.EvilTwinDetector] = None):
     if packet.type != PacketType.MANAGEMENT or packet.subtype != ManagementPacketSubtype.BEACON:
         # We don't care about non-beacon packets
         return
@@ -70,14 +122,135 @@ def log_beacon_packets(packet):
                        ssid[0:min(10, len(ssid))])
         ssid = None
 
+    beacon_packet = interfaces.BeaconPacket(
+        time=timestamp,
+        bssid=bssid,
+        ssid=ssid,
+        rssi=rssi,
+        channel=channel,
+        payload=bytes(packet))
+    beacon_writer.put(beacon_packet)
+    if detector is not None:
+        detector.check_and_record([beacon_packet])
+
+    if scheduler is not None:
+        # Credit the channel the frame was captured on, the radio may have
+        # hopped while scapy was dissecting it.
+        scheduler.observe(scheduler.channel_at(float(packet.time)), bssid)
+
+def beacon_from_frame(frame: dot11.Buffer,
+                      timestamp: float,
+                      tuned_channel: Optional[int] = None) -> Optional[interfaces.BeaconPacket]:
+    """
+        Build a `BeaconPacket` from raw captured bytes without a scapy
+        dissection. Returns None for frames that should not be logged.
+
+        `tuned_channel` is the channel the radio was set to when the frame
+        was captured. It is used when the frame itself does not say which
+        channel the access point is on.
+    """
+    beacon = dot11.parse_beacon(frame)
+    if beacon is None:
+        return None
+
+    if beacon.channel is None:
+        beacon.channel = tuned_channel
+
+    if beacon.rssi is None or beacon.channel is None:
+        logger.debug("Beacon from %s missing signal or channel, skipping", beacon.bssid)
+        return None
+
+    ssid = beacon.ssid
+    if ssid and "\x00" in ssid:
+        logger.warning("SSID contained null bytes, omitting SSID from database: (%s, %s)",
+                       beacon.bssid,
+                       ssid[0:min(10, len(ssid))])
+        ssid = None
+
+    return interfaces.BeaconPacket(
+        time=datetime.fromtimestamp(timestamp),
+        bssid=beacon.bssid,
+        ssid=ssid,
+        rssi=beacon.rssi,
+        channel=beacon.channel,
+        payload=bytes(frame))
+
+
+def log_beacon_frame(frame: dot11.Buffer,
+                     timestamp: float,
+                     beacon_writer: writer.BatchWriter,
+                     scheduler: Optional[channel_hopper.HopScheduler] = None,
+                     detector: Optional[detection.EvilTwinDetector] = None):
+    """
+        Same as `log_beacon_packets` but works on the raw captured bytes
+        instead of a dissected scapy packet.
+    """
+    tuned_channel = scheduler.channel_at(timestamp) if scheduler is not None else None
+    packet = beacon_from_frame(frame, timestamp, tuned_channel)
+    if packet is None:
+        return
+
+    beacon_writer.put(packet)
+    if detector is not None:
+        detector.check_and_record([packet])
+    if scheduler is not None:
+        scheduler.observe(tuned_channel, packet.bssid)
+
+
+def parse_subtypes(names: Iterable[str]) -> Tuple[ManagementPacketSubtype, ...]:
+    """Map config subtype names (e.g. "beacon") to `ManagementPacketSubtype` members."""
+    try:
+        return tuple(ManagementPacketSubtype[name.upper()] for name in names)
+    except KeyError as ex:
+        raise ValueError("Unknown management frame subtype: %s" % ex.args[0])
+
+
+CAPTURE_STATS_INTERVAL = 60
+
+def log_capture_stats(iface: str, stats: capture.CaptureStats):
+    logger.info("Capture on %s: %d frames delivered, ~%d filtered in kernel, "
+                "%d dropped by kernel, %d ring freezes",
+                iface,
+                stats.delivered,
+                stats.filtered,
+                stats.kernel_drops,
+                stats.kernel_freezes)
+
+
+def create_capture(config: WifiScannerConfig) -> capture.RawSocketCapture:
+    bpf_filter = capture.compile_management_filter(config.capture_subtypes)
+    if config.capture_backend == CAPTURE_BACKEND_RING:
+        return capture.RingCapture(config.iface,
+                                   block_size=config.ring_block_size,
+                                   block_count=config.ring_block_count,
+                                   block_timeout_ms=config.ring_block_timeout_ms,
+                                   bpf_filter=bpf_filter)
+
+    return capture.RawSocketCapture(config.iface, bpf_filter=bpf_filter)
+
+
+def run_raw_sniffer(config: WifiScannerConfig,
+                    beacon_writer: writer.BatchWriter,
+                    scheduler: Optional[channel_hopper.HopScheduler] = None,
+                    detector: Optional[detection.EvilTwinDetector] = None):
+    """
+        Capture loop for the ring and raw socket backends. Reopens the
+        socket on errors.
+    """
+    iface = config.iface
+    while True:
+        try:
+            with create_capture(config) as cap:
+                next_report = time.monotonic() + CAPTURE_STATS_INTERVAL
+                for timestamp, frame in cap.frames():
+                    log_beacon_frame(frame, timestamp, beacon_writer, scheduler, detector)
+                    if cap.stats.delivered % 100 == 0 and time.monotonic() >= next_report:
+                        log_capture_stats(iface, cap.update_stats())
+                        next_report = time.monotonic() + CAPTURE_STATS_INTERVAL
+        except OSError as ex:
+            logger.error("Raw capture on %s failed: %s", iface, ex)
+            time.sleep(1)
 
-    db.BeaconPacket.add(
-        timestamp,
-        bssid,
-        ssid,
-        channel,
-        rssi,
-        bytes(packet))
 
 def run_sniffer(*args, **kwargs):
     # This is a hack. The async sniffer built into scapy will seemingly wait and
@@ -100,7 +273,24 @@ def run_sniffer(*args, **kwargs):
             logger.error("AsyncSniffer raised an exception: %s", ex)
 
 
-def sniff_access_points(iface: str):
+def create_beacon_writer(config: WifiScannerConfig) -> writer.BatchWriter:
+    return writer.BatchWriter(db.add_beacons,
+                              batch_size=config.batch_size,
+                              flush_interval=config.flush_interval_ms / 1000,
+                              queue_size=config.queue_size,
+                              name="beacon-writer")
+
+
+def create_evil_twin_detector(config: WifiScannerConfig) -> detection.EvilTwinDetector:
+    """A detector that is already reloading its index in the background."""
+    detector = detection.EvilTwinDetector(cooldown=config.evil_twin_cooldown_ms / 1000,
+                                          reload_interval=config.allow_list_reload_ms / 1000,
+                                          allow_list=db.ALLOW_LIST)
+    detector.start()
+    return detector
+
+
+def sniff_access_points(config: WifiScannerConfig):
     """
         Function for sniffing WiFi traffic for access points in the area.
         Access points will be logged to the configured database.
@@ -109,18 +299,109 @@ def sniff_access_points(iface: str):
         traffic, and will run forver.
 
         Args:
-            iface
-                The interface name used to scan
+            config
+                Scanner configuration, including the interface name used to scan
     """
-    thread = Thread(target=run_sniffer, kwargs=dict(iface=iface, prn=log_beacon_packets))
+    iface = config.iface
+    beacon_writer = create_beacon_writer(config)
+    beacon_writer.start()
+    scheduler = create_hop_scheduler(config)
+    detector = create_evil_twin_detector(config)
+
+    if config.capture_backend in (CAPTURE_BACKEND_RING, CAPTURE_BACKEND_RAW):
+        thread = Thread(target=run_raw_sniffer, args=(config, beacon_writer, scheduler, detector))
+    elif config.capture_backend == CAPTURE_BACKEND_SCAPY:
+        prn = partial(log_beacon_packets,
+                      beacon_writer=beacon_writer,
+                      scheduler=scheduler,
+                      detector=detector)
+        thread = Thread(target=run_sniffer, kwargs=dict(iface=iface, prn=prn))
+    else:
+        raise ValueError("Unknown capture backend: %s" % config.capture_backend)
     thread.start()
 
-    # Start scanning on channel 1
-    channel = 1
+    hop_channels(iface, scheduler)
+
+
+def create_hop_scheduler(config: WifiScannerConfig) -> channel_hopper.HopScheduler:
+    channels = list(config.channels)
+    if not channels:
+        try:
+            channels = iface_utils.get_supported_channels(config.iface)
+        except (OSError, subprocess.CalledProcessError, iface_utils.NoSuchInterface) as ex:
+            logger.warning("Could not read supported channels of %s: %s", config.iface, ex)
+
+    if not channels:
+        channels = list(channel_hopper.DEFAULT_CHANNELS)
+
+    logger.info("Hopping %s over channels %s", config.iface, channels)
+    return channel_hopper.create_scheduler(config.hop_scheduler,
+                                           channels,
+                                           min_dwell=config.hop_min_dwell_ms / 1000,
+                                           max_dwell=config.hop_max_dwell_ms / 1000,
+                                           max_revisit=config.hop_max_revisit_ms / 1000)
+
+
+def hop_channels(iface: str,
+                 scheduler: Optional[channel_hopper.HopScheduler] = None,
+                 on_hop: Optional[Callable[[int], None]] = None):
+    """
+        Hop the interface between channels forever as directed by
+        `scheduler` (channels 1-11, one second each by default), calling
+        `on_hop` with the new channel after every switch.
+    """
+    if scheduler is None:
+        scheduler = channel_hopper.RoundRobinScheduler()
+
+    failures = channel_hopper.HopFailures()
+    next_report = time.monotonic() + CAPTURE_STATS_INTERVAL
     while True:
-        iface_utils.wifi_set_channel(iface, channel)
-        time.sleep(1)
-        # "Hop" to the next channel so we capture devices operating on all channels.
-        channel += 1
-        if channel >= 12:
-            channel = 1
+        channel, dwell = scheduler.next_hop()
+        try:
+            iface_utils.wifi_set_channel(iface, channel)
+        except iface_utils.NoSuchInterface:
+            delay, _ = failures.failed(channel, rejected=False)
+            logger.warning("Interface %s not found, retrying in %.1fs", iface, delay)
+            time.sleep(delay)
+            continue
+        except (subprocess.CalledProcessError, nl80211.NetlinkError, ValueError) as ex:
+            delay, remove = failures.failed(channel, _channel_rejected(ex))
+            if remove:
+                logger.warning("%s keeps rejecting channel %d, no longer visiting it: %s", iface, channel, ex)
+                scheduler.remove_channel(channel)
+            else:
+                logger.warning("Failed to tune %s to channel %d, retrying in %.1fs: %s", iface, channel, delay, ex)
+            time.sleep(delay)
+            continue
+
+        failures.succeeded(channel)
+        scheduler.tuned(channel)
+        if on_hop is not None:
+            on_hop(channel)
+
+        if time.monotonic() >= next_report:
+            log_channel_switch_stats(iface, iface_utils.channel_switch_stats)
+            next_report = time.monotonic() + CAPTURE_STATS_INTERVAL
+        time.sleep(dwell)
+
+
+def _channel_rejected(ex: Exception) -> bool:
+    """Whether a failed channel switch means the radio does not support the channel."""
+    if isinstance(ex, ValueError):
+        return True
+    if isinstance(ex, nl80211.NetlinkError):
+        return ex.errno == errno.EINVAL
+    if isinstance(ex, subprocess.CalledProcessError):
+        # iw exits with the negated errno of the failed command.
+        return ex.returncode & 0xff == -errno.EINVAL & 0xff
+    return False
+
+
+def log_channel_switch_stats(iface: str, stats: iface_utils.ChannelSwitchStats):
+    logger.info("%s: %d channel switches, latency mean %.1fms / last %.1fms / max %.1fms, %d failed",
+                iface,
+                stats.switches,
+                stats.mean_latency * 1000,
+                stats.last_latency * 1000,
+                stats.max_latency * 1000,
+                stats.failures)
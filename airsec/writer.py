@@ -0,0 +1,185 @@
+"""
+    Background writer stage used to keep database inserts off of the
+    capture threads.
+
+    Producers (e.g. the scapy `prn` callback) only enqueue records. A
+    single worker thread drains the queue and hands batches to a flush
+    function whenever the batch is full or the oldest record in it has
+    waited longer than the flush interval.
+"""
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional
+import queue
+import threading
+import time
+
+from . import logger
+
+
+@dataclass
+class WriterStats:
+    enqueued: int = 0
+    dropped: int = 0
+    batches: int = 0
+    rows: int = 0
+    failed_batches: int = 0
+    last_batch_size: int = 0
+    max_batch_size: int = 0
+    last_flush_latency: float = 0.0
+    max_flush_latency: float = 0.0
+    total_flush_latency: float = 0.0
+
+    @property
+    def mean_flush_latency(self) -> float:
+        if not self.batches:
+            return 0.0
+        return self.total_flush_latency / self.batches
+
+    @property
+    def mean_batch_size(self) -> float:
+        if not self.batches:
+            return 0.0
+        return self.rows / self.batches
+
+
+class BatchWriter:
+    """
+        Bounded queue plus a worker thread that flushes records in batches.
+
+        Args:
+            flush
+                Callable receiving a list of queued records. It is only ever
+                called from the worker thread.
+            batch_size
+                Flush as soon as this many records are pending.
+            flush_interval
+                Maximum number of seconds a record waits before being flushed.
+            queue_size
+                Maximum number of pending records. When the queue is full new
+                records are dropped (and counted) rather than blocking the
+                producer.
+            report_interval
+                Seconds between log messages summarizing the writer stats.
+                Set to 0 to disable reporting.
+    """
+
+    def __init__(self,
+                 flush: Callable[[List[Any]], None],
+                 batch_size: int = 500,
+                 flush_interval: float = 1.0,
+                 queue_size: int = 10000,
+                 report_interval: float = 60.0,
+                 name: str = "batch-writer"):
+        self.flush = flush
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.report_interval = report_interval
+        self.name = name
+        self.stats = WriterStats()
+
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the worker thread after flushing everything still queued."""
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def put(self, record: Any) -> bool:
+        """
+            Enqueue a record without blocking.
+
+            Returns: False if the queue was full and the record was dropped.
+        """
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.stats.dropped += 1
+            return False
+
+        self.stats.enqueued += 1
+        return True
+
+    def _run(self):
+        batch: List[Any] = []
+        deadline = None
+        next_report = time.monotonic() + self.report_interval
+
+        while not (self._stop.is_set() and self._queue.empty()):
+            timeout = self.flush_interval
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.monotonic())
+
+            try:
+                record = self._queue.get(timeout=min(timeout, 0.5))
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(record)
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            if batch and (len(batch) >= self.batch_size or now >= deadline or self._stop.is_set()):
+                self._flush(batch)
+                batch = []
+                deadline = None
+
+            if self.report_interval and now >= next_report:
+                self.report()
+                next_report = now + self.report_interval
+
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch: List[Any]):
+        start = time.monotonic()
+        try:
+            self.flush(batch)
+        except Exception as ex:
+            self.stats.failed_batches += 1
+            logger.error("%s failed to flush %d records: %s", self.name, len(batch), ex)
+            return
+
+        latency = time.monotonic() - start
+        stats = self.stats
+        stats.batches += 1
+        stats.rows += len(batch)
+        stats.last_batch_size = len(batch)
+        stats.max_batch_size = max(stats.max_batch_size, len(batch))
+        stats.last_flush_latency = latency
+        stats.max_flush_latency = max(stats.max_flush_latency, latency)
+        stats.total_flush_latency += latency
+
+    def report(self):
+        stats = self.stats
+        logger.info("%s: %d rows in %d batches (mean size %.1f, last %d), "
+                    "flush latency mean %.1fms / last %.1fms / max %.1fms, "
+                    "%d pending, %d dropped, %d failed batches",
+                    self.name,
+                    stats.rows,
+                    stats.batches,
+                    stats.mean_batch_size,
+                    stats.last_batch_size,
+                    stats.mean_flush_latency * 1000,
+                    stats.last_flush_latency * 1000,
+                    stats.max_flush_latency * 1000,
+                    self.pending,
+                    stats.dropped,
+                    stats.failed_batches)
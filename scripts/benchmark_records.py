@@ -0,0 +1,101 @@
+"""
+    Time and memory needed to turn database rows into record objects.
+
+    Builds a fixture of beacon_packet rows shaped like what psycopg2 returns
+    (naive datetime, text, int, bytea as memoryview) and inflates it with
+    `db.BeaconPacket.inflate_row`, next to the previous implementation
+    (dict per row into a dataclass with a __dict__, hex encoded payloads)
+    for comparison. RF rows
+    are compared as plain tuples, which `RFLog` returns, and named tuples.
+    No database is needed.
+
+    Usage: python scripts/benchmark_records.py [rows]
+"""
+from collections import namedtuple
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import binascii
+import gc
+import sys
+import time
+import tracemalloc
+
+from dateutil import tz
+
+from airsec import db
+
+RFReading = namedtuple("RFReading", ("time", "center_frequency", "rssi"))
+
+
+@dataclass
+class DictBeaconPacket:
+    time: datetime
+    bssid: str
+    ssid: str
+    rssi: int
+    channel: int
+    payload: bytes
+
+
+def inflate_with_dict(row):
+    record = dict(zip(db.BeaconPacket.column_names(), row))
+    record['time'] = record['time'].replace(tzinfo=tz.tzutc())
+    record['payload'] = binascii.unhexlify(record['payload'][1:])
+    return DictBeaconPacket(**record)
+
+
+def beacon_rows(count, hex_payload=False):
+    """`hex_payload` stores payloads the way they were before binary COPY."""
+    start = datetime(2022, 1, 1)
+    payload = b"\x00\x00" * 40
+    payload = memoryview(b"X" + binascii.hexlify(payload) if hex_payload else payload)
+    bssids = ["11:22:33:44:%02x:%02x" % (i // 256, i % 256) for i in range(1000)]
+    return [(start + timedelta(milliseconds=i), bssids[i % 1000], "InternetAP", 6, -40 - i % 50, payload)
+            for i in range(count)]
+
+
+def rf_rows(count):
+    start = datetime(2022, 1, 1)
+    return [(start + timedelta(seconds=i // 1000), 88e6 + (i % 1000) * 1e4, -30.0 - i % 20)
+            for i in range(count)]
+
+
+def measure(name, inflate, rows):
+    # Timed without tracemalloc, which slows allocation down a lot.
+    gc.collect()
+    began = time.perf_counter()
+    records = [inflate(r) for r in rows]
+    elapsed = time.perf_counter() - began
+    del records
+
+    gc.collect()
+    tracemalloc.start()
+    records = [inflate(r) for r in rows]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+
+    print("%-20s %6.2fs %6.0f ns/row %7.1f MiB %5.0f B/row"
+          % (name, elapsed, elapsed / len(rows) * 1e9, size / 2**20, size / len(rows)))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    utc = tz.tzutc()
+
+    print("%d beacon_packet rows" % count)
+    rows = beacon_rows(count, hex_payload=True)
+    measure("dict + dataclass", inflate_with_dict, rows)
+    del rows
+    rows = beacon_rows(count)
+    measure("positional + slots", db.BeaconPacket.inflate_row, rows)
+    del rows
+
+    print("%d rf_log rows" % count)
+    rows = rf_rows(count)
+    measure("tuple", lambda r: (r[0].replace(tzinfo=utc), r[1], r[2]), rows)
+    measure("namedtuple", lambda r: RFReading(r[0].replace(tzinfo=utc), r[1], r[2]), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,7 @@ def run(iface):
     iface_utils.wifi_set_monitor_mode(iface)
     db.init()
     db.setup_database()
-    wifi_scanner.sniff_access_points(iface)
+    wifi_scanner.sniff_access_points(wifi_scanner.WifiScannerConfig(iface=iface))
 
 if __name__ == "__main__":
     run()
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+import unittest
+
+from airsec import db, interfaces
+from airsec.web import api
+
+
+class TestCanonicalBSSID(unittest.TestCase):
+
+    def test_formats(self):
+        for bssid in ("11:22:33:AA:BB:CC", "11-22-33-aa-bb-cc", "112233aabbcc", "1122.33aa.bbcc"):
+            self.assertEqual(api.canonical_bssid(bssid), "11:22:33:aa:bb:cc")
+
+    def test_invalid(self):
+        for bssid in ("", "11:22:33:aa:bb", "11:22:33:aa:bb:zz"):
+            with self.assertRaises(ValueError):
+                api.canonical_bssid(bssid)
+
+
+class TestRSSIRoute(unittest.TestCase):
+    """The route with the database queries replaced."""
+
+    def setUp(self):
+        self.now = datetime(2022, 1, 1, 12, tzinfo=timezone.utc)
+        self.queried = []
+        patches = [
+            mock.patch.object(api.api, "before_first_request_funcs", []),
+            mock.patch.object(db.AppQueries, "inventory_state", lambda bssids=None: (1, self.now, 1)),
+            mock.patch.object(db.AppQueries, "rssi_series", self.rssi_series),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        api.RESPONSE_CACHE.invalidate()
+        self.client = api.api.test_client()
+
+    def rssi_series(self, bssids, since, until, bucket):
+        # Keyed by bssid::text, like the real query.
+        self.queried.append(bssids)
+        return {b: interfaces.RSSISeries(bssid=b, time=[since], samples=[1], rssi=[-40.0],
+                                         rssi_min=[-40], rssi_max=[-40])
+                for b in bssids}
+
+    def test_uppercase_bssid(self):
+        since = (self.now - timedelta(hours=1)).isoformat().replace("+", "%2B")
+        until = self.now.isoformat().replace("+", "%2B")
+        response = self.client.get("/api/v1/rssi?bssid=11:22:33:AA:BB:CC&bucket=60"
+                                   f"&since={since}&until={until}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.queried, [["11:22:33:aa:bb:cc"]])
+
+        series = response.json["series"]["11:22:33:AA:BB:CC"]
+        self.assertEqual(series["bssid"], "11:22:33:aa:bb:cc")
+        self.assertEqual(series["samples"], [1])
+
+    def test_invalid_bssid(self):
+        response = self.client.get("/api/v1/rssi?bssid=not-a-mac")
+        self.assertEqual(response.status_code, 422)
@@ -0,0 +1,94 @@
+import socket
+import threading
+import unittest
+
+from scapy.all import (
+    Dot11,
+    Dot11Beacon,
+    RadioTap,
+    raw
+)
+
+from airsec import capture
+
+BEACON = 8
+PROBE_RESPONSE = 5
+
+
+class TestManagementFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.program = capture.compile_management_filter([BEACON])
+
+    def frame(self, type_, subtype, **radiotap):
+        return raw(RadioTap(**radiotap) / Dot11(type=type_, subtype=subtype))
+
+    def test_accepts_beacons(self):
+        frame = raw(RadioTap(present="dBm_AntSignal", dBm_AntSignal=-40) /
+                    Dot11(type=0, subtype=BEACON) / Dot11Beacon())
+        self.assertEqual(capture.run_filter(self.program, frame), capture.DEFAULT_SNAPLEN)
+
+    def test_rejects_other_subtypes(self):
+        self.assertEqual(capture.run_filter(self.program, self.frame(0, PROBE_RESPONSE)), 0)
+
+    def test_rejects_data_frames(self):
+        self.assertEqual(capture.run_filter(self.program, self.frame(2, BEACON)), 0)
+
+    def test_multiple_subtypes(self):
+        program = capture.compile_management_filter([BEACON, PROBE_RESPONSE])
+        self.assertNotEqual(capture.run_filter(program, self.frame(0, PROBE_RESPONSE)), 0)
+        self.assertNotEqual(capture.run_filter(program, self.frame(0, BEACON)), 0)
+        self.assertEqual(capture.run_filter(program, self.frame(0, 4)), 0)
+
+    def test_truncated_frame(self):
+        frame = self.frame(0, BEACON)
+        self.assertEqual(capture.run_filter(self.program, frame[:8]), 0)
+
+    def test_invalid_subtype(self):
+        with self.assertRaises(ValueError):
+            capture.compile_management_filter([16])
+
+
+class TestCaptureStats(unittest.TestCase):
+
+    def test_filtered(self):
+        # tp_packets already counts the frames in tp_drops.
+        stats = capture.CaptureStats(kernel_packets=70, kernel_drops=5, interface_packets=100)
+        self.assertEqual(stats.filtered, 30)
+
+
+class TestRingCapture(unittest.TestCase):
+
+    def test_block_size_must_be_page_aligned(self):
+        with self.assertRaises(ValueError):
+            capture.RingCapture("lo", block_size=1000)
+
+    def test_capture_loopback(self):
+        cap = capture.RingCapture("lo", block_size=1 << 16, block_count=4, block_timeout_ms=10)
+        try:
+            cap.open()
+        except PermissionError:
+            self.skipTest("Capturing requires CAP_NET_RAW")
+
+        payload = b"airsec-ring-test"
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # frames() only yields when a block is ready, stopping the capture
+        # from a timer ends it even if the frame never arrives.
+        deadline = threading.Timer(5.0, cap.stop)
+        timestamp = None
+        try:
+            deadline.start()
+            sender.sendto(payload, ("127.0.0.1", 9))
+            for frame_time, frame in cap.frames():
+                if bytes(frame).endswith(payload):
+                    timestamp = frame_time
+                    cap.stop()
+                    break
+        finally:
+            deadline.cancel()
+            sender.close()
+            cap.close()
+
+        self.assertIsNotNone(timestamp, "The UDP frame was not captured within 5 seconds")
+        self.assertGreater(timestamp, 0)
+        self.assertGreaterEqual(cap.stats.delivered, 1)
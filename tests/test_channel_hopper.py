@@ -0,0 +1,113 @@
+import unittest
+
+from airsec import channel_hopper
+
+
+class TestRoundRobinScheduler(unittest.TestCase):
+
+    def test_cycles_through_channels(self):
+        scheduler = channel_hopper.RoundRobinScheduler([1, 6, 11], dwell=0.5)
+        visited = []
+        for _ in range(6):
+            channel, dwell = scheduler.next_hop()
+            scheduler.tuned(channel)
+            visited.append(channel)
+            self.assertEqual(dwell, 0.5)
+        self.assertEqual(visited, [1, 6, 11, 1, 6, 11])
+
+    def test_remove_channel(self):
+        scheduler = channel_hopper.RoundRobinScheduler([1, 6, 11])
+        scheduler.remove_channel(6)
+        self.assertEqual(scheduler.channels, (1, 11))
+        scheduler.remove_channel(1)
+        scheduler.remove_channel(11)
+        self.assertEqual(scheduler.channels, (11,))
+
+
+class TestHopFailures(unittest.TestCase):
+
+    def test_backoff(self):
+        failures = channel_hopper.HopFailures(min_delay=0.1, max_delay=0.5)
+        delays = [failures.failed(6, rejected=False)[0] for _ in range(5)]
+        self.assertEqual(delays, [0.1, 0.2, 0.4, 0.5, 0.5])
+
+        failures.succeeded(1)
+        self.assertEqual(failures.failed(6, rejected=False), (0.1, False))
+
+    def test_remove_after_repeated_rejections(self):
+        failures = channel_hopper.HopFailures(max_rejections=3)
+        self.assertFalse(failures.failed(14, rejected=True)[1])
+        self.assertFalse(failures.failed(14, rejected=True)[1])
+        # Another channel tuning fine does not clear the rejections.
+        failures.succeeded(1)
+        self.assertTrue(failures.failed(14, rejected=True)[1])
+
+    def test_success_clears_rejections(self):
+        failures = channel_hopper.HopFailures(max_rejections=2)
+        failures.failed(6, rejected=True)
+        failures.succeeded(6)
+        self.assertFalse(failures.failed(6, rejected=True)[1])
+
+
+class TestAdaptiveScheduler(unittest.TestCase):
+
+    def hop(self, scheduler, now, beacons=None):
+        channel, dwell = scheduler.next_hop(now)
+        scheduler.tuned(channel, now)
+        for bssid in (beacons or {}).get(channel, []):
+            scheduler.observe(channel, bssid)
+        return channel, dwell
+
+    def test_visits_every_channel_first(self):
+        scheduler = channel_hopper.AdaptiveScheduler([1, 6, 11], max_revisit=60)
+        visited = set()
+        now = 0.0
+        for _ in range(3):
+            channel, dwell = self.hop(scheduler, now)
+            visited.add(channel)
+            now += dwell
+        self.assertEqual(visited, {1, 6, 11})
+
+    def test_busy_channel_gets_more_airtime(self):
+        scheduler = channel_hopper.AdaptiveScheduler([1, 6, 11], min_dwell=0.1, max_dwell=1.0, max_revisit=60)
+        beacons = {6: ["00:00:00:00:00:%02x" % i for i in range(20)]}
+        airtime = {1: 0.0, 6: 0.0, 11: 0.0}
+        now = 0.0
+        for _ in range(60):
+            channel, dwell = self.hop(scheduler, now, beacons)
+            airtime[channel] += dwell
+            now += dwell
+        self.assertGreater(airtime[6], airtime[1] + airtime[11])
+
+    def test_max_revisit(self):
+        scheduler = channel_hopper.AdaptiveScheduler([1, 6, 11], min_dwell=0.1, max_dwell=1.0, max_revisit=5)
+        beacons = {6: ["00:00:00:00:00:%02x" % i for i in range(20)]}
+        last_visit = {}
+        now = 0.0
+        for _ in range(200):
+            channel, dwell = self.hop(scheduler, now, beacons)
+            if channel in last_visit:
+                # One dwell of slack for the hop that was already in progress
+                self.assertLessEqual(now - last_visit[channel], 5 + 1.0)
+            last_visit[channel] = now
+            now += dwell
+
+    def test_min_dwell_not_above_max(self):
+        with self.assertRaises(ValueError):
+            channel_hopper.AdaptiveScheduler([1], min_dwell=2, max_dwell=1)
+
+    def test_channel_at(self):
+        scheduler = channel_hopper.AdaptiveScheduler([1, 6])
+        scheduler.tuned(1)
+        scheduler.tuned(6)
+        switched = scheduler.switched_at_wallclock
+        self.assertEqual(scheduler.channel_at(switched - 0.01), 1)
+        self.assertEqual(scheduler.channel_at(switched + 0.01), 6)
+
+    def test_create_scheduler(self):
+        self.assertIsInstance(channel_hopper.create_scheduler("round_robin", [1]),
+                              channel_hopper.RoundRobinScheduler)
+        self.assertIsInstance(channel_hopper.create_scheduler("adaptive", [1]),
+                              channel_hopper.AdaptiveScheduler)
+        with self.assertRaises(ValueError):
+            channel_hopper.create_scheduler("random", [1])
@@ -0,0 +1,113 @@
+import os
+import threading
+import unittest
+
+from airsec import db
+
+
+class FakeConnection:
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.closed = False
+        self.session = {}
+
+    def close(self):
+        self.closed = True
+
+    def set_session(self, **kwargs):
+        self.session = kwargs
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def create_pool(self, **kwargs):
+        kwargs.setdefault("min_size", 1)
+        kwargs.setdefault("max_size", 2)
+        kwargs.setdefault("timeout", 0.2)
+        return db.ConnectionPool("postgres://test", connect=FakeConnection, **kwargs)
+
+    def test_reuses_connections(self):
+        pool = self.create_pool()
+        self.assertEqual(pool.size, 1)
+        first = pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        self.assertEqual(pool.stats.opened, 1)
+
+    def test_blocks_until_released(self):
+        pool = self.create_pool()
+        first = pool.acquire()
+        pool.acquire()
+        threading.Timer(0.05, pool.release, (first,)).start()
+        self.assertIs(pool.acquire(), first)
+        self.assertEqual(pool.stats.waited, 1)
+        self.assertGreater(pool.stats.max_wait, 0)
+
+    def test_connect_does_not_block_release(self):
+        connecting, proceed = threading.Event(), threading.Event()
+
+        def connect(dsn):
+            connecting.set()
+            proceed.wait(5)
+            return FakeConnection(dsn)
+
+        pool = db.ConnectionPool("postgres://test", min_size=0, max_size=2, timeout=0.2, connect=FakeConnection)
+        first = pool.acquire()
+        pool._connect = connect
+        opener = threading.Thread(target=pool.acquire)
+        opener.start()
+        try:
+            self.assertTrue(connecting.wait(5))
+            # Would deadlock on the pool lock if connecting held it.
+            released = threading.Thread(target=pool.release, args=(first,))
+            released.start()
+            released.join(1)
+            self.assertFalse(released.is_alive())
+            self.assertEqual(pool.idle, 1)
+        finally:
+            proceed.set()
+            opener.join(5)
+        self.assertEqual(pool.size, 2)
+
+    def test_timeout(self):
+        pool = self.create_pool(max_size=1)
+        pool.acquire()
+        with self.assertRaises(db.PoolTimeout):
+            pool.acquire()
+        self.assertEqual(pool.stats.timeouts, 1)
+
+    def test_discard(self):
+        pool = self.create_pool()
+        connection = pool.acquire()
+        pool.release(connection, discard=True)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.size, 0)
+        self.assertIsNot(pool.acquire(), connection)
+
+    def test_closed_connections_are_replaced(self):
+        pool = self.create_pool()
+        connection = pool.acquire()
+        pool.release(connection)
+        connection.close()
+        self.assertIsNot(pool.acquire(), connection)
+
+    def test_readonly(self):
+        pool = self.create_pool(readonly=True)
+        self.assertEqual(pool.acquire().session, {"readonly": True, "autocommit": True})
+
+    def test_fork(self):
+        pool = self.create_pool()
+        inherited = pool.acquire()
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            connection = pool.acquire()
+            pool.close()
+            ok = connection is not inherited and not inherited.closed and pool.size == 0
+            os.write(write, b"1" if ok else b"0")
+            os._exit(0)
+
+        os.waitpid(pid, 0)
+        self.assertEqual(os.read(read, 1), b"1")
+        self.assertFalse(inherited.closed)
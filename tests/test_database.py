@@ -1,4 +1,6 @@
 from datetime import datetime, timedelta, timezone
+import struct
+import time
 import unittest
 from collections import defaultdict
 
@@ -7,6 +9,7 @@ from airsec import (
     interfaces,
     applications
 )
+from airsec.web import stream
 
 
 class DatabaseTest(unittest.TestCase):
@@ -29,6 +32,9 @@ class DatabaseTest(unittest.TestCase):
 
 
     def tearDown(self) -> None:
+        for view in db.VIEWS:
+            view.drop()
+
         with db.get_cursor() as cursor:
             for table in db.TABLES:
                 cursor.execute(f"DROP TABLE {table.name}")
@@ -92,6 +98,25 @@ class WifiPacketTests(DatabaseTest):
         self.assertEqual(result.ssid, ssid)
 
 
+    def test_log_wifi_packets_batch(self):
+        date = datetime.now()
+        packets = [
+            interfaces.BeaconPacket(
+                time=date,
+                bssid="11:22:33:44:55:6%d" % i,
+                ssid="InternetAP",
+                channel=6,
+                rssi=-39,
+                payload=b"\x01" * 30)
+            for i in range(3)
+        ]
+        db.BeaconPacket.add_many(packets)
+        result = db.BeaconPacket.select()
+        self.assertEqual(len(result), len(packets))
+        for rec in result:
+            self.assertEqual(rec.payload, b"\x01" * 30)
+
+
     def test_conditional_insert_unauthorized(self):
         date = datetime.now()
         bssid = "11:22:33:44:55:66"
@@ -146,3 +171,535 @@ class TestRFLog(DatabaseTest):
         self.assertEqual(1, len(data[300]))
         self.assertEqual(-10.33, data[300][0][1])
         self.assertEqual(date.astimezone(timezone.utc), data[300][0][0])
+
+    def test_log_rf_sweep(self):
+        date = datetime.now()
+        rows = [(date, 300 + i, -10.0 - i) for i in range(10)]
+        self.assertEqual(db.RFLog.add_many(rows), len(rows))
+        data = db.RFLog.select(200,
+                               400,
+                               date - timedelta(hours=1),
+                               date + timedelta(hours=1))
+
+        self.assertEqual(len(data), len(rows))
+        self.assertEqual(-10.0, data[300][0][1])
+        self.assertEqual(-19.0, data[309][0][1])
+
+    def test_select_resolution(self):
+        date = datetime.now(timezone.utc).replace(second=30, microsecond=0)
+        db.RFLog.add_many([(date + timedelta(seconds=i), 300 + i % 2, -10.0 - i) for i in range(4)])
+        since, until = date, date + timedelta(minutes=1)
+
+        # Raw readings under a minute, the RF power aggregates above.
+        for resolution in (timedelta(seconds=10), timedelta(minutes=5), timedelta(hours=2)):
+            data = db.RFLog.select(200, 400, since, until, resolution=resolution)
+            self.assertEqual(sorted(data), [300.0, 301.0])
+            buckets = data[300.0]
+            self.assertEqual(len(buckets), 1)
+            self.assertEqual(buckets[0].samples, 2)
+            self.assertEqual(buckets[0].rssi, -11.0)
+            self.assertEqual((buckets[0].rssi_min, buckets[0].rssi_max), (-12.0, -10.0))
+            self.assertTrue(-12.0 <= buckets[0].rssi_p50 <= buckets[0].rssi_p90 <= -10.0)
+            self.assertEqual(sum(b.samples for b in data[301.0]), 2)
+
+
+class TestRFSweep(DatabaseTest):
+
+    def test_select_frequency_slice(self):
+        date = datetime.now()
+        power = [-10.0, -11.0, -12.0, -13.0, -14.0]
+        db.RFSweep.add(date, 300.0, 10.0, power)
+        data = db.RFSweep.select(315,
+                                 335,
+                                 date - timedelta(hours=1),
+                                 date + timedelta(hours=1))
+
+        self.assertTrue(isinstance(data, defaultdict))
+        self.assertEqual(sorted(data.keys()), [320.0, 330.0])
+        self.assertEqual(-12.0, data[320.0][0][1])
+        self.assertEqual(-13.0, data[330.0][0][1])
+        self.assertEqual(date.astimezone(timezone.utc), data[320.0][0][0])
+
+
+class TestRSSIAggregates(DatabaseTest):
+
+    def test_views_created(self):
+        with db.get_cursor() as cursor:
+            cursor.execute("SELECT view_name FROM timescaledb_information.continuous_aggregates;")
+            names = {r[0] for r in cursor.fetchall()}
+        self.assertEqual(names, {view.name for view in db.VIEWS})
+
+    def test_select_buckets(self):
+        date = datetime.now(timezone.utc).replace(second=30, microsecond=0)
+        bssid = "11:22:33:44:55:66"
+        packets = [
+            interfaces.BeaconPacket(time=date + timedelta(seconds=i),
+                                    bssid=bssid,
+                                    ssid="InternetAP",
+                                    channel=6,
+                                    rssi=rssi,
+                                    payload=b"\x01")
+            for i, rssi in enumerate([-40, -50, -60])
+        ]
+        db.BeaconPacket.add_many(packets)
+
+        data = db.BeaconRSSI1m.select([bssid], date, date + timedelta(minutes=1))
+        self.assertEqual(len(data[bssid]), 1)
+        bucket = data[bssid][0]
+        self.assertEqual(bucket.time, date.replace(second=0))
+        self.assertEqual(bucket.samples, 3)
+        self.assertEqual(bucket.rssi, -50.0)
+        self.assertEqual(bucket.rssi_min, -60)
+        self.assertEqual(bucket.rssi_max, -40)
+
+    def test_rssi_series(self):
+        date = datetime.now(timezone.utc).replace(second=30, microsecond=0)
+        bssids = ["11:22:33:44:55:66", "11:22:33:44:55:67"]
+        db.BeaconPacket.add_many([
+            interfaces.BeaconPacket(time=date + timedelta(seconds=i),
+                                    bssid=bssids[i % 2],
+                                    ssid="InternetAP",
+                                    channel=6,
+                                    rssi=-40 - i,
+                                    payload=b"\x01")
+            for i in range(4)
+        ])
+
+        # Raw packets for small buckets, the 1 minute aggregate for larger ones.
+        for bucket in (timedelta(seconds=2), timedelta(minutes=5)):
+            series = db.AppQueries.rssi_series(bssids, date, date + timedelta(minutes=1), bucket)
+            self.assertEqual(sorted(series), bssids)
+            self.assertEqual(sum(series[bssids[0]].samples), 2)
+            self.assertEqual(min(series[bssids[0]].rssi_min), -42)
+            self.assertEqual(max(series[bssids[1]].rssi_max), -41)
+            self.assertEqual(len(series[bssids[0]].time), len(series[bssids[0]].rssi))
+
+        self.assertEqual(db.AppQueries.first_seen(bssids, date - timedelta(days=1)), date.replace(minute=0, second=0))
+
+
+class TestRSSITiers(unittest.TestCase):
+
+    def test_coarsest_tier_that_fits(self):
+        self.assertIs(db.rssi_tier(timedelta(days=1)), db.BeaconRSSI1h)
+        self.assertIs(db.rssi_tier(timedelta(minutes=5)), db.BeaconRSSI1m)
+        self.assertIs(db.rssi_tier(timedelta(seconds=10)), db.BeaconRSSI10s)
+        self.assertIsNone(db.rssi_tier(timedelta(seconds=1)))
+
+    def test_bucket_width(self):
+        since = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        self.assertEqual(db.rssi_bucket_width(since, since + timedelta(days=1), 24), timedelta(hours=1))
+        self.assertEqual(db.rssi_bucket_width(since, since + timedelta(seconds=10), 100), timedelta(seconds=1))
+
+
+class TestRFPowerTiers(unittest.TestCase):
+
+    def test_coarsest_tier_that_fits(self):
+        self.assertIs(db.rf_power_tier(timedelta(days=7)), db.RFPower1h)
+        self.assertIs(db.rf_power_tier(timedelta(minutes=30)), db.RFPower15m)
+        self.assertIs(db.rf_power_tier(timedelta(minutes=1)), db.RFPower1m)
+        self.assertIsNone(db.rf_power_tier(timedelta(seconds=10)))
+
+    def test_percentile(self):
+        # Underflow, 65 bins of 2 dB from -100 dB, overflow.
+        histogram = [0] * (db.RF_POWER_HISTOGRAM_BINS + 2)
+        histogram[1 + 40] = 5   # [-20, -18)
+        histogram[1 + 45] = 5   # [-10, -8)
+
+        self.assertEqual(db.rf_power_percentile(histogram, 0.5), -18.0)
+        self.assertAlmostEqual(db.rf_power_percentile(histogram, 0.9), -8.4)
+        self.assertEqual(db.rf_power_percentile(histogram, 0.9, high=-9.0), -9.0)
+        self.assertIsNone(db.rf_power_percentile([0] * len(histogram), 0.5))
+
+        histogram[-1] = 10
+        self.assertEqual(db.rf_power_percentile(histogram, 0.9), db.RF_POWER_HISTOGRAM_MAX)
+
+
+class TestAllowListGeneration(unittest.TestCase):
+
+    def test_invalidate_during_load(self):
+        loads = [frozenset(), frozenset(["11:22:33:44:55:66"])]
+
+        class Cache(db.AllowListCache):
+            def _load(self):
+                bssids = loads.pop(0)
+                if not bssids:
+                    # A NOTIFY arriving while the SELECT runs.
+                    self.invalidate()
+                return bssids
+
+        cache = Cache(listen=False)
+        self.assertFalse(cache.contains("11:22:33:44:55:66"))
+        self.assertTrue(cache.contains("11:22:33:44:55:66"))
+        self.assertEqual(cache.stats.reloads, 2)
+
+
+class TestInflateRow(unittest.TestCase):
+
+    def test_beacon_packet(self):
+        date = datetime(2022, 1, 1, 12, 30)
+        payload = b"\x00\x00\x01"
+        row = (date, "11:22:33:44:55:66", "InternetAP", 6, -40, memoryview(payload))
+
+        packet = db.BeaconPacket.inflate_row(row)
+        self.assertEqual(packet, interfaces.BeaconPacket(time=date.replace(tzinfo=timezone.utc),
+                                                         bssid="11:22:33:44:55:66",
+                                                         ssid="InternetAP",
+                                                         rssi=-40,
+                                                         channel=6,
+                                                         payload=payload))
+
+    def test_legacy_hex_payload(self):
+        payload = b"\x00\x00\x01"
+        row = (datetime(2022, 1, 1), "11:22:33:44:55:66", None, 6, -40, memoryview(b"X000001"))
+        self.assertEqual(db.BeaconPacket.inflate_row(row).payload, payload)
+
+    def test_access_point(self):
+        date = datetime(2022, 1, 1, 12, 30)
+        row = ("11:22:33:44:55:66", date, date, "InternetAP", 6, -40, 3)
+
+        ap = db.APInventory.inflate_row(row)
+        self.assertEqual((ap.channel, ap.rssi, ap.beacon_count), (6, -40, 3))
+        self.assertEqual(ap.last_seen, date.replace(tzinfo=timezone.utc))
+
+
+class TestBinaryCopy(unittest.TestCase):
+
+    def read_rows(self, data):
+        self.assertTrue(data.startswith(b"PGCOPY\n\xff\r\n\x00"))
+        offset, rows = 19, []
+        while True:
+            count, = struct.unpack_from("!h", data, offset)
+            offset += 2
+            if count == -1:
+                self.assertEqual(offset, len(data))
+                return rows
+
+            row = []
+            for _ in range(count):
+                length, = struct.unpack_from("!i", data, offset)
+                offset += 4
+                if length == -1:
+                    row.append(None)
+                    continue
+                row.append(data[offset:offset + length])
+                offset += length
+            rows.append(row)
+
+    def test_encode_beacons(self):
+        date = datetime(2000, 1, 1, 0, 0, 1, 5, tzinfo=timezone.utc)
+        packets = [
+            interfaces.BeaconPacket(time=date, bssid="11:22:33:44:55:66", ssid="InternetAP",
+                                    channel=6, rssi=-40, payload=b"\x00\x01"),
+            interfaces.BeaconPacket(time=date, bssid="11:22:33:44:55:67", ssid=None,
+                                    channel=11, rssi=-70, payload=b""),
+        ]
+
+        rows = self.read_rows(db.BeaconPacket.encode_copy(packets))
+        self.assertEqual(rows[0], [struct.pack("!q", 1000005),
+                                   bytes.fromhex("112233445566"),
+                                   b"InternetAP",
+                                   struct.pack("!i", 6),
+                                   struct.pack("!i", -40),
+                                   b"\x00\x01"])
+        self.assertIsNone(rows[1][2])
+        self.assertEqual(rows[1][5], b"")
+
+
+class TestAPInventory(DatabaseTest):
+
+    def beacon(self, date, bssid, rssi, ssid="InternetAP"):
+        return interfaces.BeaconPacket(time=date,
+                                       bssid=bssid,
+                                       ssid=ssid,
+                                       channel=6,
+                                       rssi=rssi,
+                                       payload=b"\x01")
+
+    def test_upsert_on_ingest(self):
+        date = datetime.now(timezone.utc)
+        bssid = "11:22:33:44:55:66"
+        db.add_beacons([self.beacon(date, bssid, -40), self.beacon(date + timedelta(seconds=1), bssid, -45)])
+        db.add_beacons([self.beacon(date - timedelta(seconds=5), bssid, -70, ssid="Old"),
+                        self.beacon(date + timedelta(seconds=2), bssid, -50, ssid="New")])
+
+        self.assertEqual(len(db.BeaconPacket.select()), 4)
+        inventory = db.AppQueries.latest_beacons()
+        self.assertEqual(len(inventory), 1)
+        ap = inventory[0]
+        self.assertEqual(ap.bssid, bssid)
+        self.assertEqual(ap.beacon_count, 4)
+        self.assertEqual(ap.first_seen, date - timedelta(seconds=5))
+        self.assertEqual(ap.last_seen, date + timedelta(seconds=2))
+        self.assertEqual(ap.ssid, "New")
+        self.assertEqual(ap.rssi, -50)
+
+    def test_unauthorized(self):
+        date = datetime.now(timezone.utc)
+        db.AllowedBeacons.add("11:22:33:44:55:66")
+        db.add_beacons([self.beacon(date, "11:22:33:44:55:66", -40),
+                        self.beacon(date, "77:88:99:11:22:33", -40),
+                        self.beacon(date, "77:88:99:11:22:34", -40)])
+
+        unauthorized = db.AppQueries.unauthorized_beacons()
+        self.assertEqual([ap.bssid for ap in unauthorized], ["77:88:99:11:22:33", "77:88:99:11:22:34"])
+
+    def test_backfill(self):
+        date = datetime.now(timezone.utc)
+        bssid = "11:22:33:44:55:66"
+        db.BeaconPacket.add_many([self.beacon(date, bssid, -40), self.beacon(date + timedelta(seconds=1), bssid, -45)])
+        db.APInventory.backfill()
+
+        inventory = db.AppQueries.latest_beacons()
+        self.assertEqual(len(inventory), 1)
+        self.assertEqual(inventory[0].beacon_count, 2)
+        self.assertEqual(inventory[0].rssi, -45)
+
+    def test_latest_since(self):
+        date = datetime.now(timezone.utc)
+        db.add_beacons([self.beacon(date - timedelta(minutes=5), "11:22:33:44:55:66", -40),
+                        self.beacon(date, "77:88:99:11:22:33", -40)])
+
+        changed = db.AppQueries.latest_beacons(since=date - timedelta(minutes=1))
+        self.assertEqual([ap.bssid for ap in changed], ["77:88:99:11:22:33"])
+        self.assertEqual(db.AppQueries.latest_beacons(since=date), [])
+
+    def test_inventory_state(self):
+        date = datetime.now(timezone.utc)
+        self.assertEqual(db.AppQueries.inventory_state(), (0, None, 0))
+
+        db.add_beacons([self.beacon(date, "11:22:33:44:55:66", -40),
+                        self.beacon(date + timedelta(seconds=1), "77:88:99:11:22:33", -40)])
+        self.assertEqual(db.AppQueries.inventory_state(), (2, date + timedelta(seconds=1), 2))
+        self.assertEqual(db.AppQueries.inventory_state(["11:22:33:44:55:66"]), (1, date, 1))
+
+
+class TestEvilTwinEvents(DatabaseTest):
+
+    def test_latest_event_per_bssid(self):
+        date = datetime.now(timezone.utc)
+        events = [
+            interfaces.EvilTwinEvent(time=date + timedelta(seconds=i),
+                                     bssid="77:88:99:11:22:33",
+                                     ssid="InternetAP",
+                                     channel=6,
+                                     rssi=-40 - i)
+            for i in range(3)
+        ]
+        db.EvilTwinEvent.add_many(events)
+
+        twins = db.AppQueries.evil_twins()
+        self.assertEqual(twins, [events[-1]])
+
+        # Authorized since
+        db.AllowedBeacons.add("77:88:99:11:22:33")
+        self.assertEqual(db.AppQueries.evil_twins(), [])
+
+    def test_backfill(self):
+        date = datetime.now(timezone.utc).replace(microsecond=0)
+        db.AllowedBeacons.add("11:22:33:44:55:66")
+        db.BeaconPacket.add_many([
+            interfaces.BeaconPacket(time=date + timedelta(seconds=i),
+                                    bssid=bssid,
+                                    ssid="InternetAP",
+                                    channel=6,
+                                    rssi=-40 - i,
+                                    payload=b"\x01")
+            for i, bssid in enumerate(["11:22:33:44:55:66", "77:88:99:11:22:33", "77:88:99:11:22:33"])
+        ])
+        db.APInventory.backfill()
+        db.EvilTwinEvent.backfill()
+
+        self.assertEqual(db.AppQueries.evil_twins(),
+                         [interfaces.EvilTwinEvent(time=date + timedelta(seconds=2),
+                                                   bssid="77:88:99:11:22:33",
+                                                   ssid="InternetAP",
+                                                   channel=6,
+                                                   rssi=-42)])
+
+    def test_authorized_ssids(self):
+        db.AllowedBeacons.add(["11:22:33:44:55:66", "11:22:33:44:55:67"])
+        db.add_beacons([interfaces.BeaconPacket(time=datetime.now(timezone.utc),
+                                                bssid="11:22:33:44:55:66",
+                                                ssid="InternetAP",
+                                                channel=6,
+                                                rssi=-40,
+                                                payload=b"\x01")])
+
+        self.assertEqual(sorted(db.AppQueries.authorized_ssids()),
+                         [("11:22:33:44:55:66", "InternetAP"), ("11:22:33:44:55:67", None)])
+
+
+class TestAllowListCache(DatabaseTest):
+
+    def test_hits_and_misses(self):
+        cache = db.AllowListCache(listen=False)
+        db.AllowedBeacons.add("11:22:33:44:55:66")
+        self.assertTrue(cache.contains("11:22:33:44:55:66"))
+        self.assertFalse(cache.contains("77:88:99:11:22:33"))
+        self.assertEqual((cache.stats.misses, cache.stats.hits), (1, 1))
+
+        cache.invalidate()
+        self.assertTrue(cache.contains("11:22:33:44:55:66".upper()))
+        self.assertEqual(cache.stats.reloads, 2)
+
+    def test_max_staleness(self):
+        cache = db.AllowListCache(max_staleness=0, listen=False)
+        cache.contains("11:22:33:44:55:66")
+        cache.contains("11:22:33:44:55:66")
+        self.assertEqual(cache.stats.reloads, 2)
+
+    def test_notify_invalidates(self):
+        cache = db.AllowListCache()
+        self.assertFalse(cache.contains("11:22:33:44:55:66"))
+        try:
+            # Give the listener time to connect, then change the table the
+            # way another process would (without invalidating `cache` directly).
+            time.sleep(1)
+            with db.get_cursor() as cursor:
+                cursor.execute(f"INSERT INTO {db.AllowedBeacons.name} VALUES ('11:22:33:44:55:66');")
+
+            deadline = time.monotonic() + 5
+            while cache.stats.notifications < 1 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertTrue(cache.contains("11:22:33:44:55:66"))
+        finally:
+            cache.stop()
+
+    def test_batched_unauthorized_insert(self):
+        db.AllowedBeacons.add("11:22:33:44:55:66")
+        packets = [
+            interfaces.BeaconPacket(time=datetime.now(),
+                                    bssid=bssid,
+                                    ssid="InternetAP",
+                                    channel=6,
+                                    rssi=-40,
+                                    payload=b"\x01")
+            for bssid in ["11:22:33:44:55:66", "77:88:99:11:22:33", "77:88:99:11:22:34"]
+        ]
+        self.assertEqual(db.add_unauthorized_packets(packets), 2)
+        self.assertEqual(len(db.BeaconPacket.select()), 2)
+
+
+class TestStreamingSelect(DatabaseTest):
+
+    def test_beacon_packet_iter_select(self):
+        date = datetime.now()
+        packets = [
+            interfaces.BeaconPacket(time=date,
+                                    bssid="11:22:33:44:55:%02x" % i,
+                                    ssid="InternetAP",
+                                    channel=6,
+                                    rssi=-40,
+                                    payload=b"\x01")
+            for i in range(5)
+        ]
+        db.BeaconPacket.add_many(packets)
+
+        streamed = list(db.BeaconPacket.iter_select("ORDER BY bssid", itersize=2))
+        self.assertEqual([p.bssid for p in streamed], [p.bssid for p in packets])
+
+        batches = list(db.BeaconPacket.iter_select_batches("ORDER BY bssid", itersize=2))
+        self.assertEqual([len(b) for b in batches], [2, 2, 1])
+
+    def test_rf_log_iter_select(self):
+        date = datetime.now()
+        db.RFLog.add_many([(date, 300 + i, -10.0 - i) for i in range(10)])
+        since, until = date - timedelta(hours=1), date + timedelta(hours=1)
+
+        rows = sorted(db.RFLog.iter_select(302, 305, since, until, itersize=3), key=lambda r: r[1])
+        self.assertEqual([(f, r) for _, f, r in rows], [(302.0, -12.0), (303.0, -13.0), (304.0, -14.0), (305.0, -15.0)])
+        self.assertEqual(rows[0][0], date.astimezone(timezone.utc))
+
+        batches = list(db.RFLog.iter_select_batches(300, 309, since, until, itersize=4))
+        self.assertEqual([len(b) for b in batches], [4, 4, 2])
+
+    def test_rf_sweep_iter_select(self):
+        date = datetime.now()
+        db.RFSweep.add(date, 300.0, 10.0, [-10.0, -11.0, -12.0])
+        rows = list(db.RFSweep.iter_select(305, 325, date - timedelta(hours=1), date + timedelta(hours=1)))
+        self.assertEqual([(f, r) for _, f, r in rows], [(310.0, -11.0), (320.0, -12.0)])
+
+
+class TestLiveStream(DatabaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.broker = stream.StreamBroker(coalesce=0)
+        self.subscriber = self.broker.subscribe()
+        # Give the listener time to connect before anything is written.
+        time.sleep(1)
+
+    def tearDown(self):
+        self.broker.stop()
+        super().tearDown()
+
+    def beacon(self, date, bssid):
+        return interfaces.BeaconPacket(time=date,
+                                       bssid=bssid,
+                                       ssid="InternetAP",
+                                       channel=6,
+                                       rssi=-40,
+                                       payload=b"\x01")
+
+    def test_inventory_event(self):
+        date = datetime.now(timezone.utc)
+        db.add_beacons([self.beacon(date, "11:22:33:44:55:66")])
+
+        message = self.subscriber.queue.get(timeout=5)
+        self.assertTrue(message.startswith("event: inventory\n"))
+        self.assertIn("11:22:33:44:55:66", message)
+
+    def test_evil_twin_event(self):
+        date = datetime.now(timezone.utc)
+        db.EvilTwinEvent.add_many([interfaces.EvilTwinEvent(time=date,
+                                                            bssid="77:88:99:11:22:33",
+                                                            ssid="InternetAP",
+                                                            channel=6,
+                                                            rssi=-40)])
+
+        message = self.subscriber.queue.get(timeout=5)
+        self.assertTrue(message.startswith("event: evil-twin\n"))
+        self.assertIn("77:88:99:11:22:33", message)
+
+
+class TestStorage(DatabaseTest):
+
+    def policies(self):
+        with db.get_cursor() as cursor:
+            cursor.execute("""
+            SELECT hypertable_name, proc_name FROM timescaledb_information.jobs
+            WHERE proc_name IN ('policy_compression', 'policy_retention')
+            ORDER BY 1, 2;
+            """)
+            return cursor.fetchall()
+
+    def test_policies_applied_once(self):
+        policies = self.policies()
+        self.assertIn(("beacon_packet", "policy_compression"), policies)
+        self.assertIn(("beacon_packet", "policy_retention"), policies)
+        self.assertNotIn(("evil_twin_event", "policy_retention"), policies)
+
+        for table in db.TABLES:
+            table.configure_storage()
+        self.assertEqual(self.policies(), policies)
+
+    def test_compressed_chunks_are_readable(self):
+        date = datetime.now(timezone.utc) - timedelta(days=2)
+        packets = [
+            interfaces.BeaconPacket(time=date + timedelta(seconds=i),
+                                    bssid="11:22:33:44:55:6%d" % (i % 2),
+                                    ssid="InternetAP",
+                                    channel=6,
+                                    rssi=-40,
+                                    payload=b"\x00\x01" * 50)
+            for i in range(100)
+        ]
+        db.BeaconPacket.add_many(packets)
+
+        with db.get_cursor() as cursor:
+            cursor.execute("SELECT compress_chunk(c) FROM show_chunks('beacon_packet') c;")
+
+        stats = {s.table: s for s in db.compression_stats()}
+        self.assertEqual(stats["beacon_packet"].compressed_chunks, stats["beacon_packet"].chunks)
+        self.assertGreater(stats["beacon_packet"].after_bytes, 0)
+        self.assertEqual(len(db.BeaconPacket.select()), len(packets))
@@ -0,0 +1,115 @@
+from datetime import datetime
+import time
+import unittest
+
+from airsec import detection, interfaces
+
+
+def beacon(bssid, ssid):
+    return interfaces.BeaconPacket(time=datetime.now(),
+                                   bssid=bssid,
+                                   ssid=ssid,
+                                   rssi=-40,
+                                   channel=6,
+                                   payload=b"")
+
+
+class TestEvilTwinDetector(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = detection.EvilTwinDetector(cooldown=60, reload_interval=0)
+        self.detector.load([("11:22:33:44:55:66", "InternetAP"), ("11:22:33:44:55:67", None)])
+
+    def test_authorized_bssid(self):
+        self.assertIsNone(self.detector.check(beacon("11:22:33:44:55:66", "InternetAP")))
+
+    def test_unrelated_ssid(self):
+        self.assertIsNone(self.detector.check(beacon("77:88:99:11:22:33", "CoffeeShop")))
+        self.assertIsNone(self.detector.check(beacon("77:88:99:11:22:33", None)))
+
+    def test_evil_twin(self):
+        event = self.detector.check(beacon("77:88:99:11:22:33", "InternetAP"))
+        self.assertIsNotNone(event)
+        self.assertEqual(event.bssid, "77:88:99:11:22:33")
+        self.assertEqual(event.ssid, "InternetAP")
+
+    def test_cooldown(self):
+        self.assertIsNotNone(self.detector.check(beacon("77:88:99:11:22:33", "InternetAP")))
+        self.assertIsNone(self.detector.check(beacon("77:88:99:11:22:33", "InternetAP")))
+        self.assertIsNotNone(self.detector.check(beacon("77:88:99:11:22:34", "InternetAP")))
+
+    def test_learns_ssids_of_authorized_bssids(self):
+        self.assertIsNone(self.detector.check(beacon("77:88:99:11:22:33", "Office")))
+        self.assertIsNone(self.detector.check(beacon("11:22:33:44:55:67", "Office")))
+        self.assertIsNotNone(self.detector.check(beacon("77:88:99:11:22:33", "Office")))
+
+    def test_case_insensitive_bssid(self):
+        self.assertIsNone(self.detector.check(beacon("11:22:33:44:55:66".upper(), "InternetAP")))
+
+
+class StubAllowList:
+    def __init__(self, bssids):
+        self.set(bssids)
+
+    def set(self, bssids):
+        self.current = frozenset(bssids)
+
+    def bssids(self):
+        return self.current
+
+
+class StubDetector(detection.EvilTwinDetector):
+    """Loads (BSSID, SSID) pairs from `allowed` instead of the database."""
+
+    def __init__(self, allowed, failures=0, **kwargs):
+        super().__init__(**kwargs)
+        self.allowed = allowed
+        self.failures = failures
+
+    def reload(self):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database is down")
+        self.load(self.allowed)
+
+
+class TestEvilTwinDetectorReload(unittest.TestCase):
+
+    def test_reload_on_allow_list_change(self):
+        allow_list = StubAllowList(["11:22:33:44:55:66"])
+        detector = StubDetector([("11:22:33:44:55:66", "InternetAP")],
+                                reload_interval=0,
+                                allow_list=allow_list)
+        detector.refresh()
+        self.assertIsNotNone(detector.check(beacon("77:88:99:11:22:33", "InternetAP")))
+
+        detector.allowed.append(("77:88:99:11:22:34", "InternetAP"))
+        allow_list.set(["11:22:33:44:55:66", "77:88:99:11:22:34"])
+        detector.refresh()
+        self.assertIsNone(detector.check(beacon("77:88:99:11:22:34", "InternetAP")))
+
+    def test_retry_failed_first_load(self):
+        detector = StubDetector([("11:22:33:44:55:66", "InternetAP")],
+                                failures=1,
+                                reload_interval=0,
+                                retry_interval=0)
+        detector.refresh()
+        self.assertIsNone(detector.check(beacon("77:88:99:11:22:33", "InternetAP")))
+        detector.refresh()
+        self.assertIsNotNone(detector.check(beacon("77:88:99:11:22:33", "InternetAP")))
+
+    def test_check_does_not_load(self):
+        detector = StubDetector([("11:22:33:44:55:66", "InternetAP")], failures=1)
+        self.assertIsNone(detector.check(beacon("77:88:99:11:22:33", "InternetAP")))
+        self.assertEqual(detector.failures, 1)
+
+    def test_background_reload(self):
+        detector = StubDetector([("11:22:33:44:55:66", "InternetAP")], poll_interval=0.01)
+        detector.start()
+        try:
+            deadline = time.monotonic() + 5
+            while not detector.authorized and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            detector.stop()
+        self.assertIsNotNone(detector.check(beacon("77:88:99:11:22:33", "InternetAP")))
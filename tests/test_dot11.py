@@ -0,0 +1,82 @@
+import unittest
+
+from scapy.all import (
+    Dot11,
+    Dot11Beacon,
+    Dot11Elt,
+    RadioTap,
+    raw
+)
+
+from airsec import dot11
+
+
+def make_beacon(ssid=b"InternetAP", channel=6, rssi=-39, bssid="11:22:33:44:55:66", **radiotap):
+    frame = RadioTap(present="Flags+Rate+Channel+dBm_AntSignal",
+                     Flags=0,
+                     Rate=2,
+                     ChannelFrequency=2437,
+                     ChannelFlags=0x00a0,
+                     dBm_AntSignal=rssi,
+                     **radiotap)
+    frame /= Dot11(type=0, subtype=8, addr1="ff:ff:ff:ff:ff:ff", addr2=bssid, addr3=bssid)
+    frame /= Dot11Beacon(cap="ESS")
+    frame /= Dot11Elt(ID="SSID", info=ssid)
+    if channel is not None:
+        frame /= Dot11Elt(ID="DSset", info=bytes([channel]))
+    return raw(frame)
+
+
+class TestBeaconParser(unittest.TestCase):
+
+    def test_parse_beacon(self):
+        beacon = dot11.parse_beacon(make_beacon())
+        self.assertEqual(beacon.bssid, "11:22:33:44:55:66")
+        self.assertEqual(beacon.ssid, "InternetAP")
+        self.assertEqual(beacon.channel, 6)
+        self.assertEqual(beacon.rssi, -39)
+
+    def test_parse_memoryview(self):
+        beacon = dot11.parse_beacon(memoryview(make_beacon()))
+        self.assertEqual(beacon.ssid, "InternetAP")
+
+    def test_channel_from_radiotap(self):
+        beacon = dot11.parse_beacon(make_beacon(channel=None))
+        self.assertEqual(beacon.channel, 6)
+
+    def test_tsft_alignment(self):
+        frame = RadioTap(present="TSFT+Flags+dBm_AntSignal", mac_timestamp=1234, Flags=0, dBm_AntSignal=-70)
+        frame /= Dot11(type=0, subtype=8, addr3="aa:bb:cc:dd:ee:ff") / Dot11Beacon()
+        frame /= Dot11Elt(ID="DSset", info=b"\x0b")
+        beacon = dot11.parse_beacon(raw(frame))
+        self.assertEqual(beacon.rssi, -70)
+        self.assertEqual(beacon.channel, 11)
+        self.assertIsNone(beacon.ssid)
+
+    def test_rejects_non_beacons(self):
+        frame = RadioTap() / Dot11(type=2, subtype=0, addr1="ff:ff:ff:ff:ff:ff")
+        self.assertIsNone(dot11.parse_beacon(raw(frame)))
+        probe = RadioTap() / Dot11(type=0, subtype=4)
+        self.assertIsNone(dot11.parse_beacon(raw(probe)))
+
+    def test_rejects_truncated(self):
+        frame = make_beacon()
+        self.assertIsNone(dot11.parse_beacon(frame[:30]))
+        self.assertIsNone(dot11.parse_beacon(b""))
+
+    def test_frequency_to_channel(self):
+        self.assertEqual(dot11.frequency_to_channel(2412), 1)
+        self.assertEqual(dot11.frequency_to_channel(2484), 14)
+        self.assertEqual(dot11.frequency_to_channel(5180), 36)
+        self.assertIsNone(dot11.frequency_to_channel(900))
+
+
+class TestChannelFrequency(unittest.TestCase):
+
+    def test_round_trip(self):
+        for channel in list(range(1, 15)) + [36, 40, 149, 165]:
+            self.assertEqual(dot11.frequency_to_channel(dot11.channel_to_frequency(channel)), channel)
+
+    def test_unsupported(self):
+        self.assertIsNone(dot11.channel_to_frequency(0))
+        self.assertIsNone(dot11.channel_to_frequency(200))
@@ -0,0 +1,38 @@
+import gzip
+import json
+import unittest
+
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+from werkzeug.wrappers import Response
+
+from airsec.web import encoding
+
+
+def accept(header):
+    return parse_accept_header(header, Accept)
+
+
+class TestEncoding(unittest.TestCase):
+
+    def test_dumps(self):
+        self.assertEqual(json.loads(encoding.dumps({"a": [1, "b"]})), {"a": [1, "b"]})
+
+    def test_negotiate(self):
+        self.assertEqual(encoding.negotiate(accept("gzip")), "gzip")
+        self.assertIsNone(encoding.negotiate(accept("identity")))
+        self.assertIsNone(encoding.negotiate(accept("")))
+        self.assertEqual(encoding.negotiate(accept("*")), encoding.encodings()[0])
+
+    def test_compress_response(self):
+        body = encoding.dumps({"rssi": [-40] * 1000})
+        response = encoding.compress_response(Response(body, mimetype="application/json"), accept("gzip"))
+
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.vary)
+        self.assertEqual(gzip.decompress(response.get_data()), body)
+
+    def test_small_responses_are_not_compressed(self):
+        response = encoding.compress_response(Response(b"{}", mimetype="application/json"), accept("gzip"))
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.get_data(), b"{}")
@@ -1,5 +1,6 @@
 import unittest
 import json
+import pickle
 from datetime import datetime
 from airsec import interfaces
 
@@ -40,3 +41,42 @@ class TestInterfaces(unittest.TestCase):
 
         self.assertIsInstance(parsed, interfaces.BeaconPacketAPI)
         self.assertEqual(parsed, bp)
+
+    def test_to_dict_does_not_mutate(self):
+        bp = interfaces.BeaconPacketAPI(
+            time=datetime.now(),
+            bssid="11",
+            ssid="Test",
+            rssi=-30,
+            channel=6
+        )
+
+        self.assertEqual(bp.to_dict()['time'], bp.time.isoformat())
+        self.assertIsInstance(bp.time, datetime)
+        self.assertEqual(bp.to_dict(), bp.to_dict())
+
+    def test_to_columns(self):
+        now = datetime.now()
+        beacons = [
+            interfaces.BeaconPacketAPI(time=now, bssid="11", ssid="Test", rssi=-30, channel=6),
+            interfaces.BeaconPacketAPI(time=now, bssid="22", ssid="Other", rssi=-60, channel=11),
+        ]
+
+        columns = interfaces.BeaconPacketAPI.to_columns(beacons)
+        self.assertEqual(columns['bssid'], ["11", "22"])
+        self.assertEqual(columns['rssi'], [-30, -60])
+        self.assertEqual(columns['time'], [now.isoformat()] * 2)
+        self.assertEqual(set(columns), set(beacons[0].to_dict()))
+
+    def test_records_are_slotted(self):
+        bp = interfaces.BeaconPacket(
+            time=datetime.now(),
+            bssid="11",
+            ssid="Test",
+            rssi=-30,
+            channel=6,
+            payload=b"\x01"
+        )
+
+        self.assertFalse(hasattr(bp, "__dict__"))
+        self.assertEqual(pickle.loads(pickle.dumps(bp)), bp)
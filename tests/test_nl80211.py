@@ -0,0 +1,85 @@
+import errno
+import socket
+import struct
+import threading
+import unittest
+
+from airsec import nl80211
+
+
+class TestAttributes(unittest.TestCase):
+
+    def test_pack_and_parse(self):
+        data = (nl80211.pack_u32(nl80211.NL80211_ATTR_IFINDEX, 7)
+                + nl80211.pack_string(nl80211.NL80211_ATTR_IFNAME, "wlan1")
+                + nl80211.pack_flags(nl80211.NL80211_ATTR_MNTR_FLAGS, [nl80211.NL80211_MNTR_FLAG_CONTROL]))
+        self.assertEqual(len(data) % 4, 0)
+
+        attrs = nl80211.parse_attrs(data)
+        self.assertEqual(struct.unpack("=I", attrs[nl80211.NL80211_ATTR_IFINDEX])[0], 7)
+        self.assertEqual(attrs[nl80211.NL80211_ATTR_IFNAME], b"wlan1\0")
+        flags = nl80211.parse_attrs(attrs[nl80211.NL80211_ATTR_MNTR_FLAGS])
+        self.assertEqual(list(flags), [nl80211.NL80211_MNTR_FLAG_CONTROL])
+
+    def test_interface_from_attrs(self):
+        attrs = nl80211.parse_attrs(nl80211.pack_u32(nl80211.NL80211_ATTR_IFINDEX, 3)
+                                    + nl80211.pack_u32(nl80211.NL80211_ATTR_WIPHY, 0)
+                                    + nl80211.pack_string(nl80211.NL80211_ATTR_IFNAME, "wlan0")
+                                    + nl80211.pack_u32(nl80211.NL80211_ATTR_IFTYPE, nl80211.NL80211_IFTYPE_MONITOR)
+                                    + nl80211.pack_attr(nl80211.NL80211_ATTR_MAC, bytes.fromhex("0013eff00001"))
+                                    + nl80211.pack_u32(nl80211.NL80211_ATTR_WIPHY_FREQ, 2437))
+        iface = nl80211.NL80211._interface(attrs)
+        self.assertEqual(iface, nl80211.WirelessInterface(name="wlan0",
+                                                          ifindex=3,
+                                                          wiphy=0,
+                                                          addr="00:13:ef:f0:00:01",
+                                                          type="monitor",
+                                                          frequency=2437))
+
+
+class TestNetlinkTimeout(unittest.TestCase):
+
+    def test_timeout_is_netlink_error(self):
+        # A socket the kernel never answers on.
+        sock = nl80211.NetlinkSocket.__new__(nl80211.NetlinkSocket)
+        sock.sock, peer = socket.socketpair()
+        sock.sock.settimeout(0.01)
+        sock._seq = 0
+        sock._lock = threading.Lock()
+        try:
+            with self.assertRaises(nl80211.NetlinkError) as ctx:
+                sock.request(nl80211.GENL_ID_CTRL, b"")
+            self.assertEqual(ctx.exception.errno, errno.ETIMEDOUT)
+        finally:
+            sock.close()
+            peer.close()
+
+
+class TestNetlinkSocket(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            self.sock = nl80211.NetlinkSocket(nl80211.NETLINK_GENERIC)
+        except OSError as ex:
+            self.skipTest(f"Generic netlink not available: {ex}")
+
+    def tearDown(self):
+        self.sock.close()
+
+    def get_family(self, name):
+        payload = (struct.pack("=BBH", nl80211.CTRL_CMD_GETFAMILY, 1, 0)
+                   + nl80211.pack_string(nl80211.CTRL_ATTR_FAMILY_NAME, name))
+        return self.sock.request(nl80211.GENL_ID_CTRL, payload)
+
+    def test_request(self):
+        replies = self.get_family("nlctrl")
+        self.assertEqual(len(replies), 1)
+        attrs = nl80211.parse_attrs(replies[0][1], 4)
+        self.assertEqual(struct.unpack("=H", attrs[nl80211.CTRL_ATTR_FAMILY_ID][:2])[0], nl80211.GENL_ID_CTRL)
+
+    def test_error(self):
+        with self.assertRaises(nl80211.NetlinkError) as ctx:
+            self.get_family("no-such-family")
+        self.assertEqual(ctx.exception.errno, errno.ENOENT)
+        # The socket remains usable after an error
+        self.assertEqual(len(self.get_family("nlctrl")), 1)
@@ -0,0 +1,132 @@
+import os
+import queue
+import sys
+import threading
+import time
+import unittest
+
+from airsec import pipeline
+
+# Stage targets are module level so spawned processes can import them.
+
+
+def crash(stop, counters, parent_pid):
+    counters.received.value += 1
+    sys.exit(1)
+
+
+def produce(sink, count, stop, counters, parent_pid):
+    for i in range(count):
+        sink.put([i])
+        counters.emitted.value += 1
+    stop.wait(30)
+
+
+def relay(source, sink, delay, stop, counters, parent_pid):
+    for batch in pipeline._batches(source, stop, parent_pid):
+        counters.received.value += len(batch)
+        time.sleep(delay)
+        sink.put(batch)
+        counters.emitted.value += len(batch)
+
+
+def consume(source, results, stop, counters, parent_pid):
+    for batch in pipeline._batches(source, stop, parent_pid):
+        counters.received.value += len(batch)
+        results.put(batch)
+
+
+class TestBatches(unittest.TestCase):
+
+    def test_drains_before_stopping(self):
+        source, stop = queue.Queue(), threading.Event()
+        for i in range(3):
+            source.put([i])
+        stop.set()
+        self.assertEqual(list(pipeline._batches(source, stop, os.getppid())), [[0], [1], [2]])
+
+    def test_stops_when_orphaned(self):
+        source, stop = queue.Queue(), threading.Event()
+        source.put([0])
+        # Not our parent, as if the supervisor had died.
+        self.assertEqual(list(pipeline._batches(source, stop, -1)), [[0]])
+
+
+class TestStageCounters(unittest.TestCase):
+
+    def test_snapshot(self):
+        counters = pipeline.StageCounters()
+        counters.received.value += 3
+        counters.dropped.value += 1
+        self.assertEqual(counters.snapshot(), {"received": 3, "emitted": 0, "dropped": 1, "errors": 0})
+
+
+class TestStage(unittest.TestCase):
+
+    def setUp(self):
+        self.backoff = pipeline.RESTART_BACKOFF
+
+    def tearDown(self):
+        pipeline.RESTART_BACKOFF = self.backoff
+
+    def test_restart_crashed_stage(self):
+        stage = pipeline.Stage("crash", crash, (), pipeline.CONTEXT.Event())
+        stage.start()
+        stage.join(30)
+        self.assertFalse(stage.alive)
+
+        # Within the backoff the stage is left alone.
+        pipeline.RESTART_BACKOFF = 60
+        self.assertFalse(stage.restart_if_dead())
+
+        pipeline.RESTART_BACKOFF = 0
+        self.assertTrue(stage.restart_if_dead())
+        stage.join(30)
+        self.assertEqual(stage.restarts, 1)
+        self.assertEqual(stage.counters.received.value, 2)
+
+    def test_no_restart_after_stop(self):
+        pipeline.RESTART_BACKOFF = 0
+        stage = pipeline.Stage("crash", crash, (), pipeline.CONTEXT.Event())
+        stage.start()
+        stage.join(30)
+        stage.stop.set()
+        self.assertFalse(stage.restart_if_dead())
+        self.assertEqual(stage.restarts, 0)
+
+
+class TestPipelineStop(unittest.TestCase):
+
+    def test_stop_drains_front_to_back(self):
+        count = 3
+        context = pipeline.CONTEXT
+        first, second, results = context.Queue(), context.Queue(), context.Queue()
+
+        # The supervisor without the Wi-Fi stages.
+        supervisor = pipeline.Pipeline.__new__(pipeline.Pipeline)
+        supervisor.tiers = [
+            [pipeline.Stage("produce", produce, (first, count), context.Event())],
+            # Slower than the stages poll their input, so the consumer
+            # would find its queue empty and exit if it was stopped early.
+            [pipeline.Stage("relay", relay, (first, second, pipeline.POLL_TIMEOUT * 1.2), context.Event())],
+            [pipeline.Stage("consume", consume, (second, results), context.Event())],
+        ]
+        supervisor._last_report = time.monotonic()
+        supervisor._last_counts = {}
+
+        supervisor.start()
+        producer = supervisor.tiers[0][0]
+        deadline = time.monotonic() + 30
+        while producer.counters.emitted.value < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        supervisor.stop(timeout=30)
+
+        self.assertFalse(any(stage.alive for stage in supervisor.stages))
+        received = sorted(results.get(timeout=5)[0] for _ in range(count))
+        self.assertEqual(received, list(range(count)))
+
+        counts = {stage.name: stage.counters.snapshot() for stage in supervisor.stages}
+        self.assertEqual(counts["produce"]["emitted"], count)
+        self.assertEqual(counts["relay"]["received"], count)
+        self.assertEqual(counts["relay"]["emitted"], count)
+        self.assertEqual(counts["consume"]["received"], count)
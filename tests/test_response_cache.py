@@ -0,0 +1,83 @@
+import threading
+import time
+import unittest
+
+from airsec.web import cache
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_hit_and_expiry(self):
+        responses = cache.ResponseCache(ttl=0.05)
+        calls = []
+        compute = lambda: calls.append(1) or len(calls)
+
+        self.assertEqual(responses.get("a", compute)[0], 1)
+        value, age = responses.get("a", compute)
+        self.assertEqual(value, 1)
+        self.assertGreaterEqual(age, 0)
+
+        time.sleep(0.06)
+        self.assertEqual(responses.get("a", compute)[0], 2)
+        self.assertEqual((responses.stats.hits, responses.stats.misses), (1, 2))
+
+    def test_single_flight(self):
+        responses = cache.ResponseCache(ttl=10)
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "value"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(responses.get("a", compute)[0]))
+                   for _ in range(5)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["value"] * 5)
+        self.assertEqual(responses.stats.coalesced, 4)
+        self.assertEqual(responses.stats.hit_rate, 0.8)
+
+    def test_errors_are_not_cached(self):
+        responses = cache.ResponseCache(ttl=10)
+
+        def fail():
+            raise RuntimeError("database is down")
+
+        with self.assertRaises(RuntimeError):
+            responses.get("a", fail)
+        self.assertEqual(responses.get("a", lambda: "value")[0], "value")
+
+    def test_invalidate(self):
+        responses = cache.ResponseCache(ttl=10)
+        responses.get("a", lambda: 1)
+        responses.invalidate()
+        self.assertEqual(responses.get("a", lambda: 2)[0], 2)
+
+    def test_invalidate_during_compute(self):
+        responses = cache.ResponseCache(ttl=10)
+
+        def compute():
+            responses.invalidate()
+            return "stale"
+
+        self.assertEqual(responses.get("a", compute)[0], "stale")
+        self.assertEqual(responses.get("a", lambda: "fresh")[0], "fresh")
+
+    def test_max_entries(self):
+        responses = cache.ResponseCache(ttl=10, max_entries=2)
+        for key in "abc":
+            responses.get(key, lambda: key)
+        self.assertEqual(sorted(responses.ages()), ["b", "c"])
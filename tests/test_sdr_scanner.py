@@ -0,0 +1,44 @@
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from airsec import sdr_scanner
+
+SAMPLES = Path(__file__).parent.parent / "Samples"
+
+
+class TestRTLPowerBlockParser(unittest.TestCase):
+
+    def setUp(self):
+        with open(SAMPLES / "airband.csv") as file_:
+            self.lines = file_.readlines()
+
+    def test_matches_line_parser(self):
+        segments = sdr_scanner.parse_rtl_power_block(self.lines)
+        expected = [sdr_scanner.parse_rtl_power_line(l.strip()) for l in self.lines]
+
+        parsed = {}
+        for seg in segments:
+            for dt, power in zip(seg.datetimes(), seg.power.tolist()):
+                parsed[(dt, seg.hz_low)] = dict(zip(seg.frequencies.tolist(), power))
+
+        self.assertEqual(len(parsed), len(expected))
+        for line in expected:
+            self.assertEqual(parsed[(line['datetime'], line['hz_low'])], line['freq'])
+
+    def test_segments_ordered_by_frequency(self):
+        segments = sdr_scanner.parse_rtl_power_block(self.lines)
+        lows = [seg.hz_low for seg in segments]
+        self.assertEqual(lows, sorted(lows))
+        for seg in segments:
+            self.assertEqual(seg.power.shape, (len(seg.timestamps), len(seg.frequencies)))
+
+    def test_frequency_axis_is_cached(self):
+        line = "2021-12-01, 16:14:01, 1000, 1030, 10.00, 100, -1.0, -2.0, -3.0, -4.0"
+        first = sdr_scanner.parse_rtl_power_block([line])[0]
+        second = sdr_scanner.parse_rtl_power_block([line])[0]
+        self.assertIs(first.frequencies, second.frequencies)
+        np.testing.assert_array_equal(first.frequencies, [1000.0, 1010.0, 1020.0, 1030.0])
+        self.assertEqual(first.datetimes(), [datetime(2021, 12, 1, 16, 14, 1)])
@@ -0,0 +1,48 @@
+import unittest
+
+from airsec.web import stream
+
+
+class IdleBroker(stream.StreamBroker):
+    """Broker without the database listener and worker threads."""
+
+    def _ensure_running(self):
+        pass
+
+
+class TestStreamBroker(unittest.TestCase):
+
+    def test_format_event(self):
+        self.assertEqual(stream.format_event("inventory", {"beacons": []}, "1"),
+                         'event: inventory\nid: 1\ndata: {"beacons":[]}\n\n')
+
+    def test_fan_out(self):
+        broker = IdleBroker()
+        first, second = broker.subscribe(), broker.subscribe()
+        broker.publish("event: a\n\n")
+
+        self.assertEqual(first.queue.get_nowait(), "event: a\n\n")
+        self.assertEqual(second.queue.get_nowait(), "event: a\n\n")
+        self.assertEqual(broker.stats.clients, 2)
+
+        broker.unsubscribe(first)
+        self.assertEqual(broker.stats.clients, 1)
+        self.assertTrue(first.closed)
+
+    def test_drops_slow_client(self):
+        broker = IdleBroker(queue_size=1)
+        slow, fast = broker.subscribe(), broker.subscribe()
+        broker.publish("event: a\n\n")
+        fast.queue.get_nowait()
+        broker.publish("event: b\n\n")
+
+        self.assertTrue(slow.closed)
+        self.assertFalse(fast.closed)
+        self.assertEqual(broker.stats.dropped, 1)
+        # Its response ends, the dashboard reloads when it reconnects.
+        self.assertEqual(list(slow.messages(keepalive=0.01)), [])
+
+    def test_keepalive(self):
+        subscriber = stream.Subscriber(1)
+        messages = subscriber.messages(keepalive=0.01)
+        self.assertEqual(next(messages), ": keepalive\n\n")
@@ -0,0 +1,64 @@
+import threading
+import unittest
+
+from airsec import writer
+
+
+class TestBatchWriter(unittest.TestCase):
+
+    def test_flush_on_batch_size(self):
+        batches = []
+        flushed = threading.Event()
+
+        def flush(batch):
+            batches.append(list(batch))
+            flushed.set()
+
+        w = writer.BatchWriter(flush, batch_size=3, flush_interval=60, report_interval=0)
+        w.start()
+        for i in range(3):
+            self.assertTrue(w.put(i))
+
+        self.assertTrue(flushed.wait(5))
+        w.stop()
+        self.assertEqual(batches, [[0, 1, 2]])
+        self.assertEqual(w.stats.batches, 1)
+        self.assertEqual(w.stats.last_batch_size, 3)
+
+    def test_flush_on_interval(self):
+        flushed = threading.Event()
+        w = writer.BatchWriter(lambda b: flushed.set(),
+                               batch_size=100,
+                               flush_interval=0.05,
+                               report_interval=0)
+        w.start()
+        w.put("record")
+        self.assertTrue(flushed.wait(5))
+        w.stop()
+        self.assertEqual(w.stats.rows, 1)
+
+    def test_stop_flushes_pending(self):
+        batches = []
+        w = writer.BatchWriter(batches.append, batch_size=100, flush_interval=60, report_interval=0)
+        w.start()
+        for i in range(5):
+            w.put(i)
+        w.stop()
+        self.assertEqual(sum(len(b) for b in batches), 5)
+
+    def test_drops_when_full(self):
+        w = writer.BatchWriter(lambda b: None, queue_size=1, report_interval=0)
+        self.assertTrue(w.put(1))
+        self.assertFalse(w.put(2))
+        self.assertEqual(w.stats.dropped, 1)
+
+    def test_failed_flush_is_counted(self):
+        def flush(batch):
+            raise RuntimeError("database went away")
+
+        w = writer.BatchWriter(flush, batch_size=1, report_interval=0)
+        w.start()
+        w.put(1)
+        w.stop()
+        self.assertEqual(w.stats.failed_batches, 1)
+        self.assertEqual(w.stats.batches, 0)